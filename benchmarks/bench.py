@@ -0,0 +1,325 @@
+"""
+Benchmark the stages of pgdf on a synthetic repository.
+
+Each stage runs in a fresh Python process, so that its peak RSS and its subprocesses are its own.
+The results are saved as JSON, and two results can be compared.
+
+    $ python benchmarks/bench.py run --size medium -o before.json
+    $ python benchmarks/bench.py run --size medium -o after.json
+    $ python benchmarks/bench.py compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pgdf.blame import FileBlame, CommitRegistry, LineBlame  # noqa: E402
+from pgdf.diff import Diff  # noqa: E402
+from pgdf.git import CommitLogResolver, GitRepository  # noqa: E402
+from pgdf.main import write_report  # noqa: E402
+from pgdf.pipeline import create_blame_function, iter_file_blames, write_file_diff  # noqa: E402
+from pgdf.summary import FileSummary, Summary, set_binary_sizes  # noqa: E402
+from pgdf.writer import OutputFormat, ReportLevel, create_writer  # noqa: E402
+
+import synthetic  # noqa: E402
+
+
+STAGES = {}
+"""The stage functions by their names, in the order that they run."""
+
+
+def stage(function):
+    STAGES[function.__name__] = function
+    return function
+
+
+class StageRun:
+    """The timings and the counts of a stage in the current process."""
+
+    def __init__(self, repository: GitRepository, args: argparse.Namespace):
+        self.repository = repository
+        self.revision_1 = args.revision_1
+        self.revision_2 = args.revision_2
+        self.jobs = args.jobs
+        self.full_history = args.full_history
+        self.format = args.format
+        self.word_diff = args.word_diff
+        self.timings = {}
+        """The seconds of the measured parts of the stage, the setup is not included in the wall time."""
+        self.counts = {}
+        self.subprocesses = Counter()
+        """The git subprocesses started by the stage including its setup, by the git command."""
+        sys.addaudithook(self._audit)
+
+    def _audit(self, event: str, args) -> None:
+        if event == 'subprocess.Popen':
+            command = list(args[1])
+            self.subprocesses[command[1] if len(command) > 1 and command[0] == 'git' else command[0]] += 1
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def file_blames(self, blame: bool = True, word_diff: bool = False) -> tuple:
+        """Return the file diffs with their blames and the registry, blame is False to leave the blames None, word_diff True to set the words."""
+        registry = CommitRegistry(self.repository.get_abbrev_length(self.revision_2)) if blame else None
+        blame_function, _ = create_blame_function(self.repository, None, registry, self.revision_1, self.revision_2, self.full_history)
+        file_blames = iter_file_blames(self.repository, None, registry, blame_function, self.revision_1, self.revision_2, [], self.jobs,
+                                       word_diff)
+        return list(file_blames), registry
+
+
+@stage
+def summary(run: StageRun) -> None:
+    """git diff --numstat, Summary.parse_numstat and the sizes of the binary files."""
+    with run.measure('git'):
+        text = run.repository.get_numstat(run.revision_1, run.revision_2, [])
+    with run.measure('parse'):
+        result = Summary.parse_numstat(text)
+    with run.measure('binary_sizes'):
+        set_binary_sizes(run.repository, run.revision_1, run.revision_2, result.file_summaries)
+    run.counts['files'] = len(result.file_summaries)
+
+
+@stage
+def diff(run: StageRun) -> None:
+    """git diff and Diff.parse, and the summary counted from the file diffs."""
+    with run.measure('git'):
+        lines = run.repository.get_diff(run.revision_1, run.revision_2, []).split('\n')
+    with run.measure('parse'):
+        file_diffs = list(Diff.parse(lines))
+    with run.measure('summary'):
+        result = Summary()
+        for file_diff in file_diffs:
+            result.append(FileSummary.from_file_diff(file_diff))
+        result.totals_line()
+    run.counts['files'] = len(file_diffs)
+    run.counts['lines'] = len(lines)
+
+
+@stage
+def line_blame(run: StageRun) -> None:
+    """LineBlame.parse and FileBlame.parse_porcelain on the blames of the added lines."""
+    with run.measure('setup'):
+        file_diffs = [file_diff for file_diff in Diff.parse(run.repository.iter_diff(run.revision_1, run.revision_2, []))
+                      if file_diff.after_path is not None and file_diff.after_line_ranges()]
+    texts = []
+    porcelain_texts = []
+    with run.measure('git'):
+        for file_diff in file_diffs:
+            ranges = [argument for start, volume in file_diff.after_line_ranges() for argument in ('-L', f'{start},+{volume}')]
+            texts.append(run.repository.run(['blame'] + ranges + [run.revision_2, '--', file_diff.after_path]))
+            porcelain_texts.append(run.repository.get_file_blame(run.revision_2, file_diff.after_path, file_diff.after_line_ranges()))
+    lines = [line for text in texts for line in text.splitlines()]
+    with run.measure('parse'):
+        for line in lines:
+            LineBlame.parse(line)
+    with run.measure('parse_porcelain'):
+        registry = CommitRegistry()
+        for file_diff, text in zip(file_diffs, porcelain_texts):
+            FileBlame.parse_porcelain(file_diff.after_path, text, registry)
+    run.counts['files'] = len(file_diffs)
+    run.counts['lines'] = len(lines)
+
+
+@stage
+def blame(run: StageRun) -> None:
+    """The blames of the removed and the added lines, and the commit logs of the commits between the revisions."""
+    with run.measure('blame'):
+        file_blames, registry = run.file_blames()
+    with run.measure('setup'):
+        commit_hashes = run.repository.run(['rev-list', f'{run.revision_1}...{run.revision_2}']).split()
+    with run.measure('logs'):
+        CommitLogResolver(run.repository).resolve(commit_hashes)
+    run.counts['files'] = len(file_blames)
+    run.counts['blamed_commits'] = len(registry)
+    run.counts['logs'] = len(commit_hashes)
+
+
+@stage
+def write(run: StageRun) -> None:
+    """Writing the diff and the summary of the blamed file diffs in the output format."""
+    with run.measure('setup'):
+        file_blames, registry = run.file_blames(word_diff=run.word_diff)
+    with tempfile.TemporaryDirectory() as directory:
+        with run.measure('write'):
+            writer = create_writer(OutputFormat(run.format), os.path.join(directory, 'report'), 'Benchmark')
+            result = Summary()
+            rows = 0
+            for file_diff, revision_1_blame, revision_2_blame in file_blames:
+                result.append(FileSummary.from_file_diff(file_diff))
+                write_file_diff(writer, file_diff, revision_1_blame, revision_2_blame, registry.commits)
+                rows += 1 + sum(1 + len(hunk.lines) for hunk in file_diff.hunks)
+            for file_summary in result.file_summaries:
+                plus, minus = result.graph(file_summary)
+                writer.write_file_summary(file_summary.file_path, file_summary.change_count, plus, minus)
+            writer.write_summary_text(result.totals_line())
+        with run.measure('close'):
+            output_file_paths = writer.close()
+        run.counts['rows'] = rows
+        run.counts['bytes'] = sum(os.path.getsize(path) for path in output_file_paths)
+
+
+@stage
+def report(run: StageRun) -> None:
+    """The whole report, as the command generates it without the cache."""
+    with tempfile.TemporaryDirectory() as directory:
+        with run.measure('report'):
+            writer = create_writer(OutputFormat(run.format), os.path.join(directory, 'report'), 'Benchmark')
+            write_report(run.repository, writer, run.revision_1, run.revision_2, [], run.jobs, None, run.full_history, ReportLevel.BLAME,
+                         word_diff=run.word_diff)
+
+
+def run_stage(args: argparse.Namespace) -> None:
+    """Run a stage in this process and print its result as JSON."""
+    with GitRepository(args.repository) as repository:
+        run = StageRun(repository, args)
+        STAGES[args.stage](run)
+    # the cat-file workers have been waited for, so they are counted in the children
+    print(json.dumps({
+        'wall': sum(seconds for name, seconds in run.timings.items() if name != 'setup'),
+        'timings': run.timings,
+        'counts': run.counts,
+        'subprocesses': dict(run.subprocesses),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }))
+
+
+def describe() -> dict:
+    """The environment of the benchmark, to tell the results of different machines and versions apart."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    version = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    git_version = subprocess.run(['git', '--version'], stdout=subprocess.PIPE)
+    return {
+        'pgdf': version.stdout.decode().strip(),
+        'git': git_version.stdout.decode().strip(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    parameters = {key: getattr(args, key) for key in ('files', 'lines', 'depth', 'commits', 'diverge', 'touched', 'hunks', 'binary', 'renames', 'seed')}
+    repository_path = args.repository or os.path.join(tempfile.gettempdir(), f'pgdf-benchmark-{args.size}')
+    print(f'Generating {repository_path} ...', file=sys.stderr)
+    try:
+        parameters = synthetic.generate(repository_path, args.size, **parameters)
+    except FileExistsError as e:
+        sys.exit(f'error: {e}')
+
+    results = {}
+    for name in args.stages or list(STAGES):
+        runs = []
+        for _ in range(args.repeat):
+            command = [sys.executable, os.path.abspath(__file__), 'stage', name, '--repository', repository_path,
+                       '--revision-1', args.revision_1, '--revision-2', args.revision_2, '--jobs', str(args.jobs), '--format', args.format]
+            if args.full_history:
+                command.append('--full-history')
+            if args.word_diff:
+                command.append('--word-diff')
+            completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+            runs.append(json.loads(completed.stdout))
+        results[name] = {
+            'wall': statistics.median(r['wall'] for r in runs),
+            'wall_min': min(r['wall'] for r in runs),
+            'timings': {key: statistics.median(r['timings'][key] for r in runs) for key in runs[0]['timings']},
+            'counts': runs[0]['counts'],
+            'subprocesses': runs[0]['subprocesses'],
+            'peak_rss_kb': max(r['peak_rss_kb'] for r in runs),
+            'children_peak_rss_kb': max(r['children_peak_rss_kb'] for r in runs),
+        }
+        print(format_row(name, results[name]), file=sys.stderr)
+
+    document = {
+        'environment': describe(),
+        'repository': parameters,
+        'options': {'jobs': args.jobs, 'full_history': args.full_history, 'format': args.format, 'word_diff': args.word_diff,
+                    'repeat': args.repeat},
+        'stages': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    print(f'{args.output} was generated.', file=sys.stderr)
+
+
+def format_row(name: str, result: dict) -> str:
+    parts = ' '.join(f'{key}={seconds:.3f}' for key, seconds in result['timings'].items())
+    return (f'{name:<12} {result["wall"]:8.3f}s  rss {result["peak_rss_kb"] // 1024:5d} MB  '
+            f'git {sum(result["subprocesses"].values()):5d}  {parts}')
+
+
+def compare(args: argparse.Namespace) -> None:
+    """Print the wall times of the stages of two results and their ratios."""
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    options = ('jobs', 'full_history', 'format', 'word_diff')
+    if before['repository'] != after['repository'] or any(before['options'].get(key) != after['options'].get(key) for key in options):
+        print('The results were measured on different repositories or with different options.')
+    print(f'{"stage":<12} {"before":>9} {"after":>9} {"ratio":>7} {"rss before":>11} {"rss after":>10}')
+    for name, result in after['stages'].items():
+        if name not in before['stages']:
+            continue
+        old = before['stages'][name]
+        ratio = result['wall'] / old['wall'] if old['wall'] else float('nan')
+        print(f'{name:<12} {old["wall"]:8.3f}s {result["wall"]:8.3f}s {ratio:6.2f}x '
+              f'{old["peak_rss_kb"] // 1024:8d} MB {result["peak_rss_kb"] // 1024:7d} MB')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the stages of pgdf on a synthetic repository.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the stages and save the results as JSON')
+    run_parser.add_argument('--repository', help='The directory of the synthetic repository (default: pgdf-benchmark-<size> in the temporary directory)')
+    synthetic.add_arguments(run_parser)
+    run_parser.add_argument('--stages', nargs='+', choices=list(STAGES), help='The stages to run (default: all)')
+    run_parser.add_argument('--repeat', type=int, default=3, help='The runs of each stage, the median is reported (default: %(default)s)')
+    run_parser.add_argument('-o', '--output', default='benchmark.json', help='The result file (default: %(default)s)')
+
+    stage_parser = subparsers.add_parser('stage', help='Run a stage in this process and print the result as JSON')
+    stage_parser.add_argument('stage', choices=list(STAGES))
+    stage_parser.add_argument('--repository', required=True)
+
+    for subparser in (run_parser, stage_parser):
+        subparser.add_argument('--revision-1', default='main', help='The first revision (default: %(default)s)')
+        subparser.add_argument('--revision-2', default='feature', help='The second revision (default: %(default)s)')
+        subparser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='The number of files blamed at once')
+        subparser.add_argument('--full-history', action='store_true', help='Blame through the whole history')
+        subparser.add_argument('-f', '--format', choices=[output_format.value for output_format in OutputFormat],
+                               default=OutputFormat.EXCEL.value, help='The output format of the write and report stages')
+        subparser.add_argument('--word-diff', action='store_true', help='Set the changed words of the lines from git diff --word-diff=porcelain in the write and report stages')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two results')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'stage':
+        run_stage(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
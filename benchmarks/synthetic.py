@@ -0,0 +1,213 @@
+"""
+Generate deterministic git repositories for the benchmarks.
+
+The repository has a main branch with a history of --depth commits, a feature branch of --commits commits
+that starts --diverge commits before the tip of main, binary files and renames.
+The same parameters and seed always produce the same commit hashes, so the results of different runs can be compared.
+
+    $ python benchmarks/synthetic.py /tmp/pgdf-bench --files 500 --commits 50
+    $ pgdf main feature
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+
+
+SIZES = {
+    'small': dict(files=50, lines=200, depth=20, commits=10, diverge=3, touched=10, hunks=2, binary=2, renames=2),
+    'medium': dict(files=500, lines=300, depth=100, commits=50, diverge=10, touched=40, hunks=3, binary=10, renames=10),
+    'large': dict(files=3000, lines=500, depth=300, commits=200, diverge=30, touched=100, hunks=4, binary=30, renames=50),
+}
+"""The parameters of the preset sizes."""
+
+EPOCH = 1700000000
+"""The author date of the first commit, each commit is an hour later than its parent."""
+
+WORDS = ('alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta', 'iota', 'kappa', 'lambda', 'mu')
+
+
+class SyntheticRepository:
+    """The files of the synthetic repository, written as a git fast-import stream."""
+
+    def __init__(self, files: int, lines: int, depth: int, commits: int, diverge: int, touched: int, hunks: int,
+                 binary: int, renames: int, seed: int = 0):
+        """
+
+        :param files: the number of the text files
+        :param lines: the number of the lines of a text file
+        :param depth: the number of the commits of the main branch
+        :param commits: the number of the commits of the feature branch
+        :param diverge: the number of the commits of main after the feature branch starts
+        :param touched: the number of the files changed by a commit
+        :param hunks: the number of the hunks of a changed file
+        :param binary: the number of the binary files
+        :param renames: the number of the files renamed on the feature branch
+        :param seed:
+        """
+        self.parameters = dict(files=files, lines=lines, depth=depth, commits=commits, diverge=diverge, touched=touched,
+                               hunks=hunks, binary=binary, renames=renames, seed=seed)
+        self.random = random.Random(seed)
+        self.commit_count = 0
+        self.mark_count = 0
+        self.chunks = []
+        self.files = {}
+        for i in range(files):
+            path = f'src/module_{i % 20:02d}/file_{i:05d}.txt'
+            self.files[path] = [self._line(i, j) for j in range(lines)]
+        self.binary_files = {f'assets/image_{i:03d}.bin': self.random.randbytes(4096) for i in range(binary)}
+
+    def _line(self, file_number: int, line_number: int) -> str:
+        return f'{file_number} {line_number} {" ".join(self.random.choices(WORDS, k=6))}'
+
+    def _data(self, data: bytes) -> None:
+        self.chunks.append(b'data %d\n' % len(data))
+        self.chunks.append(data)
+        self.chunks.append(b'\n')
+
+    def _commit(self, branch: str, parent: int, changes: list) -> int:
+        """
+        Add a commit of the changes.
+
+        :param parent: the mark of the parent commit, None for the root commit
+        :param changes: the fast-import file commands and the data of the inline ones
+        :return: the mark of the commit
+        """
+        self.mark_count += 1
+        mark = self.mark_count
+        self.commit_count += 1
+        author = f'Developer {self.commit_count % 7} <developer{self.commit_count % 7}@example.com>'
+        date = f'{EPOCH + self.commit_count * 3600} +0900'
+        self.chunks.append(f'commit refs/heads/{branch}\nmark :{mark}\nauthor {author} {date}\ncommitter {author} {date}\n'.encode())
+        self._data(f'Change {self.commit_count} of {branch}'.encode())
+        if parent is not None:
+            self.chunks.append(f'from :{parent}\n'.encode())
+        for command, data in changes:
+            self.chunks.append(command.encode() + b'\n')
+            if data is not None:
+                self._data(data)
+        self.chunks.append(b'\n')
+        return mark
+
+    def _modify_text(self, path: str):
+        lines = self.files[path]
+        hunks = self.parameters['hunks']
+        for start in sorted(self.random.sample(range(len(lines)), min(hunks, len(lines))), reverse=True):
+            volume = self.random.randint(1, 3)
+            action = self.random.random()
+            new_lines = [self._line(-1, start + k) for k in range(self.random.randint(1, 3))]
+            if action < 0.6:
+                lines[start:start + volume] = new_lines
+            elif action < 0.8:
+                lines[start:start] = new_lines
+            elif len(lines) > volume:
+                del lines[start:start + volume]
+        return f'M 100644 inline {path}', ('\n'.join(lines) + '\n').encode()
+
+    def _modify_binary(self, path: str):
+        data = bytearray(self.binary_files[path])
+        for _ in range(16):
+            data[self.random.randrange(len(data))] = self.random.randrange(256)
+        self.binary_files[path] = bytes(data)
+        return f'M 100644 inline {path}', self.binary_files[path]
+
+    def _changes(self, binary: bool):
+        paths = self.random.sample(sorted(self.files), min(self.parameters['touched'], len(self.files)))
+        changes = [self._modify_text(path) for path in sorted(paths)]
+        if binary and self.binary_files:
+            changes.append(self._modify_binary(self.random.choice(sorted(self.binary_files))))
+        return changes
+
+    def build(self) -> bytes:
+        """Return the fast-import stream of the whole repository."""
+        p = self.parameters
+        changes = [(f'M 100644 inline {path}', ('\n'.join(lines) + '\n').encode()) for path, lines in self.files.items()]
+        changes += [(f'M 100644 inline {path}', data) for path, data in self.binary_files.items()]
+        main = self._commit('main', None, changes)
+        fork_depth = max(1, p['depth'] - p['diverge'])
+        for _ in range(1, fork_depth):
+            main = self._commit('main', main, self._changes(binary=False))
+
+        # the feature branch and the rest of main change the files independently
+        files, binary_files, state = dict((path, list(lines)) for path, lines in self.files.items()), dict(self.binary_files), self.random.getstate()
+        feature = main
+        renamed = self.random.sample(sorted(self.files), min(p['renames'], len(self.files)))
+        for i in range(p['commits']):
+            commit_changes = self._changes(binary=i % 3 == 0)
+            for path in renamed[i::p['commits']]:
+                new_path = path.replace('.txt', '_renamed.txt')
+                self.files[new_path] = self.files.pop(path)
+                commit_changes.append((f'R {path} {new_path}', None))
+            feature = self._commit('feature', feature, commit_changes)
+
+        self.files, self.binary_files = files, binary_files
+        self.random.setstate(state)
+        self.random.random()
+        for _ in range(fork_depth, p['depth']):
+            main = self._commit('main', main, self._changes(binary=True))
+        self.chunks.append(b'done\n')
+        return b''.join(self.chunks)
+
+
+def generate(path: str, size: str = 'small', force: bool = False, **parameters) -> dict:
+    """
+    Generate the repository, unless the repository of the same parameters is already there.
+
+    Only a directory that the generator created itself, which has its marker file, is replaced,
+    so an existing repository passed by mistake is never deleted.
+
+    :param path: the directory of the repository, that must not exist, be empty or be a generated repository
+    :param size: the preset size, the parameters override it
+    :param force: True to generate the repository again
+    :return: the parameters of the repository
+    :raise FileExistsError: when the path is a file or a directory that the generator did not create
+    """
+    values = dict(SIZES[size], seed=0)
+    values.update({key: value for key, value in parameters.items() if value is not None})
+    marker_path = os.path.join(path, '.git', 'pgdf-benchmark.json')
+    if not force and os.path.exists(marker_path):
+        with open(marker_path, encoding='utf-8') as f:
+            if json.load(f) == values:
+                return values
+    if os.path.exists(marker_path):
+        shutil.rmtree(path)
+    elif os.path.exists(path) and (not os.path.isdir(path) or os.listdir(path)):
+        raise FileExistsError(f'{path} exists and is not a repository generated for the benchmarks, it is left as it is.')
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(['git', 'init', '-q', '-b', 'main', path], check=True)
+    # the marker is written first, so that a repository whose generation was interrupted can be replaced
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+    stream = SyntheticRepository(**values).build()
+    subprocess.run(['git', 'fast-import', '--quiet', '--done'], cwd=path, input=stream, check=True)
+    subprocess.run(['git', 'checkout', '-q', 'main'], cwd=path, check=True)
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump(values, f)
+    return values
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='The preset size of the repository (default: %(default)s)')
+    for name, help_text in (('files', 'text files'), ('lines', 'lines of a text file'), ('depth', 'commits of main'),
+                            ('commits', 'commits of the feature branch'), ('diverge', 'commits of main after the feature branch starts'),
+                            ('touched', 'files changed by a commit'), ('hunks', 'hunks of a changed file'),
+                            ('binary', 'binary files'), ('renames', 'files renamed on the feature branch'), ('seed', 'seed of the contents')):
+        parser.add_argument(f'--{name}', type=int, help=f'The number of the {help_text}' if name != 'seed' else 'The seed of the contents')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate a deterministic git repository with main and feature branches.')
+    parser.add_argument('path', help='The directory of the repository, it is replaced if it was generated before')
+    add_arguments(parser)
+    args = parser.parse_args()
+    parameters = {key: getattr(args, key) for key in ('files', 'lines', 'depth', 'commits', 'diverge', 'touched', 'hunks', 'binary', 'renames', 'seed')}
+    try:
+        print(json.dumps(generate(args.path, args.size, force=True, **parameters)))
+    except FileExistsError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
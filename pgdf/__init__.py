@@ -0,0 +1,26 @@
+import importlib
+
+_EXPORTS = {
+    'DiffRow': 'pgdf.api',
+    'Report': 'pgdf.api',
+    'report': 'pgdf.api',
+    'Cache': 'pgdf.cache',
+    'GitError': 'pgdf.git',
+    'GitRepository': 'pgdf.git',
+}
+"""The modules of the names of the Python API, imported on first use so that the command loads only the modules it needs."""
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,176 @@
+import os
+
+from pgdf.blame import CommitRecord, CommitRegistry
+from pgdf.cache import BlameCache
+from pgdf.diff import DiffLine, FileDiff, Hunk
+from pgdf.git import GitRepository
+from pgdf.pipeline import create_blame_function, iter_file_blames
+from pgdf.summary import Summary, set_binary_sizes
+
+
+class DiffRow:
+    """A line of the diff with the commit that it is blamed on, as a row of the Diff sheet."""
+
+    __slots__ = ('file_diff', 'hunk', 'diff_line', 'commit')
+
+    def __init__(self, file_diff: FileDiff, hunk: Hunk, diff_line: DiffLine, commit: CommitRecord = None):
+        self.file_diff = file_diff
+        self.hunk = hunk
+        self.diff_line = diff_line
+        self.commit = commit
+        """The commit that an added or a removed line is blamed on, None for the other lines or when the lines are not blamed."""
+
+    @property
+    def file_path(self) -> str:
+        return self.file_diff.file_path
+
+    @property
+    def kind(self) -> str:
+        return self.diff_line.kind
+
+    @property
+    def before_line_number(self) -> int:
+        return self.diff_line.before_line_number
+
+    @property
+    def after_line_number(self) -> int:
+        return self.diff_line.after_line_number
+
+    @property
+    def code(self) -> str:
+        """The line without the leading character of git diff."""
+        return self.diff_line.line[1:]
+
+    @property
+    def changed_words(self) -> list[str]:
+        """The changed parts of a removed or an added line of a report with word_diff, empty when the line is not diffed word by word."""
+        line = self.diff_line.line
+        return [line[start:end] for start, end in self.diff_line.words or ()]
+
+
+class Report:
+    """
+    The report of two revisions, read lazily from the repository.
+
+    Nothing is read from git until the rows are iterated, and the rows are produced while git diff is running,
+    so a large report can be streamed into any sink without being held in memory.
+    The rows can be iterated again, each iteration reads git again.
+    """
+
+    def __init__(self, repository: GitRepository, revision_1: str, revision_2: str, paths: list[str] = None,
+                 blame: bool = True, full_history: bool = False, jobs: int = None, cache: BlameCache = None,
+                 owns_repository: bool = False, word_diff: bool = False):
+        """
+
+        :param repository:
+        :param revision_1: the full commit hash of the first revision
+        :param revision_2: the full commit hash of the second revision
+        :param paths: the paths to be compared, all the files if it is None
+        :param blame: False not to blame the lines, the commits of the diff rows are None then
+        :param full_history: True to blame through the whole history, instead of stopping at the merge base of the revisions
+        :param jobs: the number of files blamed at once, the number of CPUs if it is None
+        :param cache: the cache of the blames and the commit logs, None not to use a cache
+        :param owns_repository: True to close the repository when the report is closed
+        :param word_diff: True to read the changed words of the diff rows from git diff --word-diff=porcelain
+        """
+        self.repository = repository
+        self.revision_1 = revision_1
+        self.revision_2 = revision_2
+        self.paths = list(paths or [])
+        self.blame = blame
+        self.full_history = full_history
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache = cache
+        self.owns_repository = owns_repository
+        self.word_diff = word_diff
+
+    def __enter__(self) -> 'Report':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.owns_repository:
+            self.repository.close()
+
+    def summary(self) -> Summary:
+        """Read the summary from git diff --numstat, with the sizes of the binary files."""
+        summary = Summary.parse_numstat(self.repository.get_numstat(self.revision_1, self.revision_2, self.paths))
+        set_binary_sizes(self.repository, self.revision_1, self.revision_2, summary.file_summaries)
+        return summary
+
+    def summary_rows(self):
+        """
+        Yield the rows of the Summary.
+
+        :return: the file summaries in the order of git diff
+        """
+        yield from self.summary().file_summaries
+
+    def file_diffs(self):
+        """
+        Yield the file diffs with their blames, the files are blamed in parallel ahead of the one being yielded.
+
+        :return: tuples of the file diff, the blame at revision_1 and the blame at revision_2, the blames are None when not blamed,
+                 and the registry of the commits that the blames refer to.
+        """
+        registry = CommitRegistry(self.repository.get_abbrev_length(self.revision_2)) if self.blame else None
+        blame_function, _ = create_blame_function(
+            self.repository, self.cache, registry, self.revision_1, self.revision_2, self.full_history
+        )
+        file_blames = iter_file_blames(
+            self.repository, None, registry, blame_function, self.revision_1, self.revision_2, self.paths, self.jobs, self.word_diff
+        )
+        for file_diff, revision_1_blame, revision_2_blame in file_blames:
+            yield file_diff, revision_1_blame, revision_2_blame, registry
+
+    def diff_rows(self):
+        """
+        Yield the lines of the diff with the commits that the added and the removed lines are blamed on.
+
+        :return: the diff rows in the order of git diff
+        """
+        for file_diff, revision_1_blame, revision_2_blame, registry in self.file_diffs():
+            for hunk in file_diff.hunks:
+                for diff_line in hunk.lines:
+                    commit = None
+                    if registry is not None:
+                        if diff_line.kind == '+':
+                            commit = registry[revision_2_blame.commit_index(diff_line.after_line_number)]
+                        elif diff_line.kind == '-':
+                            commit = registry[revision_1_blame.commit_index(diff_line.before_line_number)]
+                    yield DiffRow(file_diff, hunk, diff_line, commit)
+
+
+def report(repository, revision_1: str, revision_2: str, paths: list[str] = None, blame: bool = True, full_history: bool = False,
+           jobs: int = None, cache: BlameCache = None, word_diff: bool = False) -> Report:
+    """
+    Create the report of two revisions, whose summary rows and diff rows are read lazily.
+
+    A GitRepository can be given to reuse its git cat-file workers for many reports,
+    a path opens a repository that is closed with the report.
+    The revisions are resolved here, so an unknown revision raises GitError before any row is read.
+
+    :param repository: a GitRepository or the path of the repository directory
+    :param revision_1: the first branch, tag name or revision to be compared
+    :param revision_2: the second branch, tag name or revision to be compared
+    :param paths: the paths to be compared, all the files if it is None
+    :param blame: False not to blame the lines
+    :param full_history: True to blame through the whole history, instead of stopping at the merge base of the revisions
+    :param jobs: the number of files blamed at once, the number of CPUs if it is None
+    :param cache: the cache of the blames and the commit logs, None not to use a cache
+    :param word_diff: True to read the changed words of the diff rows from git diff --word-diff=porcelain
+    :return:
+    """
+    owns_repository = not isinstance(repository, GitRepository)
+    if owns_repository:
+        repository = GitRepository(os.fspath(repository))
+    try:
+        commit_hash_1 = repository.resolve_commit(revision_1)
+        commit_hash_2 = repository.resolve_commit(revision_2)
+    except BaseException:
+        if owns_repository:
+            repository.close()
+        raise
+    return Report(repository, commit_hash_1, commit_hash_2, paths, blame, full_history, jobs, cache, owns_repository, word_diff)
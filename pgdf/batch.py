@@ -0,0 +1,162 @@
+import argparse
+import os
+import shlex
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+from pgdf import profiler
+from pgdf.git import GitError, GitRepository
+from pgdf.main import generate_report, open_cache
+
+
+class BatchReport:
+    """A report of a batch file."""
+
+    def __init__(self, revision_1: str, revision_2: str, paths: list[str], output_file_path: str = None):
+        self.revision_1 = revision_1
+        self.revision_2 = revision_2
+        self.paths = paths
+        self.output_file_path = output_file_path
+        """The output file path without the extension, None for the default path."""
+
+    @staticmethod
+    def parse(line: str):
+        """
+        Parse a line of a batch file, None for a blank line or a comment.
+
+        >>> report = BatchReport.parse('origin/main feature/something "dir/a b" -o reports/something  # nightly')
+        >>> (report.revision_1, report.revision_2, report.paths, report.output_file_path)
+        ('origin/main', 'feature/something', ['dir/a b'], 'reports/something')
+        >>> BatchReport.parse('# comment') is None
+        True
+        >>> BatchReport.parse('origin/main feature/something --word-diff')
+        Traceback (most recent call last):
+          ...
+        ValueError: Unknown option --word-diff: origin/main feature/something --word-diff
+
+        :param line: 'revision_1 revision_2 [path ...] [-o output]', quoted like a shell command line
+        :return:
+        """
+        tokens = shlex.split(line, comments=True)
+        if not tokens:
+            return None
+        arguments = []
+        output_file_path = None
+        i = 0
+        while i < len(tokens):
+            if tokens[i] in ('-o', '--output'):
+                if i + 1 == len(tokens):
+                    raise ValueError(f'{tokens[i]} needs the output file path: {line}')
+                output_file_path = tokens[i + 1]
+                i += 2
+                continue
+            if tokens[i].startswith('-'):
+                raise ValueError(f'Unknown option {tokens[i]}: {line}')
+            arguments.append(tokens[i])
+            i += 1
+        if len(arguments) < 2:
+            raise ValueError(f'A report needs two revisions: {line}')
+        return BatchReport(arguments[0], arguments[1], arguments[2:], output_file_path)
+
+    @staticmethod
+    def parse_file(path: str) -> list['BatchReport']:
+        reports = []
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    report = BatchReport.parse(line)
+                except ValueError as e:
+                    raise ValueError(f'{path}:{line_number}: {e}')
+                if report is not None:
+                    reports.append(report)
+        return reports
+
+
+_worker_state = None
+"""The repository and the cache of a worker process, shared by all the reports that the process generates."""
+
+
+def _init_worker(args: argparse.Namespace) -> None:
+    """
+    Open the repository and the cache of a worker process, which are closed when the process exits.
+
+    A finalizer of multiprocessing is used instead of atexit, because a forked worker process exits without the atexit handlers.
+    """
+    global _worker_state
+    if args.profile or args.trace:
+        profiler.enable()
+    _worker_state = (GitRepository(object_store=not args.no_object_store), open_cache(args))
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker() -> None:
+    global _worker_state
+    if _worker_state is None:
+        return
+    repository, cache = _worker_state
+    _worker_state = None
+    repository.close()
+    if cache is not None:
+        cache.close()
+
+
+def _generate(args: argparse.Namespace, jobs: int, report: BatchReport):
+    """
+    Generate a report in a worker process.
+
+    :return: the paths of the written files and None, or None and the error message,
+             and the profile of the report to be merged in the main process, None when profiling is disabled.
+    """
+    repository, cache = _worker_state
+    try:
+        output_file_paths = generate_report(
+            repository, cache, args, report.revision_1, report.revision_2, report.paths, report.output_file_path, jobs
+        )
+        result = output_file_paths, None
+    except GitError as e:
+        result = None, (e.stderr or str(e)).strip()
+    current_profiler = profiler.get_profiler()
+    return result + (current_profiler.take() if current_profiler is not None else None,)
+
+
+def run_batch(args: argparse.Namespace, reports: list[BatchReport], processes: int) -> int:
+    """
+    Generate the reports with the options of the command line arguments.
+
+    The reports are spread over the worker processes, and each process keeps its git cat-file workers and its cache connection
+    for all of its reports, while the blames and the commit logs in the cache are shared by all the processes.
+
+    :param processes: the number of reports generated at once
+    :return: the number of the reports that failed
+    """
+    processes = min(processes, len(reports)) or 1
+    jobs = max(1, (os.cpu_count() or 1) // processes)
+    failed_count = 0
+    if processes == 1:
+        _init_worker(args)
+        results = (_generate(args, jobs, report) for report in reports)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(args,))
+        results = executor.map(_generate, [args] * len(reports), [jobs] * len(reports), reports)
+    try:
+        for report, (output_file_paths, error, profile) in zip(reports, results):
+            if profile is not None:
+                profiler.get_profiler().merge(profile)
+            if error is not None:
+                failed_count += 1
+                print(f'{report.revision_1} {report.revision_2} failed: {error}')
+                continue
+            for output_file_path in output_file_paths:
+                print(f'{output_file_path} was generated.')
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        else:
+            _close_worker()
+    return failed_count
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
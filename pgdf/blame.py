@@ -1,10 +1,260 @@
 import re
+import threading
+from array import array
+from bisect import bisect_left
+from functools import cached_property
+
+from pgdf.log import format_datetime
+
+
+PORCELAIN_HEADER_PATTERN = re.compile(r'^(?P<commit_hash>[0-9a-f]{40}) (?P<original_line_number>\d+) (?P<line_number>\d+)(?: (?P<group_size>\d+))?$')
+
+
+class CommitBlame:
+    """Commit metadata that appears once per commit in the porcelain blame output."""
+
+    def __init__(self, commit_hash):
+        self.commit_hash = commit_hash
+        self.author = ''
+        self.author_time = 0
+        self.author_tz = '+0000'
+        self.summary = ''
+        self.boundary = False
+
+    def short_hash(self, abbrev: int = 7) -> str:
+        """
+        Abbreviate the commit hash like git blame does, with '^' for boundary commits.
+
+        >>> commit = CommitBlame('0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192')
+        >>> commit.short_hash()
+        '0e2b5b3c'
+        >>> commit.boundary = True
+        >>> commit.short_hash()
+        '^0e2b5b3'
+        """
+        if self.boundary:
+            return '^' + self.commit_hash[:abbrev]
+        return self.commit_hash[:abbrev + 1]
+
+    @cached_property
+    def datetime(self) -> str:
+        return format_datetime(self.author_time, self.author_tz)
+
+
+class CommitRecord:
+    """The metadata of a blamed commit as it is shown in the report, stored once in the CommitRegistry."""
+
+    __slots__ = ('index', 'commit_hash', 'short_hash', 'author', 'datetime', 'subject')
+
+    def __init__(self, index: int, commit_hash: str, short_hash: str, author: str, datetime: str, subject: str):
+        self.index = index
+        self.commit_hash = commit_hash
+        self.short_hash = short_hash
+        """The abbreviated hash, with '^' for a boundary commit."""
+        self.author = author
+        self.datetime = datetime
+        self.subject = subject
+        """The subject of the commit, empty for a boundary commit that is not part of the compared history."""
+
+
+class CommitRegistry:
+    """
+    Report-wide registry of the blamed commits.
+
+    Each commit is stored once as a CommitRecord, and the blames refer to it by its index,
+    so the lines do not repeat the hash, the author and the datetime of their commit.
+    The commits can be registered from several threads at once.
+    """
+
+    def __init__(self, abbrev: int = 7):
+        self.abbrev = abbrev
+        self.commits = []
+        """The CommitRecord objects in the order of their indexes."""
+        self.indexes = {}
+        """The indexes of the commits by the full commit hash."""
+        self._lock = threading.Lock()
+
+    def register(self, commit: CommitBlame) -> int:
+        """
+        Register a commit read from git blame, unless it is already registered.
+
+        >>> registry = CommitRegistry()
+        >>> commit = CommitBlame('0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192')
+        >>> commit.summary = 'Initial commit'
+        >>> registry.register(commit), registry.register(CommitBlame(commit.commit_hash))
+        (0, 0)
+        >>> (registry[0].short_hash, registry[0].subject)
+        ('0e2b5b3c', 'Initial commit')
+
+        :param commit:
+        :return: the index of the commit
+        """
+        index = self.indexes.get(commit.commit_hash)
+        if index is not None:
+            return index
+        with self._lock:
+            index = self.indexes.get(commit.commit_hash)
+            if index is None:
+                index = len(self.commits)
+                self.commits.append(CommitRecord(
+                    index, commit.commit_hash, commit.short_hash(self.abbrev), commit.author, commit.datetime,
+                    '' if commit.boundary else commit.summary
+                ))
+                self.indexes[commit.commit_hash] = index
+            return index
+
+    def __getitem__(self, index: int) -> CommitRecord:
+        return self.commits[index]
+
+    def __len__(self) -> int:
+        return len(self.commits)
 
 
 class FileBlame:
+    """
+    The blamed lines of a file, as the line numbers and the indexes of their commits in the CommitRegistry.
+
+    The line numbers are kept in ascending order in arrays, so a line costs a few bytes however long the report is.
+    """
+
+    __slots__ = ('path', 'line_numbers', 'commit_indexes')
+
     def __init__(self, path):
         self.path = path
-        self.lines = {}
+        self.line_numbers = array('l')
+        self.commit_indexes = array('l')
+
+    def add(self, line_number: int, commit_index: int) -> None:
+        self.line_numbers.append(line_number)
+        self.commit_indexes.append(commit_index)
+
+    def commit_index(self, line_number: int) -> int:
+        """Return the index of the commit of the line in the CommitRegistry."""
+        i = bisect_left(self.line_numbers, line_number)
+        if i == len(self.line_numbers) or self.line_numbers[i] != line_number:
+            raise KeyError(line_number)
+        return self.commit_indexes[i]
+
+    def __len__(self) -> int:
+        return len(self.line_numbers)
+
+    def _sort(self) -> None:
+        if any(a >= b for a, b in zip(self.line_numbers, self.line_numbers[1:])):
+            pairs = sorted(zip(self.line_numbers, self.commit_indexes))
+            self.line_numbers = array('l', (line_number for line_number, _ in pairs))
+            self.commit_indexes = array('l', (commit_index for _, commit_index in pairs))
+
+    @staticmethod
+    def parse_porcelain(path, text, registry: CommitRegistry) -> 'FileBlame':
+        """
+        Parse the output of git blame --porcelain, which can cover several line ranges of a file.
+
+        The commit metadata follows the header line only the first time a commit appears,
+        so it is read once per commit and registered in the registry.
+
+        >>> text = '\\n'.join([
+        ...     '0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192 1 1 2',
+        ...     'author Kenji Otsuka',
+        ...     'author-mail <kenji@example.com>',
+        ...     'author-time 1572876240',
+        ...     'author-tz +0900',
+        ...     'summary Initial commit',
+        ...     'boundary',
+        ...     'filename pgdf/main.py',
+        ...     '\\timport re',
+        ...     '0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192 2 2',
+        ...     '\\timport xlsxwriter',
+        ...     '8e30324f6a8c0b1d2e3f405162738495a6b7c8d9 5 9 1',
+        ...     'author kenjiotsuka',
+        ...     'author-mail <kenji@example.com>',
+        ...     'author-time 1641535480',
+        ...     'author-tz +0900',
+        ...     'summary Add blame',
+        ...     'previous 0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192 pgdf/main.py',
+        ...     'filename pgdf/main.py',
+        ...     '\\t// アクセストークン取得',
+        ... ])
+        >>> registry = CommitRegistry()
+        >>> file_blame = FileBlame.parse_porcelain('pgdf/main.py', text, registry)
+        >>> list(file_blame.line_numbers)
+        [1, 2, 9]
+        >>> [(c.short_hash, c.author, c.datetime, c.subject) for c in (registry[file_blame.commit_index(n)] for n in (1, 2, 9))]  # doctest: +NORMALIZE_WHITESPACE
+        [('^0e2b5b3', 'Kenji Otsuka', '2019-11-04 23:04:00 +0900', ''),
+         ('^0e2b5b3', 'Kenji Otsuka', '2019-11-04 23:04:00 +0900', ''),
+         ('8e30324f', 'kenjiotsuka', '2022-01-07 15:04:40 +0900', 'Add blame')]
+
+        The line ranges can be blamed out of order, and the lines are sorted by their line numbers.
+
+        >>> text = '\\n'.join(['8e30324f6a8c0b1d2e3f405162738495a6b7c8d9 7 7 1', 'filename a.txt', '\\tx',
+        ...                   '8e30324f6a8c0b1d2e3f405162738495a6b7c8d9 3 3 1', '\\ty'])
+        >>> list(FileBlame.parse_porcelain('a.txt', text, registry).line_numbers)
+        [3, 7]
+
+        :param path: the blamed file path
+        :param text: the output of git blame --porcelain
+        :param registry: the registry of the commits of the report
+        :return:
+        """
+        file_blame = FileBlame(path)
+        commit_indexes = {}
+        commit = None
+        commit_index = None
+        line_number = 0
+        for line in text.split('\n'):
+            if line.startswith('\t'):
+                if commit_index is None:
+                    commit_index = commit_indexes[commit.commit_hash] = registry.register(commit)
+                file_blame.add(line_number, commit_index)
+                continue
+            m = PORCELAIN_HEADER_PATTERN.match(line)
+            if m:
+                commit_hash = m.group('commit_hash')
+                commit_index = commit_indexes.get(commit_hash)
+                if commit_index is None:
+                    commit = CommitBlame(commit_hash)
+                line_number = int(m.group('line_number'))
+                continue
+            if commit_index is not None:
+                continue
+            key, _, value = line.partition(' ')
+            if key == 'author':
+                commit.author = value
+            elif key == 'author-time':
+                commit.author_time = int(value)
+            elif key == 'author-tz':
+                commit.author_tz = value
+            elif key == 'summary':
+                commit.summary = value
+            elif key == 'boundary':
+                commit.boundary = True
+        file_blame._sort()
+        return file_blame
+
+    @staticmethod
+    def boundary_blame(path, commit: CommitBlame, line_numbers, registry: CommitRegistry) -> 'FileBlame':
+        """
+        Blame all the lines on a boundary commit without running git blame,
+        as git blame does when the blamed revision is the boundary itself.
+
+        >>> commit = CommitBlame('0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192')
+        >>> commit.author = 'Kenji Otsuka'
+        >>> registry = CommitRegistry()
+        >>> file_blame = FileBlame.boundary_blame('pgdf/main.py', commit, [3, 5], registry)
+        >>> [(registry[file_blame.commit_index(n)].short_hash, registry[file_blame.commit_index(n)].author) for n in (3, 5)]
+        [('^0e2b5b3', 'Kenji Otsuka'), ('^0e2b5b3', 'Kenji Otsuka')]
+
+        :param path: the blamed file path
+        :param commit: the boundary commit
+        :param line_numbers: the line numbers in ascending order
+        :param registry: the registry of the commits of the report
+        :return:
+        """
+        commit.boundary = True
+        commit_index = registry.register(commit)
+        file_blame = FileBlame(path)
+        for line_number in line_numbers:
+            file_blame.add(line_number, commit_index)
+        return file_blame
 
 
 class LineBlame:
@@ -43,15 +293,11 @@ class LineBlame:
         :param line: like '0e2b5b3c (Kenji Otsuka 2019-11-04 23:04:00 +0900  1) import re'
         :return:
         """
-        # print(line)
-        m = re.match(r'^\s*(?P<commit_hash>[\^0-9a-f]{6,40})\s+(.+\s+){0,1}\((?P<author>.+)\s+(?P<datetime>(?P<date>[-\d]+?) (?P<time>[:\d]*?) (?P<timezone>.*?))\s+(?P<line_number>\d+)\)\s+(?P<line>.*)$', line)
+        m = re.match(r'^\s*(?P<commit_hash>[\^0-9a-f]{6,40})\s+(.+\s+){0,1}\((?P<author>.+?)\s+(?P<datetime>(?P<date>[-\d]+?) (?P<time>[:\d]*?) (?P<timezone>.*?))\s+(?P<line_number>\d+)\)\s+(?P<line>.*)$', line)
         if m:
             commit_hash = m.group('commit_hash')
             author = m.group('author')
             datetime = m.group('datetime')
-            date = m.group('date')
-            time = m.group('time')
-            timezone = m.group('timezone')
             line_number = int(m.group('line_number'))
             line = m.group('line')
             return LineBlame(commit_hash, author, datetime, line_number, line)
@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from pgdf.log import CommitLog
+
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+"""The default size limit of the cache in bytes."""
+
+DEFAULT_MEMORY_SIZE = 256 * 1024 * 1024
+"""The default size limit of the in-memory cache in bytes."""
+
+TOUCH_BATCH_SIZE = 1000
+"""The number of the cache hits whose use times are written to the database at once."""
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pgdf')
+
+
+class BlameCache:
+    """
+    Base class of the caches of the blames and the commit logs.
+
+    The blames and the commit logs are stored as bytes by their keys, through get and put of the subclasses.
+    """
+
+    @staticmethod
+    def blame_key(commit_hash: str, file_path: str, line_ranges: list[tuple[int, int]], boundary: str = None) -> str:
+        """
+        >>> BlameCache.blame_key('0e2b5b3c', 'pgdf/main.py', [(1, 3), (10, 2)])
+        'blame:0e2b5b3c:1,+3;10,+2:pgdf/main.py'
+        >>> BlameCache.blame_key('0e2b5b3c', 'pgdf/main.py', [(1, 3)], '8e30324f')
+        'blame:8e30324f..0e2b5b3c:1,+3:pgdf/main.py'
+        """
+        ranges = ';'.join(f'{start_line_number},+{volume}' for start_line_number, volume in line_ranges)
+        revision_range = commit_hash if boundary is None else f'{boundary}..{commit_hash}'
+        return f'blame:{revision_range}:{ranges}:{file_path}'
+
+    @staticmethod
+    def commit_key(commit_hash: str) -> str:
+        return f'commit:{commit_hash}'
+
+    def get_blame(self, commit_hash: str, file_path: str, line_ranges: list[tuple[int, int]], boundary: str = None):
+        """Return the git blame --porcelain output, None if it is not cached."""
+        value = self.get(self.blame_key(commit_hash, file_path, line_ranges, boundary))
+        return None if value is None else zlib.decompress(value).decode('utf-8')
+
+    def put_blame(self, commit_hash: str, file_path: str, line_ranges: list[tuple[int, int]], text: str,
+                  boundary: str = None) -> None:
+        self.put(self.blame_key(commit_hash, file_path, line_ranges, boundary), zlib.compress(text.encode('utf-8')))
+
+    def get_commit_log(self, commit_hash: str):
+        """Return the CommitLog, None if it is not cached."""
+        value = self.get(self.commit_key(commit_hash))
+        if value is None:
+            return None
+        author, datetime, subject = value.decode('utf-8').split('\0')
+        return CommitLog(commit_hash, author, datetime, subject)
+
+    def put_commit_log(self, commit_log: CommitLog) -> None:
+        value = '\0'.join([commit_log.author, commit_log.datetime, commit_log.subject])
+        self.put(self.commit_key(commit_log.commit_hash), value.encode('utf-8'))
+
+    def get(self, key: str):
+        """Return the value of the key, None if it is not cached."""
+        raise NotImplementedError()
+
+    def put(self, key: str, value: bytes) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class Cache(BlameCache):
+    """
+    On-disk cache of the blames and the commit logs.
+
+    The blame of a file at a commit and the log of a commit never change,
+    so the entries are keyed by the resolved commit hash and never expire.
+    The least recently used entries are evicted once the cache grows over its size limit.
+    The use times of the hits are kept in memory and written in batches, so that reading the cache does not write to it each time.
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = DEFAULT_MAX_SIZE):
+        """
+
+        :param cache_dir: the directory of the cache database, $XDG_CACHE_HOME/pgdf if it is None.
+        :param max_size: the size limit of the cache in bytes.
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(self.cache_dir, 'cache.sqlite3'), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, used REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        self._size = self._connection.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries').fetchone()[0]
+        self._touched = {}
+        """The use times of the hits that are not written yet, by the keys."""
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                self._write_touched()
+            return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Store an entry, the size of the entry that it replaces is subtracted from the size of the cache.
+
+        >>> import shutil, tempfile
+        >>> cache = Cache(tempfile.mkdtemp(), max_size=100)
+        >>> for _ in range(10):
+        ...     cache.put('a', b'1234567890')
+        >>> cache._size
+        10
+        >>> cache.put('b', b'1234567890')
+        >>> cache._size, cache.get('a'), cache.get('b')
+        (20, b'1234567890', b'1234567890')
+        >>> cache.close()
+        >>> shutil.rmtree(cache.cache_dir)
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT LENGTH(value) FROM entries WHERE key = ?', (key,)).fetchone()
+            self._connection.execute('INSERT OR REPLACE INTO entries (key, value, used) VALUES (?, ?, ?)', (key, value, time.time()))
+            self._size += len(value) - (row[0] if row is not None else 0)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _write_touched(self) -> None:
+        """Write the use times of the hits in one transaction."""
+        if not self._touched:
+            return
+        connection = self._connection
+        connection.execute('BEGIN')
+        try:
+            connection.executemany('UPDATE entries SET used = ? WHERE key = ?', [(used, key) for key, used in self._touched.items()])
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._touched.clear()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache is below 80% of the limit."""
+        connection = self._connection
+        self._write_touched()
+        self._size = connection.execute('SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries').fetchone()[0]
+        target_size = self.max_size * 0.8
+        while self._size > target_size:
+            rows = connection.execute('SELECT key, LENGTH(value) FROM entries ORDER BY used LIMIT 100').fetchall()
+            if not rows:
+                break
+            evicted_keys = []
+            for key, size in rows:
+                evicted_keys.append((key,))
+                self._size -= size
+                if self._size <= target_size:
+                    break
+            connection.executemany('DELETE FROM entries WHERE key = ?', evicted_keys)
+
+    def close(self) -> None:
+        with self._lock:
+            self._write_touched()
+            self._connection.close()
+
+
+class MemoryCache(BlameCache):
+    """
+    In-memory LRU cache of the blames and the commit logs, in front of the on-disk cache if it is given.
+
+    It wraps the on-disk cache rather than being one, so it works without a database when the cache is kept only in memory.
+
+    It is for a process that generates many reports, so that the entries used recently are not read from the database again.
+
+    >>> cache = MemoryCache(max_size=10)
+    >>> cache.put('a', b'12345')
+    >>> cache.put('b', b'67890')
+    >>> cache.get('a')
+    b'12345'
+    >>> cache.put('c', b'abcde')
+    >>> [cache.get(key) for key in ('a', 'b', 'c')]
+    [b'12345', None, b'abcde']
+    >>> cache = MemoryCache()
+    >>> cache.put_commit_log(CommitLog('0e2b5b3c', 'Kenji Otsuka', '2019-11-04 23:04:00 +0900', 'Initial commit'))
+    >>> cache.get_commit_log('0e2b5b3c').subject
+    'Initial commit'
+    """
+
+    def __init__(self, cache: Cache = None, max_size: int = DEFAULT_MEMORY_SIZE):
+        """
+
+        :param cache: the on-disk cache that the entries are read from and written to, None to keep them only in memory.
+        :param max_size: the size limit of the entries kept in memory in bytes.
+        """
+        self.cache = cache
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        value = self.cache.get(key) if self.cache is not None else None
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self._remember(key, value)
+        if self.cache is not None:
+            self.cache.put(key, value)
+
+    def _remember(self, key: str, value: bytes) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
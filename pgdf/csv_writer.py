@@ -0,0 +1,70 @@
+import csv
+
+from pgdf.writer import ReportWriter
+
+
+DIFF_COLUMNS = ['commit_hash', 'author', 'datetime', 'subject', 'before_line_number', 'after_line_number', 'code']
+SUMMARY_COLUMNS = ['path', 'change', 'note']
+
+
+class CsvWriter(ReportWriter):
+    """
+    Write the report into a diff file and a summary file, separated by commas or tabs.
+
+    The rows are the same as the rows of the Excel sheets without the formats, the title and the blank rows,
+    and they are written to disk as they come.
+    """
+
+    def __init__(self, output_file_path: str, summary_file_path: str, delimiter: str = ','):
+        self.output_file_path = output_file_path
+        self.output_file_paths = [summary_file_path]
+        self.delimiter = delimiter
+        self.summary_file = open(summary_file_path, 'w', newline='', encoding='utf-8')
+        self.summary = csv.writer(self.summary_file, delimiter=delimiter)
+        self.summary.writerow(SUMMARY_COLUMNS)
+        self.diff_file = None
+        self.diff = None
+
+    def write_file_summary(self, path: str, change: int, plus: int, minus: int) -> None:
+        self.summary.writerow([path, change, '+' * plus + '-' * minus])
+
+    def write_binary_summary(self, path: str, before: str, after: str) -> None:
+        self.summary.writerow([path, 'Bin', f'{before} -> {after} bytes'])
+
+    def write_omitted_summary(self, path: str, change: int) -> None:
+        self.summary.writerow([path, change, f'omitted ({change} lines)'])
+
+    def write_summary_text(self, line: str) -> None:
+        self.summary.writerow([line, '', ''])
+
+    def write_file(self, file_diff) -> None:
+        if self.diff is None:
+            # the diff file is created by the first file, so a summary only report has no diff file
+            self.diff_file = open(self.output_file_path, 'w', newline='', encoding='utf-8')
+            self.diff = csv.writer(self.diff_file, delimiter=self.delimiter)
+            self.diff.writerow(DIFF_COLUMNS)
+            self.output_file_paths.append(self.output_file_path)
+        writerow = self.diff.writerow
+        for line in file_diff.header_lines:
+            writerow(['', '', '', '', '', '', line])
+
+    def write_hunk(self, hunk) -> None:
+        self.diff.writerow(['', '', '', '', '', '', hunk.header])
+
+    def write_line(self, diff_line, commit=None) -> None:
+        before_line_number = diff_line.before_line_number
+        after_line_number = diff_line.after_line_number
+        if commit is None:
+            row = ['', '', '', '']
+        else:
+            row = [commit.short_hash, commit.author, commit.datetime, commit.subject]
+        row.append('' if before_line_number is None else before_line_number)
+        row.append('' if after_line_number is None else after_line_number)
+        row.append(diff_line.line)
+        self.diff.writerow(row)
+
+    def close(self) -> list[str]:
+        self.summary_file.close()
+        if self.diff_file is not None:
+            self.diff_file.close()
+        return self.output_file_paths
@@ -1,14 +1,418 @@
 import re
 
+
+HUNK_HEADER_PATTERN = re.compile(r'^(?P<navigation>@@ -(?P<before_line_number>\d+)(?:,(?P<before_line_volume>\d+))? \+(?P<after_line_number>\d+)(?:,(?P<after_line_volume>\d+))? @@)(?P<part_name>.*)$')
+INDEX_PATTERN = re.compile(r'^index (?P<before_blob>[0-9a-f]+)\.\.(?P<after_blob>[0-9a-f]+)(?: (?P<mode>\d+))?$')
+NON_WHITESPACE_PATTERN = re.compile(r'\S')
+WORD_DIFF_MAX_BLOCK_LINES = 1000
+"""The removed and the added lines of a block with more lines than this are shown as they are, without their changed words."""
+QUOTED_PATH_ESCAPES = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13, '"': 34, '\\': 92}
+
+
+def unquote_path(path: str) -> str:
+    """
+    Unquote a path that git quoted because it contains special or non-ASCII characters.
+
+    >>> unquote_path('pgdf/main.py')
+    'pgdf/main.py'
+    >>> unquote_path('"b/\\\\346\\\\227\\\\245\\\\346\\\\234\\\\254.txt"')
+    'b/日本.txt'
+    >>> unquote_path('"a/tab\\\\there"')
+    'a/tab\\there'
+
+    :param path:
+    :return:
+    """
+    if not (len(path) >= 2 and path.startswith('"') and path.endswith('"')):
+        return path
+    result = bytearray()
+    text = path[1:-1]
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == '\\' and i + 1 < len(text):
+            escaped = text[i + 1]
+            if escaped in '0123':
+                result.append(int(text[i + 1:i + 4], 8))
+                i += 4
+                continue
+            result.append(QUOTED_PATH_ESCAPES.get(escaped, ord(escaped)))
+            i += 2
+            continue
+        result.extend(c.encode('utf-8'))
+        i += 1
+    return result.decode('utf-8', 'replace')
+
+
+def strip_prefix(path: str, prefix: str):
+    """
+    Remove the 'a/' or 'b/' prefix of a path in the diff headers. None for '/dev/null'.
+
+    >>> strip_prefix('a/pgdf/main.py', 'a/')
+    'pgdf/main.py'
+    >>> strip_prefix('/dev/null', 'a/') is None
+    True
+    """
+    path = unquote_path(path.rstrip('\t'))
+    if path == '/dev/null':
+        return None
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+def coalesce_line_numbers(line_numbers) -> list[tuple[int, int]]:
+    """
+    Merge line numbers into the fewest ranges that cover exactly those lines.
+
+    >>> coalesce_line_numbers([3, 4, 5, 9, 11, 12])
+    [(3, 3), (9, 1), (11, 2)]
+    >>> coalesce_line_numbers([])
+    []
+
+    :param line_numbers: line numbers in ascending order
+    :return: pairs of the start line number and the volume
+    """
+    ranges = []
+    start = end = None
+    for line_number in line_numbers:
+        if start is not None and line_number <= end + 1:
+            end = max(end, line_number)
+            continue
+        if start is not None:
+            ranges.append((start, end - start + 1))
+        start = end = line_number
+    if start is not None:
+        ranges.append((start, end - start + 1))
+    return ranges
+
+
+class DiffLine:
+    """A line of a hunk."""
+
+    __slots__ = ('kind', 'line', 'before_line_number', 'after_line_number', 'words')
+
+    def __init__(self, kind: str, line: str, before_line_number: int = None, after_line_number: int = None):
+        """
+
+        :param kind: ' ' for a context line, '-' for a removed line, '+' for an added line and '\\' for the other lines like '\\ No newline at end of file'.
+        :param line: the line as printed by git diff, including the leading character.
+        :param before_line_number: the line number in the first revision, None for an added line.
+        :param after_line_number: the line number in the second revision, None for a removed line.
+        """
+        self.kind = kind
+        self.line = line
+        self.before_line_number = before_line_number
+        self.after_line_number = after_line_number
+        self.words = None
+        """
+        The changed words of a removed or an added line as (start, end) pairs of the positions in the line,
+        set by Hunk.set_changed_words. None when the words are not diffed or when the whole line is changed.
+        """
+
+
+def join_word_diff_side(word_lines: list[str], kind: str) -> tuple[str, list[list[int]]]:
+    """
+    Join the common segments and the removed or the added segments of a hunk of git diff --word-diff=porcelain without the whitespace.
+
+    >>> join_word_diff_side([' a = ', '-f(b,', '+g(b,', ' c)', '~', '+d', '~'], '+')
+    ('a=g(b,c)d', [[2, 6], [8, 9]])
+    >>> join_word_diff_side([' a = ', '-f(b,', '+g(b,', ' c)', '~', '+d', '~'], '-')
+    ('a=f(b,c)', [[2, 6]])
+
+    :param word_lines: the lines of the hunk without the hunk header
+    :param kind: '-' for the text of the first revision, '+' for the text of the second revision
+    :return: the non-whitespace characters of the side and the ranges of the changed ones,
+             the ranges with only whitespace between them are joined
+    """
+    texts = []
+    ranges = []
+    position = 0
+    for word_line in word_lines:
+        segment_kind = word_line[:1]
+        if segment_kind != ' ' and segment_kind != kind:
+            continue
+        text = ''.join(word_line[1:].split())
+        if segment_kind == kind and text:
+            if ranges and ranges[-1][1] == position:
+                ranges[-1][1] += len(text)
+            else:
+                ranges.append([position, position + len(text)])
+        texts.append(text)
+        position += len(text)
+    return ''.join(texts), ranges
+
+
+def to_line_spans(line: str, ranges: list[tuple[int, int]]) -> tuple:
+    """
+    Convert the ranges of the non-whitespace characters of a line into (start, end) positions in the line.
+
+    >>> to_line_spans('+a = g(b, c)  d', [(2, 6), (8, 9)])
+    ((5, 9), (14, 15))
+
+    :param line: the line as printed by git diff, including the leading character
+    :param ranges: the ranges in the non-whitespace characters of the line without the leading character
+    :return:
+    """
+    positions = [m.start() for m in NON_WHITESPACE_PATTERN.finditer(line, 1)]
+    return tuple((positions[start], positions[end - 1] + 1) for start, end in ranges)
+
+
+class Hunk:
+    __slots__ = ('header', 'navigation', 'part_name',
+                 'before_line_number', 'before_line_volume', 'after_line_number', 'after_line_volume', 'lines')
+
+    def __init__(self, header: str, navigation: str, part_name: str,
+                 before_line_number: int, before_line_volume: int, after_line_number: int, after_line_volume: int):
+        self.header = header
+        self.navigation = navigation
+        self.part_name = part_name
+        self.before_line_number = before_line_number
+        self.before_line_volume = before_line_volume
+        self.after_line_number = after_line_number
+        self.after_line_volume = after_line_volume
+        self.lines = []
+
+    @staticmethod
+    def parse(line: str) -> 'Hunk':
+        """
+        Parse the hunk header.
+
+        >>> hunk = Hunk.parse('@@ -8,7 +8,6 @@ def main():')
+        >>> (hunk.before_line_number, hunk.before_line_volume, hunk.after_line_number, hunk.after_line_volume)
+        (8, 7, 8, 6)
+        >>> (hunk.navigation, hunk.part_name)
+        ('@@ -8,7 +8,6 @@', ' def main():')
+        >>> hunk = Hunk.parse('@@ -1 +0,0 @@')
+        >>> (hunk.before_line_number, hunk.before_line_volume, hunk.after_line_number, hunk.after_line_volume)
+        (1, 1, 0, 0)
+
+        :param line:
+        :return:
+        """
+        m = HUNK_HEADER_PATTERN.match(line)
+        if m is None:
+            raise Exception('The hunk header could not be parsed: {}'.format(line))
+        before_line_volume = m.group('before_line_volume')
+        after_line_volume = m.group('after_line_volume')
+        return Hunk(
+            line, m.group('navigation'), m.group('part_name'),
+            int(m.group('before_line_number')), 1 if before_line_volume is None else int(before_line_volume),
+            int(m.group('after_line_number')), 1 if after_line_volume is None else int(after_line_volume),
+        )
+
+    def set_changed_words(self, word_lines: list[str]) -> bool:
+        """
+        Set the changed words of the removed and the added lines from the hunk in git diff --word-diff=porcelain.
+
+        The non-whitespace characters of the segments are matched with the ones of the lines,
+        and the words are left unset when they do not match, as with a word regex that drops characters.
+
+        >>> hunk = Hunk.parse('@@ -1,3 +1,4 @@')
+        >>> hunk.lines = [DiffLine(' ', ' x = 1'), DiffLine('-', '-y = f(2)'), DiffLine('+', '+y = g(2)'), DiffLine('+', '+z = 4')]
+        >>> hunk.set_changed_words([' x = 1', '~', ' y = ', '-f(2)', '+g(2)', '~', '+z = 4', '~'])
+        True
+        >>> [diff_line.words for diff_line in hunk.lines]
+        [None, ((5, 9),), ((5, 9),), None]
+        >>> hunk.set_changed_words([' x = 1', '~', ' y = ', '-f(2)', '+h(2)', '~', '+z = 4', '~'])
+        False
+        >>> [diff_line.words for diff_line in hunk.lines]
+        [None, None, None, None]
+
+        :param word_lines: the lines of the hunk without the hunk header
+        :return: False if the word diff does not match the lines
+        """
+        for kind in '-+':
+            text, ranges = join_word_diff_side(word_lines, kind)
+            position = 0
+            range_index = 0
+            for diff_line in self.lines:
+                if diff_line.kind != ' ' and diff_line.kind != kind:
+                    continue
+                line_text = ''.join(diff_line.line[1:].split())
+                end = position + len(line_text)
+                if text[position:end] != line_text:
+                    self.clear_changed_words()
+                    return False
+                if diff_line.kind == kind:
+                    while range_index < len(ranges) and ranges[range_index][1] <= position:
+                        range_index += 1
+                    line_ranges = []
+                    for start, stop in ranges[range_index:]:
+                        if start >= end:
+                            break
+                        line_ranges.append((max(start, position) - position, min(stop, end) - position))
+                    changed_count = sum(stop - start for start, stop in line_ranges)
+                    # a line whose words are all changed is shown as it is
+                    diff_line.words = to_line_spans(diff_line.line, line_ranges) if 0 < changed_count < len(line_text) else None
+                position = end
+            if position != len(text):
+                self.clear_changed_words()
+                return False
+
+        block_start = 0
+        for index, diff_line in enumerate(self.lines + [None]):
+            if diff_line is None or diff_line.kind == ' ':
+                if index - block_start > WORD_DIFF_MAX_BLOCK_LINES:
+                    for block_line in self.lines[block_start:index]:
+                        block_line.words = None
+                block_start = index + 1
+        return True
+
+    def clear_changed_words(self) -> None:
+        for diff_line in self.lines:
+            diff_line.words = None
+
+
 class FileDiff:
+    __slots__ = ('header_lines', 'before_path', 'after_path', 'status', 'old_mode', 'new_mode',
+                 'before_blob', 'after_blob', 'similarity', 'binary', 'hunks', 'insertions', 'deletions')
+
     def __init__(self):
-        self.before_file_path = None
-        self.after_file_path = None
-        self.summary_lines = []
-        self.diff_parts = []
+        self.header_lines = []
+        """The lines before the first hunk, starting with the 'diff --git' line."""
+        self.before_path = None
+        """The path in the first revision, None for a new file."""
+        self.after_path = None
+        """The path in the second revision, None for a deleted file."""
+        self.status = 'M'
+        """'M' for modified, 'A' for added, 'D' for deleted, 'R' for renamed and 'C' for copied."""
+        self.old_mode = None
+        self.new_mode = None
+        self.before_blob = None
+        self.after_blob = None
+        self.similarity = None
+        self.binary = False
+        self.hunks = []
+        self.insertions = 0
+        """The number of the added lines, counted while the diff is parsed."""
+        self.deletions = 0
+        """The number of the removed lines, counted while the diff is parsed."""
+
+    @property
+    def file_path(self) -> str:
+        return self.after_path if self.after_path is not None else self.before_path
+
+    @property
+    def paths(self) -> list[str]:
+        """The distinct paths of both sides."""
+        return list(dict.fromkeys(path for path in (self.before_path, self.after_path) if path is not None))
+
+    @property
+    def has_replaced_lines(self) -> bool:
+        """
+        Check if a hunk both removes and adds lines, the lines of the other hunks have no changed words to show.
+
+        >>> FileDiff.parse(['diff --git a/a.txt b/a.txt', '--- a/a.txt', '+++ b/a.txt', '@@ -1 +1,2 @@', '-a', '+b', '+c']).has_replaced_lines
+        True
+        >>> FileDiff.parse(['diff --git a/a.txt b/a.txt', '--- a/a.txt', '+++ b/a.txt', '@@ -1 +1,2 @@', ' a', '+b']).has_replaced_lines
+        False
+        """
+        for hunk in self.hunks:
+            kinds = {diff_line.kind for diff_line in hunk.lines}
+            if '-' in kinds and '+' in kinds:
+                return True
+        return False
+
+    @property
+    def diff_lines(self) -> list[str]:
+        """The lines of the file diff as printed by git diff."""
+        lines = list(self.header_lines)
+        for hunk in self.hunks:
+            lines.append(hunk.header)
+            lines.extend(diff_line.line for diff_line in hunk.lines)
+        return lines
+
+    def before_line_ranges(self) -> list[tuple[int, int]]:
+        """The ranges of the removed lines in the first revision, as pairs of the start line number and the volume."""
+        return coalesce_line_numbers(
+            diff_line.before_line_number for hunk in self.hunks for diff_line in hunk.lines if diff_line.kind == '-'
+        )
+
+    def after_line_ranges(self) -> list[tuple[int, int]]:
+        """The ranges of the added lines in the second revision, as pairs of the start line number and the volume."""
+        return coalesce_line_numbers(
+            diff_line.after_line_number for hunk in self.hunks for diff_line in hunk.lines if diff_line.kind == '+'
+        )
+
+    def add_header_line(self, line: str) -> None:
+        self.header_lines.append(line)
+        if line.startswith('diff --git '):
+            self.before_path, self.after_path = FileDiff.parse_paths(line[11:])
+        elif line.startswith('--- '):
+            self.before_path = strip_prefix(line[4:], 'a/')
+        elif line.startswith('+++ '):
+            self.after_path = strip_prefix(line[4:], 'b/')
+        elif line.startswith('index '):
+            m = INDEX_PATTERN.match(line)
+            if m:
+                self.before_blob = m.group('before_blob')
+                self.after_blob = m.group('after_blob')
+                if m.group('mode'):
+                    self.old_mode = self.new_mode = m.group('mode')
+        elif line.startswith('new file mode '):
+            self.status = 'A'
+            self.before_path = None
+            self.new_mode = line[14:]
+        elif line.startswith('deleted file mode '):
+            self.status = 'D'
+            self.after_path = None
+            self.old_mode = line[18:]
+        elif line.startswith('old mode '):
+            self.old_mode = line[9:]
+        elif line.startswith('new mode '):
+            self.new_mode = line[9:]
+        elif line.startswith('rename from ') or line.startswith('copy from '):
+            self.status = 'R' if line[0] == 'r' else 'C'
+            self.before_path = unquote_path(line.partition(' from ')[2])
+        elif line.startswith('rename to ') or line.startswith('copy to '):
+            self.after_path = unquote_path(line.partition(' to ')[2])
+        elif line.startswith('similarity index '):
+            self.similarity = int(line[17:].rstrip('%'))
+        elif line.startswith('Binary files ') or line == 'GIT binary patch':
+            self.binary = True
+
+    def set_changed_words(self, word_diff: 'WordDiff') -> bool:
+        """
+        Set the changed words of the hunks from the word diff of the file.
+
+        :param word_diff: the file in git diff --word-diff=porcelain with the same options as the diff of this file
+        :return: False if the word diff is not of this file or its hunks do not match, when the words are left unset
+        """
+        if word_diff.header != self.header_lines[0] or len(word_diff.hunks) != len(self.hunks):
+            return False
+        matched = True
+        for hunk, (header, word_lines) in zip(self.hunks, word_diff.hunks):
+            if header != hunk.header or not hunk.set_changed_words(word_lines):
+                matched = False
+        return matched
 
     @staticmethod
-    def parse(lines):
+    def parse_paths(paths: str) -> tuple:
+        """
+        Parse the paths of the 'diff --git' line.
+
+        The paths cannot be split at a space when they contain spaces,
+        but they are the same unless the file is renamed, and then the 'rename from' and 'rename to' lines follow.
+
+        >>> FileDiff.parse_paths('a/dir name/file b/dir name/file')
+        ('dir name/file', 'dir name/file')
+        >>> FileDiff.parse_paths('"a/\\\\346\\\\227\\\\245.txt" "b/\\\\346\\\\227\\\\245.txt"')
+        ('日.txt', '日.txt')
+
+        :param paths: the 'diff --git' line without 'diff --git '
+        :return: the path in the first revision and the path in the second revision
+        """
+        if paths.startswith('"'):
+            end = paths.index('" ', 1) + 1
+            return strip_prefix(paths[:end], 'a/'), strip_prefix(paths[end + 1:], 'b/')
+        half = (len(paths) - 1) // 2
+        before_path, after_path = paths[:half], paths[half + 1:]
+        if before_path[2:] != after_path[2:]:
+            before_path, _, after_path = paths.partition(' b/')
+            after_path = 'b/' + after_path
+        return strip_prefix(before_path, 'a/'), strip_prefix(after_path, 'b/')
+
+    @staticmethod
+    def parse(lines) -> 'FileDiff':
         """
         Parse the lines and return FileDiff object.
 
@@ -17,50 +421,238 @@ class FileDiff:
         '.gitignore'
         >>> fd.diff_lines
         ['diff --git a/.gitignore b/.gitignore', 'new file mode 100644', 'index 0000000..74be068', '--- /dev/null', '+++ b/.gitignore', '@@ -0,0 +1,13 @@', '+# for Intellij IDEA', '+.idea', '+mael.iml', '+', '+# for editable package', '+mael.egg-info', '+__pycache__', '+', '+# compiled packages', '+dist', '+', '+# credentials', '+.pypirc']
+        >>> (fd.status, fd.before_path, fd.new_mode, fd.after_blob, fd.hunks[0].lines[-1].after_line_number)
+        ('A', None, '100644', '74be068', 13)
 
         :param lines:
         :return:
         """
-        m = re.match(r'^diff --git a/(?P<file_path>.+?) b/(?P=file_path>.+?)$', lines[0])
-        if m:
-            file_path = m.group('file_path')
-            diff_lines = lines
-            return FileDiff(file_path, diff_lines)
+        for file_diff in Diff.parse(lines):
+            return file_diff
         return None
 
 
-class Diff:
+class RawDiffEntry:
+    """A file of the git diff --raw output, that identifies the change of a file by its modes and blobs without its content."""
+
+    __slots__ = ('old_mode', 'new_mode', 'before_blob', 'after_blob', 'status', 'before_path', 'after_path')
+
+    def __init__(self, old_mode: str, new_mode: str, before_blob: str, after_blob: str, status: str,
+                 before_path: str, after_path: str):
+        self.old_mode = old_mode
+        self.new_mode = new_mode
+        self.before_blob = before_blob
+        self.after_blob = after_blob
+        self.status = status
+        """The status letter followed by the similarity score for a renamed or a copied file, like 'M' or 'R086'."""
+        self.before_path = before_path
+        """The path in the first revision, None for a new file."""
+        self.after_path = after_path
+        """The path in the second revision, None for a deleted file."""
+
+    @property
+    def file_path(self) -> str:
+        return self.after_path if self.after_path is not None else self.before_path
+
+    @property
+    def paths(self) -> list[str]:
+        """The distinct paths of both sides."""
+        return list(dict.fromkeys(path for path in (self.before_path, self.after_path) if path is not None))
+
+    @property
+    def key(self) -> str:
+        """The text that is the same for two entries exactly when their diffs are the same."""
+        return '\0'.join([
+            self.old_mode, self.new_mode, self.before_blob, self.after_blob, self.status,
+            self.before_path or '', self.after_path or ''
+        ])
+
     @staticmethod
-    def parse(text):
-        lines = text.splitlines()
-        file_diffs = []
-        file_diff = None
+    def parse(text: str) -> list['RawDiffEntry']:
+        """
+        Parse the output of git diff --raw -z.
+
+        >>> entries = RawDiffEntry.parse(':100644 100644 0ff3bbb d4de868 R094\\0r.txt\\0s.txt\\0:000000 100644 0000000 7937c68 A\\0new.txt\\0')
+        >>> [(e.status, e.before_path, e.after_path, e.paths) for e in entries]
+        [('R094', 'r.txt', 's.txt', ['r.txt', 's.txt']), ('A', None, 'new.txt', ['new.txt'])]
+
+        :param text:
+        :return:
+        """
+        entries = []
+        fields = text.split('\0')
+        i = 0
+        while i < len(fields) and fields[i].startswith(':'):
+            old_mode, new_mode, before_blob, after_blob, status = fields[i][1:].split(' ')
+            if status[0] in 'RC':
+                before_path, after_path = fields[i + 1], fields[i + 2]
+                i += 3
+            else:
+                before_path = after_path = fields[i + 1]
+                i += 2
+                if status == 'A':
+                    before_path = None
+                elif status == 'D':
+                    after_path = None
+            entries.append(RawDiffEntry(old_mode, new_mode, before_blob, after_blob, status, before_path, after_path))
+        return entries
+
+
+class WordDiff:
+    """A file of the git diff --word-diff=porcelain output, whose hunks are the same as the ones of git diff."""
+
+    __slots__ = ('header', 'hunks')
+
+    def __init__(self, header: str):
+        self.header = header
+        """The 'diff --git' line of the file."""
+        self.hunks = []
+        """Pairs of the hunk header and the lines of the hunk."""
+
+    @staticmethod
+    def parse(lines):
+        """
+        Parse the output of git diff --word-diff=porcelain and yield a WordDiff object for each file as soon as the file ends.
+
+        Each line of a hunk starts with ' ', '-', '+' or '~', so a line that starts with 'diff ' or '@@ ' is always a header.
+
+        >>> word_diffs = list(WordDiff.parse('''diff --git a/a.py b/a.py
+        ... index 793a5d9..09d2f4d 100644
+        ... --- a/a.py
+        ... +++ b/a.py
+        ... @@ -1 +1 @@
+        ...  a =
+        ... --- b
+        ... +c
+        ... ~
+        ... diff --git a/image.png b/image.png
+        ... index 723736c..9ac4a1d 100644
+        ... Binary files a/image.png and b/image.png differ'''.splitlines()))
+        >>> [(word_diff.header, word_diff.hunks) for word_diff in word_diffs]
+        [('diff --git a/a.py b/a.py', [('@@ -1 +1 @@', [' a =', '--- b', '+c', '~'])]), ('diff --git a/image.png b/image.png', [])]
+
+        :param lines: the lines of git diff --word-diff=porcelain output
+        :return:
+        """
+        word_diff = None
+        hunk_lines = None
         for line in lines:
             if line.startswith('diff '):
-                if file_diff:
-                    file_diffs.append(file_diff)
-                file_diff = FileDiff.parse([line])
-                print(line)
-                continue
-            if line.startswith('index '):
-                print(line)
-                continue
-            if line.startswith('--- '):
-                print(line)
-                continue
-            if line.startswith('+++ '):
-                print(line)
-                continue
-            if line.startswith('@@ '):
-                print(line)
-                continue
-            if line.startswith('-'):
-                print(line)
-                continue
-            if line.startswith('+'):
-                print(line)
-                continue
-            if line.startswith(' '):
-                print(line)
+                if word_diff is not None:
+                    yield word_diff
+                word_diff = WordDiff(line)
+                hunk_lines = None
+            elif word_diff is None:
                 continue
+            elif line.startswith('@@ '):
+                hunk_lines = []
+                word_diff.hunks.append((line, hunk_lines))
+            elif hunk_lines is not None:
+                hunk_lines.append(line)
+        if word_diff is not None:
+            yield word_diff
+
+
+class Diff:
+    @staticmethod
+    def parse(lines):
+        """
+        Parse the output of git diff and yield a FileDiff object for each file as soon as the file ends.
+
+        The lines of a hunk are counted with the line volumes of the hunk header,
+        so the lines that start with '---', '+++' or 'diff' inside a hunk are not mistaken for headers.
+
+        >>> file_diffs = list(Diff.parse('''diff --git a/old.py b/new.py
+        ... similarity index 90%
+        ... rename from old.py
+        ... rename to new.py
+        ... index 793a5d9..09d2f4d 100644
+        ... --- a/old.py
+        ... +++ b/new.py
+        ... @@ -1,3 +1,3 @@ class A:
+        ...  a
+        ... --- removed
+        ... +++ added
+        ...  b
+        ... \\\\ No newline at end of file
+        ... diff --git a/run.sh b/run.sh
+        ... old mode 100644
+        ... new mode 100755
+        ... diff --git a/image.png b/image.png
+        ... index 723736c..9ac4a1d 100644
+        ... Binary files a/image.png and b/image.png differ'''))
+        >>> [(fd.status, fd.before_path, fd.after_path, fd.binary) for fd in file_diffs]
+        [('R', 'old.py', 'new.py', False), ('M', 'run.sh', 'run.sh', False), ('M', 'image.png', 'image.png', True)]
+        >>> [(line.kind, line.before_line_number, line.after_line_number) for line in file_diffs[0].hunks[0].lines]
+        [(' ', 1, 1), ('-', 2, None), ('+', None, 2), (' ', 3, 3), ('\\\\', None, None)]
+        >>> (file_diffs[1].old_mode, file_diffs[1].new_mode)
+        ('100644', '100755')
+        >>> (file_diffs[0].insertions, file_diffs[0].deletions)
+        (1, 1)
+        >>> list(Diff.parse(''))
+        []
+
+        :param lines: the lines of git diff output, or the whole output as a string
+        :return:
+        """
+        if isinstance(lines, str):
+            lines = lines.splitlines()
+        file_diff = None
+        hunk = None
+        before_remaining = 0
+        after_remaining = 0
+        before_line_number = 0
+        after_line_number = 0
+        for line in lines:
+            if before_remaining > 0 or after_remaining > 0:
+                kind = line[:1]
+                if kind == ' ' or kind == '':
+                    hunk.lines.append(DiffLine(' ', line, before_line_number, after_line_number))
+                    before_line_number += 1
+                    after_line_number += 1
+                    before_remaining -= 1
+                    after_remaining -= 1
+                    continue
+                if kind == '-':
+                    hunk.lines.append(DiffLine('-', line, before_line_number, None))
+                    before_line_number += 1
+                    before_remaining -= 1
+                    file_diff.deletions += 1
+                    continue
+                if kind == '+':
+                    hunk.lines.append(DiffLine('+', line, None, after_line_number))
+                    after_line_number += 1
+                    after_remaining -= 1
+                    file_diff.insertions += 1
+                    continue
+                if kind == '\\':
+                    hunk.lines.append(DiffLine('\\', line))
+                    continue
+                # the hunk is shorter than its header says, parse the line as a header
+                before_remaining = after_remaining = 0
+
+            kind = line[:1]
+            if kind == '@' and file_diff is not None and line.startswith('@@ '):
+                hunk = Hunk.parse(line)
+                file_diff.hunks.append(hunk)
+                before_line_number = hunk.before_line_number
+                after_line_number = hunk.after_line_number
+                before_remaining = hunk.before_line_volume
+                after_remaining = hunk.after_line_volume
+            elif kind == 'd' and line.startswith('diff '):
+                if file_diff is not None:
+                    yield file_diff
+                file_diff = FileDiff()
+                hunk = None
+                file_diff.add_header_line(line)
+            elif hunk is not None:
+                hunk.lines.append(DiffLine('\\', line))
+            elif file_diff is not None:
+                file_diff.add_header_line(line)
+        if file_diff is not None:
+            yield file_diff
+
 
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
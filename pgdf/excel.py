@@ -0,0 +1,391 @@
+import os
+
+import xlsxwriter
+
+from pgdf.writer import ReportWriter
+
+
+MAX_ROWS = 1048576
+"""The maximum number of rows of an Excel worksheet."""
+
+MAX_STRING_LENGTH = 32767
+"""The maximum length of a string in a cell, a longer rich string would not be written at all."""
+
+
+class Column:
+    def __init__(self, index: int, width: int = None):
+        """
+
+        :param index: column position that starts from 0.
+        :param width:
+        """
+        self.index = index
+        self.width = width
+
+    def __str__(self):
+        return f'{self.index}(width={self.width})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+commit_hash_column = Column(0, 10)
+commit_author_column = Column(commit_hash_column.index + 1, 10)
+commit_datetime_column = Column(commit_author_column.index + 1, 15)
+commit_comment_column = Column(commit_datetime_column.index + 1, 20)
+before_line_num_column = Column(commit_comment_column.index + 1, 5)
+after_line_num_column = Column(before_line_num_column.index + 1, 5)
+code_column = Column(after_line_num_column.index + 1, 100)
+columns = [
+    commit_hash_column, commit_author_column, commit_datetime_column, commit_comment_column,
+    before_line_num_column, after_line_num_column, code_column
+]
+
+
+class Format:
+    """The cell formats of a workbook."""
+
+    def __init__(self, workbook):
+        def build_format(kwargs):
+            basic_format_properties = {'font_name': 'Consolas'}
+            return workbook.add_format(dict(basic_format_properties, **kwargs))
+
+        self.BASIC = build_format({})
+        """Basic format. Just Consolas font."""
+        self.WRAP_BASIC = build_format({'text_wrap': True})
+        """Basic format with text wrap."""
+        self.BOLD = build_format({'bold': True})
+        """Basic format with bold."""
+        self.WRAP_BOLD = build_format({'text_wrap': True, 'bold': True})
+        """Basic format with text wrap and bold."""
+        self.RED = build_format({'font_color': 'red', 'bg_color': '#FFCCCC'})
+        """Basic format with red font and light red background."""
+        self.WRAP_RED = build_format({'text_wrap': True, 'font_color': 'red', 'bg_color': '#FFCCCC'})
+        """Basic format with text wrap, red font and light red background."""
+        self.GREEN = build_format({'font_color': 'green', 'bg_color': '#CCFFCC'})
+        """Basic format with green font and light green background."""
+        self.WRAP_GREEN = build_format({'text_wrap': True, 'font_color': 'green', 'bg_color': '#CCFFCC'})
+        """Basic format with text wrap, green font and light green background."""
+        self.FORE_BLUE = build_format({'font_color': 'blue'})
+        """Basic format with blue font."""
+        self.WRAP_FORE_BLUE = build_format({'text_wrap': True, 'font_color': 'blue'})
+        """Basic format with text wrap and blue font."""
+        self.FORE_GREEN = build_format({'font_color': 'green'})
+        """Basic format with green font."""
+        self.WRAP_FORE_GREEN = build_format({'text_wrap': True, 'font_color': 'green'})
+        """Basic format with text wrap and green font."""
+        self.FORE_GREEN_BOLD = build_format({'font_color': 'green', 'bold': True})
+        """Basic format with green font and bold."""
+        self.WRAP_FORE_GREEN_BOLD = build_format({'text_wrap': True, 'font_color': 'green', 'bold': True})
+        """Basic format with text wrap, green font and bold."""
+        self.FORE_RED = build_format({'font_color': 'red'})
+        """Basic format with red font."""
+        self.WRAP_FORE_RED = build_format({'text_wrap': True, 'font_color': 'red'})
+        """Basic format with text wrap and red font."""
+        self.FORE_RED_BOLD = build_format({'font_color': 'red', 'bold': True})
+        """Basic format with red font and bold."""
+        self.WRAP_FORE_RED_BOLD = build_format({'text_wrap': True, 'font_color': 'red', 'bold': True})
+        """Basic format with text wrap, red font and bold."""
+        self.REMOVED_WORDS = (self.FORE_RED, self.FORE_RED_BOLD, self.WRAP_RED)
+        """The formats of the unchanged words, the changed words and the cell of a removed line with its changed words."""
+        self.ADDED_WORDS = (self.FORE_GREEN, self.FORE_GREEN_BOLD, self.WRAP_GREEN)
+        """The formats of the unchanged words, the changed words and the cell of an added line with its changed words."""
+
+
+def rich_string_arguments(line: str, words: tuple, formats: tuple) -> list:
+    """
+    Build the arguments of write_rich_string that show the changed words of a line in bold.
+
+    >>> rich_string_arguments('+a = g(b)', ((5, 9),), ('plain', 'bold', 'cell'))
+    ['plain', '+a = ', 'bold', 'g(b)', 'cell']
+
+    :param words: the changed words as (start, end) pairs of the positions in the line
+    :param formats: the formats of the unchanged words, the changed words and the cell
+    :return:
+    """
+    plain_format, changed_format, cell_format = formats
+    arguments = []
+    position = 0
+    for start, end in words:
+        if start > position:
+            arguments += (plain_format, line[position:start])
+        arguments += (changed_format, line[start:end])
+        position = end
+    if position < len(line):
+        arguments += (plain_format, line[position:])
+    arguments.append(cell_format)
+    return arguments
+
+
+class DiffSheet:
+    """A part of the diff, that is one Diff worksheet, listed in the index of the Summary sheet."""
+
+    def __init__(self, file_name: str, name: str, worksheet, current_file: str):
+        self.file_name = file_name
+        self.name = name
+        self.worksheet = worksheet
+        self.first_file = current_file
+        self.last_file = current_file
+        self.row_count = 0
+
+
+class ExcelWriter(ReportWriter):
+    """
+    Write the report into Excel workbooks in the constant memory mode of xlsxwriter.
+
+    The rows are flushed to disk as soon as the next row is started, so the rows of each worksheet must be written in order.
+    The diff spills over to 'Diff (2)', 'Diff (3)', ... sheets when a sheet is full,
+    and into further workbooks when the workbook limits are reached at a file boundary.
+    """
+
+    def __init__(self, output_file_path: str, title: str,
+                 max_rows: int = MAX_ROWS, max_workbook_rows: int = 0, max_workbook_files: int = 0):
+        """
+
+        :param output_file_path: the path of the first workbook, that contains the Summary sheet.
+        :param title: the text of the first row of each sheet.
+        :param max_rows: the number of rows of a Diff sheet.
+        :param max_workbook_rows: the number of diff rows after which the next file starts a new workbook, 0 for no limit.
+        :param max_workbook_files: the number of files after which the next file starts a new workbook, 0 for no limit.
+        """
+        self.output_file_paths = [output_file_path]
+        self.title = title
+        self.max_rows = max(3, min(max_rows, MAX_ROWS))
+        self.max_workbook_rows = max_workbook_rows
+        self.max_workbook_files = max_workbook_files
+
+        self.workbook = xlsxwriter.Workbook(output_file_path, {'constant_memory': True})
+        self.format = Format(self.workbook)
+        self.summary = self.workbook.add_worksheet('Summary')
+        self.summary.set_column(0, 0, 60)
+        self.summary.write_string(0, 0, title, self.format.BASIC)
+        self.summary_row_index = 2
+
+        self.diff_workbook = self.workbook
+        self.diff_format = self.format
+        self.diff_sheets = []
+        self.worksheet = None
+        self.current_file = ''
+        self.row_index = 0
+        self.workbook_row_count = 0
+        self.workbook_file_count = 0
+
+    # Summary
+
+    def write_file_summary(self, path: str, change: int, plus: int, minus: int) -> None:
+        worksheet, row_index, f = self.summary, self.summary_row_index, self.format
+        worksheet.write_string(row_index, 0, path, f.BASIC)
+        worksheet.write_number(row_index, 1, change, f.BASIC)
+        args = []
+        if plus > 0:
+            args.append(f.FORE_GREEN)
+            args.append('+' * plus)
+        if minus > 0:
+            args.append(f.FORE_RED)
+            args.append('-' * minus)
+
+        if len(args) > 2:
+            worksheet.write_rich_string(row_index, 2, *args)
+        elif args:
+            worksheet.write_string(row_index, 2, args[1], args[0])
+        self.summary_row_index += 1
+
+    def write_binary_summary(self, path: str, before: str, after: str) -> None:
+        worksheet, row_index, f = self.summary, self.summary_row_index, self.format
+        worksheet.write_string(row_index, 0, path, f.BASIC)
+        worksheet.write_string(row_index, 1, 'Bin', f.BASIC)
+        worksheet.write_rich_string(
+            row_index, 2,
+            f.FORE_RED, before,
+            f.BASIC, ' -> ',
+            f.GREEN, after,
+            f.BASIC, ' bytes'
+        )
+        self.summary_row_index += 1
+
+    def write_omitted_summary(self, path: str, change: int) -> None:
+        worksheet, row_index, f = self.summary, self.summary_row_index, self.format
+        worksheet.write_string(row_index, 0, path, f.BASIC)
+        worksheet.write_number(row_index, 1, change, f.BASIC)
+        worksheet.write_string(row_index, 2, f'omitted ({change} lines)', f.BASIC)
+        self.summary_row_index += 1
+
+    def write_summary_text(self, line: str) -> None:
+        self.summary.write_string(self.summary_row_index, 0, line, self.format.BASIC)
+        self.summary_row_index += 1
+
+    # Diff
+
+    def write_file(self, file_diff) -> None:
+        self.write_file_header(file_diff.header_lines[0])
+        for line in file_diff.header_lines[1:]:
+            self.write_header(line)
+
+    def write_hunk(self, hunk) -> None:
+        self.write_hunk_header(hunk.navigation, hunk.part_name)
+
+    def write_line(self, diff_line, commit=None) -> None:
+        kind = diff_line.kind
+        if kind == ' ':
+            self.write_context_line(diff_line.before_line_number, diff_line.after_line_number, diff_line.line)
+        elif kind == '+':
+            self.write_added_line(commit, diff_line.after_line_number, diff_line.line, diff_line.words)
+        elif kind == '-':
+            self.write_removed_line(commit, diff_line.before_line_number, diff_line.line, diff_line.words)
+        else:
+            self.write_text_line(diff_line.line)
+
+    def write_file_header(self, line: str) -> None:
+        """Write the 'diff --git' line that starts the diff of a file."""
+        self.current_file = line
+        if not self.diff_sheets:
+            self._add_diff_sheet()
+        elif (self.max_workbook_files and self.workbook_file_count >= self.max_workbook_files
+                or self.max_workbook_rows and self.workbook_row_count >= self.max_workbook_rows):
+            self._add_diff_workbook()
+        self.workbook_file_count += 1
+        row_index = self._next_row(1)
+        self.worksheet.write_string(row_index, code_column.index, line, self.diff_format.BOLD)
+        diff_sheet = self.diff_sheets[-1]
+        if not diff_sheet.first_file:
+            diff_sheet.first_file = line
+        diff_sheet.last_file = line
+
+    def write_header(self, line: str) -> None:
+        """Write a line between the 'diff --git' line and the first hunk."""
+        f = self.diff_format
+        if line.startswith('---'):
+            cell_format = f.FORE_RED_BOLD
+        elif line.startswith('+++'):
+            cell_format = f.FORE_GREEN_BOLD
+        else:
+            cell_format = f.WRAP_BASIC
+        self.worksheet.write_string(self._next_row(), code_column.index, line, cell_format)
+
+    def write_hunk_header(self, navigation: str, part_name: str) -> None:
+        row_index = self._next_row(1)
+        f = self.diff_format
+        if part_name is None or part_name.isspace() or part_name == '':
+            self.worksheet.write_string(row_index, code_column.index, str(navigation), f.FORE_BLUE)
+        else:
+            self.worksheet.write_rich_string(row_index, code_column.index, f.FORE_BLUE, str(navigation), f.BASIC, str(part_name))
+
+    def write_added_line(self, commit, after_line_number: int, line: str, words: tuple = None) -> None:
+        """
+
+        :param words: the changed words of the line, which are shown in bold, as (start, end) pairs of the positions in the line
+        """
+        row_index = self._next_row()
+        worksheet, f = self.worksheet, self.diff_format
+        self._write_commit(row_index, commit, f.GREEN)
+        worksheet.write_string(row_index, before_line_num_column.index, '', f.GREEN)
+        worksheet.write_number(row_index, after_line_num_column.index, after_line_number, f.GREEN)
+        if words and len(line) <= MAX_STRING_LENGTH:
+            worksheet.write_rich_string(row_index, code_column.index, *rich_string_arguments(line, words, f.ADDED_WORDS))
+        else:
+            worksheet.write_string(row_index, code_column.index, line, f.WRAP_GREEN)
+
+    def write_removed_line(self, commit, before_line_number: int, line: str, words: tuple = None) -> None:
+        """
+
+        :param words: the changed words of the line, which are shown in bold, as (start, end) pairs of the positions in the line
+        """
+        row_index = self._next_row()
+        worksheet, f = self.worksheet, self.diff_format
+        self._write_commit(row_index, commit, f.RED)
+        worksheet.write_number(row_index, before_line_num_column.index, before_line_number, f.RED)
+        worksheet.write_string(row_index, after_line_num_column.index, '', f.RED)
+        if words and len(line) <= MAX_STRING_LENGTH:
+            worksheet.write_rich_string(row_index, code_column.index, *rich_string_arguments(line, words, f.REMOVED_WORDS))
+        else:
+            worksheet.write_string(row_index, code_column.index, line, f.WRAP_RED)
+
+    def write_context_line(self, before_line_number: int, after_line_number: int, line: str) -> None:
+        row_index = self._next_row()
+        worksheet, f = self.worksheet, self.diff_format
+        worksheet.write_number(row_index, before_line_num_column.index, before_line_number, f.BASIC)
+        worksheet.write_number(row_index, after_line_num_column.index, after_line_number, f.BASIC)
+        worksheet.write_string(row_index, code_column.index, line, f.WRAP_BASIC)
+
+    def write_text_line(self, line: str) -> None:
+        self.worksheet.write_string(self._next_row(), code_column.index, line, self.diff_format.WRAP_BASIC)
+
+    def _write_commit(self, row_index: int, commit, cell_format) -> None:
+        """Write the commit columns of an added or a removed line, blank when the line is not blamed."""
+        worksheet = self.worksheet
+        if commit is None:
+            values = ('', '', '', '')
+        else:
+            values = (commit.short_hash, commit.author, commit.datetime, commit.subject)
+        for column, value in zip((commit_hash_column, commit_author_column, commit_datetime_column, commit_comment_column), values):
+            worksheet.write_string(row_index, column.index, value, cell_format)
+
+    def _next_row(self, blank_rows: int = 0) -> int:
+        self.row_index += blank_rows
+        if self.row_index >= self.max_rows:
+            self._add_diff_sheet()
+            self.row_index += blank_rows
+        row_index = self.row_index
+        self.row_index += 1
+        self.diff_sheets[-1].row_count += 1
+        self.workbook_row_count += 1
+        return row_index
+
+    def _add_diff_sheet(self) -> None:
+        number = len(self.diff_sheets) + 1
+        name = 'Diff' if number == 1 else f'Diff ({number})'
+        worksheet = self.diff_workbook.add_worksheet(name)
+        for column in columns:
+            worksheet.set_column(column.index, column.index, column.width)
+        worksheet.write_string(0, 0, self.title, self.diff_format.BASIC)
+        self.diff_sheets.append(DiffSheet(os.path.basename(self.output_file_paths[-1]), name, worksheet, self.current_file))
+        self.worksheet = worksheet
+        self.row_index = 1
+
+    def _add_diff_workbook(self) -> None:
+        if self.diff_workbook is not self.workbook:
+            self.diff_workbook.close()
+        root, ext = os.path.splitext(self.output_file_paths[0])
+        output_file_path = f'{root}_{len(self.output_file_paths) + 1}{ext}'
+        self.output_file_paths.append(output_file_path)
+        self.diff_workbook = xlsxwriter.Workbook(output_file_path, {'constant_memory': True})
+        self.diff_format = Format(self.diff_workbook)
+        self.workbook_row_count = 0
+        self.workbook_file_count = 0
+        self._add_diff_sheet()
+
+    def _write_index(self) -> None:
+        worksheet, f = self.summary, self.format
+        row_index = self.summary_row_index + 1
+        worksheet.write_string(row_index, 0, 'Index', f.BOLD)
+        for diff_sheet in self.diff_sheets:
+            row_index += 1
+            if diff_sheet.file_name == os.path.basename(self.output_file_paths[0]):
+                url = f"internal:'{diff_sheet.name}'!A1"
+                text = diff_sheet.name
+            else:
+                url = f"external:{diff_sheet.file_name}#'{diff_sheet.name}'!A1"
+                text = f'{diff_sheet.file_name} {diff_sheet.name}'
+            worksheet.write_url(row_index, 0, url, string=text)
+            worksheet.write_number(row_index, 1, diff_sheet.row_count, f.BASIC)
+            worksheet.write_string(row_index, 2, diff_sheet.first_file, f.BASIC)
+            worksheet.write_string(row_index, 3, diff_sheet.last_file, f.BASIC)
+        self.summary_row_index = row_index + 1
+
+    def close(self) -> list[str]:
+        """
+        Write the index of the Diff sheets, if the diff spilled over, and close the workbooks.
+
+        :return: the paths of the written workbooks
+        """
+        if len(self.diff_sheets) > 1:
+            self._write_index()
+        if self.diff_workbook is not self.workbook:
+            self.diff_workbook.close()
+        self.workbook.close()
+        return self.output_file_paths
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
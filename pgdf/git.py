@@ -1,48 +1,409 @@
+import io
 import os
 import subprocess
+import threading
+import time
 
+from pgdf import profiler
+from pgdf.log import CommitLog
 
-def get_label() -> str:
-    result = subprocess.run(['git', 'rev-parse', '--show-toplevel'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if result.returncode != 0:
-        print(result.stderr.decode('utf-8'))
-        exit(result.returncode)
-    path = result.stdout.decode('utf-8')
-    path = path.strip()
-    return os.path.basename(path)
-
-
-def get_summary(revision_1: str, revision_2: str, paths: list[str]) -> str:
-    result = subprocess.run(['git', 'diff', '--stat=200', revision_1, revision_2] + paths, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if result.returncode != 0:
-        print(result.stderr.decode('utf-8'))
-        exit(result.returncode)
-    result_text = result.stdout.decode('utf-8')
-    return result_text
-
-
-def get_diff(revision_1: str, revision_2: str, paths: list[str]) -> str:
-    result = subprocess.run(['git', 'diff', revision_1, revision_2] + paths, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if result.returncode != 0:
-        print(result.stderr.decode('utf-8'))
-        exit(result.returncode)
-    result_text = result.stdout.decode('utf-8')
-    return result_text
-
-
-def get_blame(revision: str, file_path: str, start_line_number: int, volume: int) -> str:
-    result = subprocess.run(['git', 'blame', '-L', f'{start_line_number},+{volume}', revision, '--', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if result.returncode != 0:
-        print(result.stderr.decode('utf-8'))
-        exit(result.returncode)
-    result_text = result.stdout.decode('utf-8')
-    return result_text
-
-
-def get_log(revision: str):
-    result = subprocess.run(['git', 'show', '--format="%s"', '-s', revision], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if result.returncode != 0:
-        print(result.stderr.decode('utf-8'))
-        exit(result.returncode)
-    result_text = result.stdout.decode('utf-8')
-    return result_text
+
+PIPE_BUFFER_SIZE = 4096
+"""Requests up to this size are written to git at once, larger ones are fed from a thread while the responses are read."""
+
+
+class GitError(Exception):
+    """Raised when a git command fails or git cannot find a requested object."""
+
+    def __init__(self, message: str, returncode: int = 1, stderr: str = ''):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class CatFileWorker:
+    """
+    Long-lived git cat-file process that answers object requests through its pipes.
+
+    The requests of one call are pipelined: they are all sent before the responses are read,
+    so asking for many objects costs one round trip rather than one per object.
+    """
+
+    def __init__(self, option: str, cwd: str = None):
+        """
+
+        :param option: '--batch' to read the object contents or '--batch-check' to read only the object info.
+        :param cwd: the repository directory
+        """
+        self.option = option
+        self.cwd = cwd
+        self._process = None
+        self._lock = threading.Lock()
+
+    def request(self, names: list[str]) -> list:
+        """
+        Look up the objects.
+
+        :param names: object names such as commit hashes, 'HEAD' or 'v1.0:path/to/file'
+        :return: (object hash, type, size, contents) for each name, the contents is None for --batch-check.
+                 None for the names that do not exist.
+        """
+        if not names:
+            return []
+        payload = ''.join(name + '\n' for name in names).encode('utf-8')
+        with self._lock, profiler.span('git', f'cat-file {self.option}', objects=len(names)) as details:
+            process = self._start()
+            writer = None
+            if len(payload) <= PIPE_BUFFER_SIZE:
+                process.stdin.write(payload)
+                process.stdin.flush()
+            else:
+                writer = threading.Thread(target=self._write, args=(process.stdin, payload), daemon=True)
+                writer.start()
+            try:
+                results = [self._read(process.stdout) for _ in names]
+                details['bytes'] = sum(result[2] for result in results if result is not None and result[3] is not None)
+                return results
+            except BaseException:
+                # the responses that are not read yet would be taken as the answers of the next request
+                self._kill()
+                raise
+            finally:
+                if writer is not None:
+                    writer.join()
+
+    @staticmethod
+    def _write(stdin, payload: bytes) -> None:
+        try:
+            stdin.write(payload)
+            stdin.flush()
+        except (OSError, ValueError):
+            # the process was killed while the request was fed, and the reader raises the error
+            pass
+
+    def _read(self, stdout):
+        header = stdout.readline()
+        if not header:
+            raise GitError(f'git cat-file {self.option} exited unexpectedly.')
+        header = header.rstrip(b'\n')
+        # the name can contain spaces, like 'HEAD:dir name/file' or 'main@{1 hour}'
+        if header.endswith(b' missing') or header.endswith(b' ambiguous'):
+            return None
+        fields = header.rsplit(b' ', 2)
+        if len(fields) != 3 or not fields[2].isdigit():
+            raise GitError(f'git cat-file {self.option} returned an unexpected header: {header.decode("utf-8", "replace")}')
+        object_hash, object_type, size = fields[0].decode('ascii'), fields[1].decode('ascii'), int(fields[2])
+        contents = None
+        if self.option == '--batch':
+            contents = stdout.read(size + 1)[:-1]
+        return object_hash, object_type, size, contents
+
+    def _start(self):
+        if self._process is None:
+            profiler.count('subprocesses')
+            self._process = subprocess.Popen(
+                ['git', 'cat-file', self.option], cwd=self.cwd,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        return self._process
+
+    def _kill(self) -> None:
+        """Stop the process out of turn, the next request starts a new one."""
+        process, self._process = self._process, None
+        if process is not None:
+            process.kill()
+            process.wait()
+            for pipe in (process.stdin, process.stdout):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+
+class GitRepository:
+    """
+    Git repository that runs all the git queries of a report.
+
+    The cat-file workers are started on first use and reused by every query until the repository is closed.
+    The objects asked by their full hashes are read from the object store in process when it can be read,
+    and the other names and the objects that are not found there are asked to the cat-file workers.
+    """
+
+    def __init__(self, path: str = None, object_store: bool = True):
+        """
+
+        :param path: the repository directory, the current directory if it is None.
+        :param object_store: False to ask all the objects to git cat-file, instead of reading the object store in process.
+        """
+        self.path = path
+        self._batch = CatFileWorker('--batch', path)
+        self._batch_check = CatFileWorker('--batch-check', path)
+        self._object_store = None if object_store else False
+        self._object_store_lock = threading.Lock()
+
+    def __enter__(self) -> 'GitRepository':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._batch.close()
+        self._batch_check.close()
+        if self._object_store:
+            self._object_store.close()
+            self._object_store = None
+
+    def get_object_store(self):
+        """
+        Return the object store of the repository, opened on first use.
+
+        :return: None if it cannot be read in process: the repository is not SHA-1, it has replace refs, or it is disabled.
+        """
+        with self._object_store_lock:
+            if self._object_store is None:
+                self._object_store = self._open_object_store() or False
+            return self._object_store or None
+
+    def _open_object_store(self):
+        try:
+            objects_dir, common_dir, object_format = self.run(
+                ['rev-parse', '--git-path', 'objects', '--git-common-dir', '--show-object-format']
+            ).splitlines()
+        except (GitError, ValueError):
+            return None
+        if object_format != 'sha1' or os.environ.get('GIT_NO_REPLACE_OBJECTS') is None and self._has_replace_refs(common_dir):
+            return None
+        # imported here, so that a command that never reads an object does not load it
+        from pgdf.odb import ObjectStore
+        return ObjectStore(os.path.join(self.path or '', objects_dir))
+
+    def _has_replace_refs(self, common_dir: str) -> bool:
+        """Return True if git may replace objects, which the object store does not do."""
+        common_dir = os.path.join(self.path or '', common_dir)
+        replace_dir = os.path.join(common_dir, 'refs', 'replace')
+        if os.path.isdir(replace_dir) and any(files for _, _, files in os.walk(replace_dir)):
+            return True
+        packed_refs_path = os.path.join(common_dir, 'packed-refs')
+        if os.path.exists(packed_refs_path):
+            with open(packed_refs_path, 'rb') as f:
+                return b' refs/replace/' in f.read()
+        return False
+
+    def _request(self, worker: CatFileWorker, names: list[str], contents: bool) -> list:
+        """Look up the names in the object store, and ask the rest to the worker in one request."""
+        object_store = self.get_object_store()
+        if object_store is None:
+            return worker.request(names)
+        from pgdf.odb import ObjectStoreError
+        results = [None] * len(names)
+        rest = []
+        with profiler.span('odb', 'read' if contents else 'info', objects=len(names)):
+            for i, name in enumerate(names):
+                try:
+                    results[i] = object_store.lookup(name, contents)
+                except (OSError, ValueError, IndexError, ObjectStoreError):
+                    results[i] = None
+                if results[i] is None:
+                    rest.append(i)
+        profiler.count('objects read in process', len(names) - len(rest))
+        for i, found in zip(rest, worker.request([names[i] for i in rest])):
+            results[i] = found
+        return results
+
+    def run(self, args: list[str]) -> str:
+        """
+        Run a git command and return its standard output.
+
+        The output is decoded in the same way as stream() does, so the lines that are not UTF-8, like the source lines
+        in the output of git blame, do not fail the report.
+
+        :param args: the git arguments without 'git'
+        :return:
+        """
+        profiler.count('subprocesses')
+        with profiler.span('git', args[0]) as details:
+            result = subprocess.run(['git'] + args, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            details['bytes'] = len(result.stdout)
+        if result.returncode != 0:
+            stderr = result.stderr.decode('utf-8', 'replace')
+            raise GitError(f'git {args[0]} failed: {stderr.strip()}', result.returncode, stderr)
+        return result.stdout.decode('utf-8', 'replace')
+
+    def stream(self, args: list[str]):
+        """
+        Run a git command and yield its standard output line by line while it is running.
+
+        The output is decoded incrementally, so the memory does not grow with the size of the output.
+
+        :param args: the git arguments without 'git'
+        :return: the lines without the line endings
+        """
+        profiler.count('subprocesses')
+        start = time.perf_counter()
+        size = 0
+        process = subprocess.Popen(['git'] + args, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for line in io.TextIOWrapper(process.stdout, encoding='utf-8', errors='replace', newline='\n'):
+                size += len(line)
+                line = line[:-1] if line.endswith('\n') else line
+                yield line[:-1] if line.endswith('\r') else line
+            stderr = process.stderr.read().decode('utf-8', 'replace')
+            if process.wait() != 0:
+                raise GitError(f'git {args[0]} failed: {stderr.strip()}', process.returncode, stderr)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            current_profiler = profiler.get_profiler()
+            if current_profiler is not None:
+                # the span includes the time that the caller spends on the lines while git is running
+                current_profiler.add('git', args[0], start, time.perf_counter(), {'bytes': size, 'streamed': True})
+
+    def read_objects(self, names: list[str]) -> list:
+        """Read the objects from the object store or through the git cat-file --batch worker."""
+        return self._request(self._batch, names, True)
+
+    def check_objects(self, names: list[str]) -> list:
+        """Read the object hashes, types and sizes from the object store or through the git cat-file --batch-check worker."""
+        return self._request(self._batch_check, names, False)
+
+    def resolve_commit(self, revision: str) -> str:
+        """Return the full hash of the commit that the revision points to."""
+        found = self.check_objects([f'{revision}^{{commit}}'])[0]
+        if found is None:
+            raise GitError(f'{revision} is not a commit.')
+        return found[0]
+
+    def get_numstat(self, revision_1: str, revision_2: str, paths: list[str]) -> str:
+        return self.run(['diff', '--numstat', '-z', revision_1, revision_2, '--'] + paths)
+
+    def get_raw_diff(self, revision_1: str, revision_2: str, paths: list[str]) -> str:
+        return self.run(['diff', '--raw', '-z', '--no-abbrev', revision_1, revision_2, '--'] + paths)
+
+    def get_diff(self, revision_1: str, revision_2: str, paths: list[str]) -> str:
+        return self.run(['diff', revision_1, revision_2, '--'] + paths)
+
+    def iter_diff(self, revision_1: str, revision_2: str, paths: list[str]):
+        return self.stream(['diff', revision_1, revision_2, '--'] + paths)
+
+    def iter_word_diff(self, revision_1: str, revision_2: str, paths: list[str]):
+        """Stream git diff --word-diff=porcelain, whose files and hunks are the same as the ones of iter_diff."""
+        return self.stream(['diff', '--word-diff=porcelain', revision_1, revision_2, '--'] + paths)
+
+    def get_file_blame(self, revision: str, file_path: str, line_ranges: list[tuple[int, int]], boundary: str = None) -> str:
+        """
+        Blame all the line ranges of a file in one git blame --porcelain call.
+
+        The source lines are not UTF-8 in every file, and the bytes that are not are replaced.
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> with open(os.path.join(directory, 'latin1.txt'), 'wb') as f:
+        ...     _ = f.write(b'caf\\xe9\\n')
+        >>> git = ['git', '-c', 'user.name=Kenji Otsuka', '-c', 'user.email=kenji@example.com', '-c', 'commit.gpgsign=false']
+        >>> _ = subprocess.run(git + ['init', '-q'], cwd=directory, check=True)
+        >>> _ = subprocess.run(git + ['add', 'latin1.txt'], cwd=directory, check=True)
+        >>> _ = subprocess.run(git + ['commit', '-q', '-m', 'Add latin1.txt'], cwd=directory, check=True)
+        >>> with GitRepository(directory) as repository:
+        ...     text = repository.get_file_blame('HEAD', 'latin1.txt', [(1, 1)])
+        >>> text.splitlines()[-1]
+        '\\tcaf\\ufffd'
+        >>> shutil.rmtree(directory)
+
+        :param revision:
+        :param file_path:
+        :param line_ranges: pairs of the start line number and the volume
+        :param boundary: the commit where git blame stops walking the history, the lines older than it are blamed on it as boundary lines.
+                         None to walk the whole history.
+        :return:
+        """
+        args = ['blame', '--porcelain']
+        for start_line_number, volume in line_ranges:
+            args += ['-L', f'{start_line_number},+{volume}']
+        revision_range = revision if boundary is None else f'{boundary}..{revision}'
+        return self.run(args + [revision_range, '--', file_path])
+
+    def get_merge_base(self, revision_1: str, revision_2: str):
+        """Return the full hash of the best common ancestor of the revisions, None if they have no common history."""
+        try:
+            return self.run(['merge-base', revision_1, revision_2]).strip() or None
+        except GitError as e:
+            if e.returncode == 1 and not e.stderr.strip():
+                return None
+            raise
+
+    def is_ancestor(self, commit_hash_1: str, commit_hash_2: str) -> bool:
+        """Return True if the first commit is the second commit or one of its ancestors."""
+        try:
+            self.run(['merge-base', '--is-ancestor', commit_hash_1, commit_hash_2])
+            return True
+        except GitError as e:
+            if e.returncode == 1 and not e.stderr.strip():
+                return False
+            raise
+
+    def get_touched_paths(self, commit_hash_1: str, commit_hash_2: str) -> set[str]:
+        """
+        Return the paths of the files changed by the commits after the first commit up to the second commit.
+
+        Both paths of a renamed file are returned, and the files that a merge changed from all its parents.
+        """
+        text = self.run(['log', '--format=', '--name-only', '--no-renames', '--cc', '-z', f'{commit_hash_1}..{commit_hash_2}'])
+        return set(text.split('\0')) - {''}
+
+    def get_abbrev_length(self, revision: str) -> int:
+        return len(self.run(['rev-parse', '--short', revision]).strip())
+
+
+class CommitLogResolver:
+    """
+    Resolve the commit logs through the git cat-file --batch worker of the repository.
+
+    Commit logs that are already known, for example from the metadata of git blame --porcelain,
+    can be added beforehand so that they are never asked to git.
+    The commit logs read from git are stored in the cache, if it is given, and looked up there first next time.
+    """
+
+    def __init__(self, repository: GitRepository, cache=None):
+        self.repository = repository
+        self.cache = cache
+        self.commit_logs = {}
+
+    def add(self, commit_log: CommitLog) -> None:
+        self.commit_logs.setdefault(commit_log.commit_hash, commit_log)
+
+    def get(self, commit_hash: str) -> CommitLog:
+        commit_log = self.commit_logs.get(commit_hash)
+        if commit_log is None:
+            commit_log = self.resolve([commit_hash])[commit_hash]
+        return commit_log
+
+    def resolve(self, commit_hashes) -> dict[str, CommitLog]:
+        """
+        Return the commit logs of the commit hashes, the unknown ones are read in one pipelined request.
+
+        :param commit_hashes:
+        :return:
+        """
+        unknown_hashes = [commit_hash for commit_hash in dict.fromkeys(commit_hashes) if commit_hash not in self.commit_logs]
+        if self.cache is not None:
+            for commit_hash in unknown_hashes:
+                commit_log = self.cache.get_commit_log(commit_hash)
+                if commit_log is not None:
+                    self.commit_logs[commit_hash] = commit_log
+            unknown_hashes = [commit_hash for commit_hash in unknown_hashes if commit_hash not in self.commit_logs]
+        for commit_hash, found in zip(unknown_hashes, self.repository.read_objects(unknown_hashes)):
+            if found is None or found[1] != 'commit':
+                raise GitError(f'{commit_hash} is not a commit.')
+            commit_log = self.commit_logs[commit_hash] = CommitLog.parse(commit_hash, found[3])
+            if self.cache is not None:
+                self.cache.put_commit_log(commit_log)
+        return {commit_hash: self.commit_logs[commit_hash] for commit_hash in commit_hashes}
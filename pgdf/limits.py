@@ -0,0 +1,196 @@
+import posixpath
+from fnmatch import fnmatchcase
+
+from pgdf.summary import FileSummary, Summary
+
+
+def glob_pathspec(pattern: str, magic: str = 'glob') -> str:
+    """
+    Convert a glob into a git pathspec that matches the same paths as matches_glob.
+
+    A pattern without '/' is matched in all the directories.
+
+    >>> glob_pathspec('*.min.js', 'exclude,glob')
+    ':(exclude,glob)**/*.min.js'
+    >>> glob_pathspec('vendor/')
+    ':(glob)vendor/'
+
+    :param pattern: the glob
+    :param magic: the magic words of the pathspec
+    :return:
+    """
+    return f':({magic}){pattern if "/" in pattern else "**/" + pattern}'
+
+
+def to_pathspecs(include: list[str] = None, exclude: list[str] = None) -> list[str]:
+    """
+    Convert the globs of the files to compare and of the files to leave out into pathspecs, so that git diff does not read the others.
+
+    git compares the files that match any of the pathspecs, so the include globs are passed only when no path is given.
+
+    >>> to_pathspecs(['*.py'], ['*.min.js', 'vendor/'])
+    [':(glob)**/*.py', ':(exclude,glob)**/*.min.js', ':(exclude,glob)vendor/']
+    >>> to_pathspecs()
+    []
+
+    :param include: the globs of the files to compare
+    :param exclude: the globs of the files to leave out
+    :return:
+    """
+    return ([glob_pathspec(pattern) for pattern in include or []]
+            + [glob_pathspec(pattern, 'exclude,glob') for pattern in exclude or []])
+
+
+def matches_glob(path: str, patterns: list[str]) -> bool:
+    """
+    Check if the path matches a pattern of the generated files or of the files to compare, as git matches a glob pathspec.
+
+    A pattern without '/' is matched against the file name, like a pattern of .gitignore, and one with '/' against the whole path,
+    where '*' does not match '/' and '**' matches any directories. A pattern without wildcards matches the files under it too.
+
+    >>> matches_glob('web/package-lock.json', ['package-lock.json'])
+    True
+    >>> matches_glob('dist/app.min.js', ['*.min.js'])
+    True
+    >>> matches_glob('src/app.js', ['dist/*', '*.min.js'])
+    False
+    >>> [matches_glob('docs/api/a.md', [pattern]) for pattern in ['docs/*', 'docs/**/*.md', 'docs/', 'doc']]
+    [False, True, True, False]
+
+    :param path: the path from the top of the repository
+    :param patterns:
+    :return:
+    """
+    name = posixpath.basename(path)
+    for pattern in patterns:
+        if '/' not in pattern:
+            if fnmatchcase(name, pattern):
+                return True
+            continue
+        pattern = pattern.rstrip('/')
+        if not any(c in pattern for c in '*?['):
+            if path == pattern or path.startswith(pattern + '/'):
+                return True
+        elif match_names(path.split('/'), pattern.split('/')):
+            return True
+    return False
+
+
+def match_names(names: list[str], patterns: list[str]) -> bool:
+    """
+    Match the names of a path with the names of a pattern, a '**' matches any number of names.
+
+    >>> match_names(['a', 'b', 'c.py'], ['**', '*.py'])
+    True
+    >>> match_names(['a', 'b', 'c.py'], ['a', '*.py'])
+    False
+    """
+    if not patterns:
+        return not names
+    if patterns[0] == '**':
+        return any(match_names(names[i:], patterns[1:]) for i in range(len(names) + 1))
+    return bool(names) and fnmatchcase(names[0], patterns[0]) and match_names(names[1:], patterns[1:])
+
+
+class FileLimits:
+    """
+    The files to compare and the limits over which a text file is omitted from the diff,
+    checked against git diff --numstat before the diff is read.
+
+    The files that match none of the include patterns are left out of the report.
+    The omitted files are listed in the Summary with the numbers of their changed lines,
+    and only the other files are diffed and blamed.
+    """
+
+    def __init__(self, max_lines: int = 0, max_blob_size: int = 0, generated_patterns: list[str] = None,
+                 include_patterns: list[str] = None):
+        """
+
+        :param max_lines: the number of the changed lines of a file over which it is omitted, 0 for no limit
+        :param max_blob_size: the size in bytes of a blob of a file at either revision over which it is omitted, 0 for no limit
+        :param generated_patterns: the patterns of the generated files, which are always omitted
+        :param include_patterns: the patterns of the files to compare, empty to compare all the files
+        """
+        self.max_lines = max_lines
+        self.max_blob_size = max_blob_size
+        self.generated_patterns = list(generated_patterns or [])
+        self.include_patterns = list(include_patterns or [])
+
+    def __bool__(self) -> bool:
+        return bool(self.max_lines or self.max_blob_size or self.generated_patterns or self.include_patterns)
+
+    def is_included(self, file_summary: FileSummary) -> bool:
+        """
+        Check if a file matches an include pattern at either revision, all the files are included without the patterns.
+
+        >>> limits = FileLimits(include_patterns=['*.py', 'docs/*'])
+        >>> limits.is_included(FileSummary('src/a.py', 1, 0, before_path='src/a.py', after_path='src/a.py'))
+        True
+        >>> limits.is_included(FileSummary('docs/{a.txt => a.md}', 1, 0, before_path='docs/a.txt', after_path='docs/a.md'))
+        True
+        >>> limits.is_included(FileSummary('src/a.js', 1, 0, before_path='src/a.js', after_path='src/a.js'))
+        False
+
+        :param file_summary:
+        :return:
+        """
+        if not self.include_patterns:
+            return True
+        return any(path is not None and matches_glob(path, self.include_patterns)
+                   for path in (file_summary.before_path, file_summary.after_path))
+
+    def leave_out(self, summary: Summary) -> list[FileSummary]:
+        """
+        Remove the file summaries that match none of the include patterns.
+
+        :param summary: the summary from git diff --numstat
+        :return: the removed file summaries
+        """
+        removed = [file_summary for file_summary in summary.file_summaries if not self.is_included(file_summary)]
+        summary.remove(removed)
+        return removed
+
+    def is_over(self, file_summary: FileSummary) -> bool:
+        """
+        Check if a file is over the limits, the binary files are never omitted, as their diffs cost nothing.
+
+        The sizes of the file summary must be set when max_blob_size is set.
+
+        >>> limits = FileLimits(max_lines=1000, max_blob_size=1 << 20, generated_patterns=['*.lock'])
+        >>> limits.is_over(FileSummary('a.py', 900, 200))
+        True
+        >>> limits.is_over(FileSummary('a.py', 10, 2, before_size=2 << 20))
+        True
+        >>> limits.is_over(FileSummary('web/{old => new}/yarn.lock', 1, 0, before_path='web/old/yarn.lock', after_path='web/new/yarn.lock'))
+        True
+        >>> limits.is_over(FileSummary('a.py', 10, 2, before_path='a.py', after_path='a.py'))
+        False
+
+        :param file_summary:
+        :return:
+        """
+        if file_summary.binary:
+            return False
+        if self.max_lines and file_summary.change_count > self.max_lines:
+            return True
+        if self.max_blob_size and max(file_summary.before_size, file_summary.after_size) > self.max_blob_size:
+            return True
+        return any(path is not None and matches_glob(path, self.generated_patterns)
+                   for path in (file_summary.before_path, file_summary.after_path))
+
+    def omit(self, summary: Summary) -> list[FileSummary]:
+        """
+        Mark the file summaries over the limits as omitted.
+
+        :param summary: the summary from git diff --numstat, with the sizes of the text files when max_blob_size is set
+        :return: the omitted file summaries
+        """
+        omitted = [file_summary for file_summary in summary.file_summaries if self.is_over(file_summary)]
+        for file_summary in omitted:
+            summary.omit(file_summary)
+        return omitted
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,75 @@
+import codecs
+import time
+
+
+def format_datetime(epoch: int, timezone: str) -> str:
+    """
+    Format a unix time and a timezone offset in the same way as the default git blame output.
+
+    >>> format_datetime(1572876240, '+0900')
+    '2019-11-04 23:04:00 +0900'
+    >>> format_datetime(1572876240, '-0130')
+    '2019-11-04 12:34:00 -0130'
+
+    :param epoch: seconds since the epoch
+    :param timezone: offset like '+0900'
+    :return:
+    """
+    offset = (int(timezone[1:3]) * 60 + int(timezone[3:5])) * 60
+    if timezone.startswith('-'):
+        offset = -offset
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch + offset)) + ' ' + timezone
+
+
+class CommitLog:
+    def __init__(self, commit_hash, author, datetime, subject):
+        self.commit_hash = commit_hash
+        self.author = author
+        self.datetime = datetime
+        self.subject = subject
+
+    @staticmethod
+    def parse(commit_hash, data: bytes) -> 'CommitLog':
+        """
+        Parse a raw commit object, as printed by git cat-file, and return CommitLog object.
+
+        >>> log = CommitLog.parse('0e2b5b3c', b'tree 4b825dc6\\nparent 8e30324f\\nauthor Kenji Otsuka <kenji@example.com> 1572876240 +0900\\ncommitter Kenji Otsuka <kenji@example.com> 1572876240 +0900\\n\\nAdd blame\\nsupport\\n\\nDetails.\\n')
+        >>> (log.author, log.datetime, log.subject)
+        ('Kenji Otsuka', '2019-11-04 23:04:00 +0900', 'Add blame support')
+
+        An unknown encoding in the header is read as UTF-8.
+
+        >>> CommitLog.parse('0e2b5b3c', b'tree 4b825dc6\\nauthor Kenji Otsuka <kenji@example.com> 1572876240 +0900\\nencoding utf-9\\n\\nCaf\\xc3\\xa9\\n').subject
+        'Café'
+
+        :param commit_hash:
+        :param data: the raw commit object
+        :return:
+        """
+        header, _, message = data.partition(b'\n\n')
+        header_lines = header.split(b'\n')
+        encoding = 'utf-8'
+        for line in header_lines:
+            if line.startswith(b'encoding '):
+                encoding = line[9:].decode('ascii', 'replace')
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+        author = ''
+        datetime = ''
+        for line in header_lines:
+            if line.startswith(b'author '):
+                name, _, date = line[7:].decode(encoding, 'replace').rpartition('> ')
+                author = name.rpartition(' <')[0]
+                epoch, _, timezone = date.partition(' ')
+                datetime = format_datetime(int(epoch), timezone)
+                break
+        paragraph = message.decode(encoding, 'replace').strip().split('\n\n', 1)[0]
+        subject = ' '.join(line.strip() for line in paragraph.splitlines())
+        return CommitLog(commit_hash, author, datetime, subject)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
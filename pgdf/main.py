@@ -1,40 +1,25 @@
 import argparse
-import re
-import xlsxwriter
-from enum import Enum
+import os
+import sys
 
-from pgdf.blame import FileBlame, LineBlame
-from pgdf.git import get_label, get_summary, get_diff, get_blame, get_log
-
-
-class OutputFormat(Enum):
-    EXCEL = 'excel'
-    CSV = 'csv'
-    TSV = 'tsv'
-
-
-class Column:
-    def __init__(self, index: int, width: int = None):
-        """
-
-        :param index: column position that starts from 0.
-        :param width:
-        """
-        self.index = index
-        self.width = width
-
-    def __str__(self):
-        return f'{self.index}(width={self.width})'
-
-    def __repr__(self):
-        return self.__str__()
+from pgdf.git import GitError, GitRepository
+from pgdf.limits import FileLimits, to_pathspecs
+from pgdf import profiler
+from pgdf.summary import Summary, set_binary_sizes, set_blob_sizes
+from pgdf.writer import OutputFormat, ReportLevel, ReportWriter, create_writer
 
 
 def main() -> None:
+    if sys.argv[1:2] == ['serve']:
+        from pgdf.server import is_server_command, main as serve
+        if is_server_command(sys.argv[1:]):
+            serve(sys.argv[2:])
+            return
+
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
         description="""
-This is a tool to summarize git diff into an Excel file.
+This is a tool to summarize git diff into an Excel file, CSV or TSV files, or a SQLite database.
 """,
         epilog="""
 == Example Use Case ==
@@ -42,249 +27,254 @@ This is a tool to summarize git diff into an Excel file.
 $ pgdf 09c03f56 93496ef3
 $ pgdf 09c03f56 93496ef3 dir/path file/path
 $ pgdf origin/main feature/something
+$ pgdf --batch reports.txt
+$ pgdf serve &
+$ pgdf --connect origin/main feature/something
+
+"pgdf serve --help" shows the options of the server, and "pgdf serve main" is the diff of a revision named serve.
 """
     )
-    parser.add_argument('revision_1', help='The first branch, tag name or revision to be compared')
-    parser.add_argument('revision_2', help='The first branch, tag name or revision be compared')
+    parser.add_argument('revision_1', nargs='?', help='The first branch, tag name or revision to be compared')
+    parser.add_argument('revision_2', nargs='?', help='The first branch, tag name or revision be compared')
     parser.add_argument("path", help="The file path to be compared", nargs='*')
+    parser.add_argument('-b', '--batch', metavar='FILE',
+                        help='Generate the reports listed in the file, one report per line like\n'
+                             '"revision_1 revision_2 [path ...] [-o output]", instead of one report of the arguments')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1,
+                        help='The number of reports of --batch generated at once (default: the number of CPUs)')
+    parser.add_argument('-c', '--connect', action='store_true', help='Ask the server started by "pgdf serve" to generate the report')
+    parser.add_argument('--socket', help='The socket of the server of --connect (default: pgdf.sock in the git directory)')
+    parser.add_argument('-o', '--output', help='The output file path without the extension (default: diff_<revision_1>..<revision_2>)')
+    parser.add_argument('-f', '--format', choices=[output_format.value for output_format in OutputFormat], default=OutputFormat.EXCEL.value,
+                        help='The output format (default: %(default)s)')
+    parser.add_argument('-l', '--level', choices=[level.value for level in ReportLevel], default=ReportLevel.BLAME.value,
+                        help='summary: only the Summary, diff: the Diff without the blames, blame: the Diff with the blames (default: %(default)s)')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Reuse the files that are unchanged since the previous report from its manifest,\n'
+                             'and save the manifest of this report next to the output')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='The number of files blamed at once (default: the number of CPUs, divided by the processes of --batch)')
+    parser.add_argument('--full-history', action='store_true',
+                        help='Blame the lines through the whole history, instead of stopping at the merge base of the revisions')
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help='Compare only the files under the paths that match the glob, like "*.py" or "src/**/*.py" (repeatable)')
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help='Leave out the files that match the glob, like "*.min.js" or "vendor/" (repeatable)')
+    parser.add_argument('--max-file-lines', type=int, default=0, metavar='N',
+                        help='Omit the diff of a file with more changed lines than this, it is listed in the Summary as "omitted (N lines)"')
+    parser.add_argument('--max-blob-size', type=int, default=0, metavar='KB',
+                        help='Omit the diff of a file larger than this many kilobytes at either revision')
+    parser.add_argument('--generated', action='append', metavar='GLOB',
+                        help='Omit the diff of the generated files that match the glob, like "package-lock.json" or "*.min.js" (repeatable)')
+    parser.add_argument('-w', '--word-diff', action='store_true',
+                        help='Show the changed words of the removed and the added lines in bold in the Diff sheet')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the blame and commit log cache')
+    parser.add_argument('--cache-dir', help='The directory of the cache (default: $XDG_CACHE_HOME/pgdf, or ~/.cache/pgdf)')
+    parser.add_argument('--cache-size', type=int,
+                        help='The size limit of the cache in megabytes, the least recently used entries are evicted over it (default: 512)')
+    parser.add_argument('--no-object-store', action='store_true',
+                        help='Read the commits and the blob sizes through git cat-file, instead of reading .git/objects in process')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time of the stages and the git commands, and the slowest files, when the reports are generated')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Save the time of the stages, the git commands and the files in the trace event format of Chrome')
+    parser.add_argument('--max-rows', type=int,
+                        help='The number of rows of a Diff sheet, the diff spills over to "Diff (2)", ... sheets (default: 1048576)')
+    parser.add_argument('--max-workbook-rows', type=int, default=0,
+                        help='Start a new workbook at the next file once a workbook has this many diff rows')
+    parser.add_argument('--max-workbook-files', type=int, default=0,
+                        help='Start a new workbook once a workbook has this many files')
 
     args = parser.parse_args()
-
-    revision_1 = args.revision_1
-    revision_2 = args.revision_2
-    paths = args.path
-
-    label = get_label()
-
-    output_file_path = f'diff_{revision_1}..{revision_2}.xlsx'.replace('/', '_')
-    workbook = xlsxwriter.Workbook(output_file_path)
-
-    commit_hash_column = Column(0, 10)
-    commit_author_column = Column(commit_hash_column.index + 1, 10)
-    commit_datetime_column = Column(commit_author_column.index + 1, 15)
-    commit_comment_column = Column(commit_datetime_column.index + 1, 20)
-    before_line_num_column = Column(commit_comment_column.index + 1, 5)
-    after_line_num_column = Column(before_line_num_column.index + 1, 5)
-    code_column = Column(after_line_num_column.index + 1, 100)
-    columns = [
-        commit_hash_column, commit_author_column, commit_datetime_column, commit_comment_column,
-        before_line_num_column, after_line_num_column, code_column
-    ]
-
-
-    class Format:
-        @staticmethod
-        def build_format(kwargs):
-            basic_format_properties = {'font_name': 'Consolas'}
-            return workbook.add_format(dict(basic_format_properties, **kwargs))
-
-        BASIC = build_format({})
-        """Basic format. Just Consolas font."""
-        WRAP_BASIC = build_format({'text_wrap': True})
-        """Basic format with text wrap."""
-        BOLD = build_format({'bold': True})
-        """Basic format with bold."""
-        WRAP_BOLD = build_format({'text_wrap': True, 'bold': True})
-        """Basic format with text wrap and bold."""
-        RED = build_format({'font_color': 'red', 'bg_color': '#FFCCCC'})
-        """Basic format with red font and light red background."""
-        WRAP_RED = build_format({'text_wrap': True, 'font_color': 'red', 'bg_color': '#FFCCCC'})
-        """Basic format with text wrap, red font and light red background."""
-        GREEN = build_format({'font_color': 'green', 'bg_color': '#CCFFCC'})
-        """Basic format with green font and light green background."""
-        WRAP_GREEN = build_format({'text_wrap': True, 'font_color': 'green', 'bg_color': '#CCFFCC'})
-        """Basic format with text wrap, green font and light green background."""
-        FORE_BLUE = build_format({'font_color': 'blue'})
-        """Basic format with blue font."""
-        WRAP_FORE_BLUE = build_format({'text_wrap': True, 'font_color': 'blue'})
-        """Basic format with text wrap and blue font."""
-        FORE_GREEN = build_format({'font_color': 'green'})
-        """Basic format with green font."""
-        WRAP_FORE_GREEN = build_format({'text_wrap': True, 'font_color': 'green'})
-        """Basic format with text wrap and green font."""
-        FORE_GREEN_BOLD = build_format({'font_color': 'green', 'bold': True})
-        """Basic format with green font and bold."""
-        WRAP_FORE_GREEN_BOLD = build_format({'text_wrap': True, 'font_color': 'green', 'bold': True})
-        """Basic format with text wrap, green font and bold."""
-        FORE_RED = build_format({'font_color': 'red'})
-        """Basic format with red font."""
-        WRAP_FORE_RED = build_format({'text_wrap': True, 'font_color': 'red'})
-        """Basic format with text wrap and red font."""
-        FORE_RED_BOLD = build_format({'font_color': 'red', 'bold': True})
-        """Basic format with red font and bold."""
-        WRAP_FORE_RED_BOLD = build_format({'text_wrap': True, 'font_color': 'red', 'bold': True})
-        """Basic format with text wrap, red font and bold."""
-
-    # Write Summary
-    worksheet = workbook.add_worksheet("Summary")
-    worksheet.set_column(0, 0, 60)
-
-    result_text = get_summary(revision_1, revision_2, paths)
-
-    worksheet.write_string(0, 0, (f'Diff {revision_1} {revision_2} ' + ' '.join(paths)).strip(), Format.BASIC)
-    row_index = 2
-
-    for line in result_text.splitlines():
-        rm = re.match(r'^\s(?P<path>.*?)\s+\|\s+(?P<change>\d+)\s+(?P<note>[-+]*)\s*$', line)
-        if rm:
-            path = rm.group('path')
-            change = rm.group('change')
-            note = rm.group('note')
-            plus = note.count('+') if note is not None else 0
-            minus = note.count('-') if note is not None else 0
-
-            worksheet.write_string(row_index, 0, path, Format.BASIC)
-            worksheet.write_number(row_index, 1, int(change), Format.BASIC)
-            args = []
-            if plus > 0:
-                args.append(Format.FORE_GREEN)
-                args.append('+' * plus)
-            if minus > 0:
-                args.append(Format.FORE_RED)
-                args.append('-' * minus)
-
-            if len(args) > 2:
-                worksheet.write_rich_string(row_index, 2, *args)
-            else:
-                worksheet.write_string(row_index, 2, args[1], args[0])
-            row_index += 1
-            continue
-
-        rm = re.match(r'^\s(?P<path>.*?)\s+\|\s+Bin\s+(?P<before>\d+) -> (?P<after>\d+) bytes\s*$', line)
-        if rm:
-            worksheet.write_string(row_index, 0, path, Format.BASIC)
-            worksheet.write_string(row_index, 1, 'Bin', Format.BASIC)
-            worksheet.write_rich_string(
-                row_index, 2,
-                Format.FORE_RED, rm.group("before"),
-                Format.BASIC, ' -> ',
-                Format.GREEN, rm.group("after"),
-                Format.BASIC, ' bytes'
-            )
-            row_index += 1
-            continue
-
-        worksheet.write_string(row_index, 0, line, Format.BASIC)
-        row_index += 1
-
-    # Write Diff
-    worksheet = workbook.add_worksheet("Diff")
-    for column in columns:
-        worksheet.set_column(column.index, column.index, column.width)
-
-    result_text = get_diff(revision_1, revision_2, paths)
-
-    before_line_number = 0
-    after_line_number = 0
-
-    worksheet.write_string(0, 0, (f'Diff {revision_1} {revision_2} ' + ' '.join(paths)).strip(), Format.BASIC)
-
-    row_index = 1
-    revisions = set()
-    logs = {}
-
-    for line in result_text.splitlines():
-        if line.startswith('diff'):
-            row_index += 1
-            worksheet.write_string(row_index, code_column.index, line, Format.BOLD)
-            blame = {
-                'before': None,
-                'after': None
-            }
-        elif line.startswith('---'):
-            rm = re.match(r'^--- a/(?P<file_path>.*)$', line)
-            if rm:
-                path = rm.group('file_path').strip()
-                blame['before'] = FileBlame(path)
-            worksheet.write_string(row_index, code_column.index, line, Format.FORE_RED_BOLD)
-        elif line.startswith('+++'):
-            rm = re.match(r'^\+\+\+ b/(?P<file_path>.*)$', line)
-            if rm:
-                path = rm.group('file_path').strip()
-                blame['after'] = FileBlame(path)
-            worksheet.write_string(row_index, code_column.index, line, Format.FORE_GREEN_BOLD)
-        elif line.startswith('+'):
-            line_blame = revision_2_blame[after_line_number]
-            worksheet.write_string(row_index, commit_hash_column.index, line_blame.commit_hash, Format.GREEN)
-            worksheet.write_string(row_index, commit_author_column.index, line_blame.author, Format.GREEN)
-            worksheet.write_string(row_index, commit_datetime_column.index, line_blame.datetime, Format.GREEN)
-            worksheet.write_string(row_index, commit_comment_column.index, logs[line_blame.commit_hash], Format.GREEN)
-            worksheet.write_string(row_index, before_line_num_column.index, '', Format.GREEN)
-            worksheet.write_number(row_index, after_line_num_column.index, after_line_number, Format.GREEN)
-            worksheet.write_string(row_index, code_column.index, line, Format.WRAP_GREEN)
-            after_line_number += 1
-        elif line.startswith('-'):
-            line_blame = revision_1_blame[before_line_number]
-            worksheet.write_string(row_index, commit_hash_column.index, line_blame.commit_hash, Format.RED)
-            worksheet.write_string(row_index, commit_author_column.index, line_blame.author, Format.RED)
-            worksheet.write_string(row_index, commit_datetime_column.index, line_blame.datetime, Format.RED)
-            worksheet.write_string(row_index, commit_comment_column.index, logs[line_blame.commit_hash], Format.RED)
-            worksheet.write_number(row_index, before_line_num_column.index, before_line_number, Format.RED)
-            worksheet.write_string(row_index, after_line_num_column.index, '', Format.RED)
-            worksheet.write_string(row_index, code_column.index, line, Format.WRAP_RED)
-            before_line_number += 1
-        elif line.startswith('@@'):
-            row_index += 1
-            sr = re.search(r'^(?P<navigation>@@ .* @@)(?P<part_name>.*)$', line)
-            navigation = sr.group('navigation')
-            part_name = sr.group('part_name')
-
-            sr = re.search(r'^@@ -(?P<before_range>(?P<before_line_number>\d+),?(?P<before_line_volume>\d+)?) \+(?P<after_range>(?P<after_line_number>\d+),?(?P<after_line_volume>\d+)?) @@$', navigation)
-
-            before_line_number = int(sr.group('before_line_number'))
-            before_line_volume = sr.group('before_line_volume')
-            before_line_volume = before_line_number if before_line_volume is None or before_line_volume == '' else int(before_line_volume)
-            after_line_number = int(sr.group('after_line_number'))
-            after_line_volume = sr.group('after_line_volume')
-            after_line_volume = after_line_number if after_line_volume is None or after_line_volume == '' else int(after_line_volume)
-            if part_name is None or part_name.isspace() or part_name == '':
-                worksheet.write_string(row_index, code_column.index, str(navigation), Format.FORE_BLUE)
-            else:
-                worksheet.write_rich_string(row_index, code_column.index, Format.FORE_BLUE, str(navigation), Format.BASIC, str(part_name))
-
-            # get the file blame
-            if blame['before']:
-                result_text = get_blame(revision_1, blame['before'].path, before_line_number, before_line_volume)
-                revision_1_blame = {
-                    b.line_number: b for b in [LineBlame.parse(line) for line in result_text.splitlines()]
-                }
-            else:
-                revision_1_blame = {}
-
-            if blame['after']:
-                result_text = get_blame(revision_2, blame['after'].path, after_line_number, after_line_volume)
-                revision_2_blame = {
-                    b.line_number: b for b in [LineBlame.parse(line) for line in result_text.splitlines()]
-                }
-            else:
-                revision_2_blame = {}
-
-            current_revisions = set(b.commit_hash for b in revision_2_blame.values()).union(
-                set(b.commit_hash for b in revision_1_blame.values())
-            )
-            new_revisions = current_revisions - revisions
-
-            for revision in new_revisions:
-                logs[revision] = re.sub(r'^"(.*)"$', r'\1', get_log(revision).strip())
-
-            revisions = revisions.union(new_revisions)
-
-        elif line.startswith(' '):
-            worksheet.write_number(row_index, after_line_num_column.index, after_line_number, Format.BASIC)
-            worksheet.write_number(row_index, before_line_num_column.index, before_line_number, Format.BASIC)
-            worksheet.write_string(row_index, code_column.index, line, Format.WRAP_BASIC)
-            before_line_number += 1
-            after_line_number += 1
+    if args.profile or args.trace:
+        profiler.enable()
+        try:
+            run(parser, args)
+        finally:
+            report_profile(args)
+    else:
+        run(parser, args)
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if args.connect:
+        connect(parser, args)
+        return
+
+    if args.batch is not None:
+        if args.revision_1 is not None or args.output is not None:
+            parser.error('the revisions and --output cannot be given with --batch')
+        from pgdf.batch import BatchReport, run_batch
+        try:
+            reports = BatchReport.parse_file(args.batch)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        exit(1 if run_batch(args, reports, max(1, args.processes)) else 0)
+
+    if args.revision_2 is None:
+        parser.error('the following arguments are required: revision_1, revision_2')
+
+    cache = open_cache(args)
+    try:
+        with GitRepository(object_store=not args.no_object_store) as repository:
+            output_file_paths = generate_report(repository, cache, args, args.revision_1, args.revision_2, args.path, args.output)
+            for output_file_path in output_file_paths:
+                print(f'{output_file_path} was generated.')
+    except GitError as e:
+        print(e.stderr or e)
+        exit(e.returncode)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def connect(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Generate the report on the server, the cache options are the ones of the server."""
+    if args.batch is not None or args.profile or args.trace:
+        parser.error('--batch, --profile and --trace cannot be given with --connect')
+    if args.revision_2 is None:
+        parser.error('the following arguments are required: revision_1, revision_2')
+    from pgdf.server import default_socket_path, request_report
+    try:
+        response = request_report(args.socket or default_socket_path(), args)
+    except GitError as e:
+        print(e.stderr or e)
+        exit(e.returncode)
+    except (OSError, ValueError) as e:
+        print(f'The server cannot be reached: {e}')
+        exit(1)
+    if 'error' in response:
+        print(response['error'])
+        exit(response['returncode'])
+    for output_file_path in response['output_file_paths']:
+        print(f'{output_file_path} was generated.')
+
+
+def report_profile(args: argparse.Namespace) -> None:
+    """Print the profile table and save the trace, as the command line arguments ask."""
+    current_profiler = profiler.get_profiler()
+    if not current_profiler.events:
+        return
+    if args.profile:
+        print(current_profiler.table(), file=sys.stderr)
+    if args.trace:
+        current_profiler.write_trace(args.trace)
+        print(f'{args.trace} was generated.', file=sys.stderr)
+
+
+def open_cache(args: argparse.Namespace):
+    """
+    Open the cache of the command line arguments, None if it is disabled or not needed.
+
+    The cache is imported here, so that the levels without the blames do not load it and SQLite.
+    """
+    if ReportLevel(args.level) != ReportLevel.BLAME or args.no_cache:
+        return None
+    import sqlite3
+    from pgdf.cache import DEFAULT_MAX_SIZE, Cache
+    try:
+        return Cache(args.cache_dir, DEFAULT_MAX_SIZE if args.cache_size is None else args.cache_size * 1024 * 1024)
+    except (OSError, sqlite3.Error) as e:
+        print(f'The cache is disabled: {e}')
+        return None
+
+
+def default_output_file_path(revision_1: str, revision_2: str) -> str:
+    """
+    >>> default_output_file_path('origin/main', 'feature/something')
+    'diff_origin_main..feature_something'
+    """
+    return f'diff_{revision_1}..{revision_2}'.replace('/', '_')
+
+
+def generate_report(repository: GitRepository, cache, args: argparse.Namespace,
+                    revision_1: str, revision_2: str, paths: list[str], output_file_path: str = None, jobs: int = None) -> list[str]:
+    """
+    Generate a report of the revisions with the options of the command line arguments.
+
+    :param cache: the BlameCache of the blames and the commit logs, None not to use a cache
+    :param output_file_path: the output file path without the extension, diff_<revision_1>..<revision_2> if it is None
+    :param jobs: the number of files blamed at once, --jobs or the number of CPUs if it is None
+    :return: the paths of the written files
+    """
+    output_format = OutputFormat(args.format)
+    level = ReportLevel(args.level)
+    options = {}
+    if output_format == OutputFormat.EXCEL:
+        options = dict(max_workbook_rows=args.max_workbook_rows, max_workbook_files=args.max_workbook_files)
+        if args.max_rows:
+            options['max_rows'] = args.max_rows
+    if output_file_path is None:
+        output_file_path = default_output_file_path(revision_1, revision_2)
+    jobs = args.jobs or jobs or os.cpu_count() or 1
+    limits = FileLimits(args.max_file_lines, args.max_blob_size * 1024, args.generated, args.include)
+    title = (f'Diff {revision_1} {revision_2} ' + ' '.join(paths)).strip()
+    # git compares the files that match any of the pathspecs, so with paths the include globs are matched only by FileLimits
+    paths = list(paths) + to_pathspecs(None if paths else args.include, args.exclude)
+    # fail before any output file is created
+    repository.resolve_commit(revision_1)
+    repository.resolve_commit(revision_2)
+    writer = create_writer(output_format, output_file_path, title, **options)
+    manifest_path = f'{output_file_path}.manifest.sqlite3' if args.incremental and level != ReportLevel.SUMMARY else None
+    with profiler.span('stage', 'report', title=title):
+        return write_report(repository, writer, revision_1, revision_2, paths, jobs, cache, args.full_history, level, manifest_path,
+                            args.word_diff, limits)
+
+
+def write_report(repository: GitRepository, writer: ReportWriter, revision_1: str, revision_2: str, paths: list[str],
+                 jobs: int = 1, cache=None, full_history: bool = False, level: ReportLevel = ReportLevel.BLAME,
+                 manifest_path: str = None, word_diff: bool = False, limits: FileLimits = None) -> list[str]:
+    """
+    Write the diff and the summary of the revisions with the writer.
+
+    The diff is read once, and the summary is written after it from the numbers counted while the diff is parsed.
+    The summary level reads only git diff --numstat, and the diff level runs no git blame.
+    With manifest_path, the files that are unchanged since the previous report are reused from its manifest.
+    With limits, the files that are not included or are over them are found in git diff --numstat first,
+    and only the other files are diffed by their paths, a limited number of files per git diff call.
+    The modules of the diff and the blames are imported only by the levels that use them, so the summary level stays cheap.
+
+    :param cache: the BlameCache of the blames and the commit logs, None not to use a cache
+    :return: the paths of the written files
+    """
+    if level == ReportLevel.SUMMARY:
+        with profiler.span('stage', 'numstat'):
+            summary = Summary.parse_numstat(repository.get_numstat(revision_1, revision_2, paths))
+            if limits:
+                limits.leave_out(summary)
+    else:
+        from pgdf.pipeline import write_diff
+        file_paths = None
+        if limits:
+            with profiler.span('stage', 'limits'):
+                summary = Summary.parse_numstat(repository.get_numstat(revision_1, revision_2, paths))
+                left_out = limits.leave_out(summary)
+                if limits.max_blob_size:
+                    set_blob_sizes(repository, revision_1, revision_2,
+                                   [file_summary for file_summary in summary.file_summaries if not file_summary.binary])
+                omitted = limits.omit(summary)
+                if left_out or omitted:
+                    file_paths = [file_summary.paths for file_summary in summary.file_summaries if not file_summary.omitted]
+                    profiler.count('omitted files', len(omitted))
+        with profiler.span('stage', 'diff'):
+            diff_summary = write_diff(repository, writer, revision_1, revision_2, paths, jobs, cache, full_history,
+                                      level == ReportLevel.BLAME, manifest_path, word_diff, file_paths)
+        if file_paths is None:
+            summary = diff_summary
+
+    with profiler.span('stage', 'binary sizes'):
+        set_binary_sizes(repository, revision_1, revision_2, summary.file_summaries)
+    for file_summary in summary.file_summaries:
+        if file_summary.omitted:
+            writer.write_omitted_summary(file_summary.file_path, file_summary.change_count)
+        elif file_summary.binary:
+            writer.write_binary_summary(file_summary.file_path, str(file_summary.before_size), str(file_summary.after_size))
         else:
-            worksheet.write_string(row_index, code_column.index, line, Format.WRAP_BASIC)
-
-        row_index += 1
-
-    workbook.close()
-
-    print(f'{output_file_path} was generated.')
+            plus, minus = summary.graph(file_summary)
+            writer.write_file_summary(file_summary.file_path, file_summary.change_count, plus, minus)
+    writer.write_summary_text(summary.totals_line())
 
+    with profiler.span('stage', 'close'):
+        return writer.close()
 
-if __name__ == '__main__':
-    main()
 
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import zlib
+from array import array
+
+from pgdf.blame import CommitBlame, CommitRegistry, FileBlame
+from pgdf.diff import FileDiff
+
+
+MANIFEST_VERSION = 2
+"""The version of the manifest format, a manifest of another version is ignored."""
+
+
+class Manifest:
+    """
+    The files of the previous report and of the report being written, keyed by their git diff --raw entries.
+
+    A file whose entry is in the previous manifest has the same modes and blobs on both sides as in the previous report,
+    so its stored diff and blames are reused instead of running git diff and git blame on it again.
+    The commits of the revisions are stored too, so that the blames are not reused when the history has been rewritten.
+    The manifest of the new report is written next to the previous one and replaces it when the report is finished.
+    """
+
+    def __init__(self, path: str, settings: str, commit_hashes: tuple[str, str] = None):
+        """
+
+        :param path: the path of the manifest database
+        :param settings: the settings that the stored rows depend on, like the report level, the blame boundary and the word diff.
+                         The previous manifest is ignored if it was written with other settings.
+        :param commit_hashes: the full hashes of the commits of the revisions that the blames are read at, None when not blamed
+        """
+        self.path = path
+        self.settings = f'{MANIFEST_VERSION} {settings}'
+        self.previous = None
+        self.previous_keys = set()
+        self.commit_hashes = commit_hashes
+        self.previous_commit_hashes = None
+        """The commit hashes of the revisions of the previous report, None if they are not stored."""
+        if os.path.exists(path):
+            try:
+                connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+                row = connection.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+                if row is not None and row[0] == self.settings:
+                    self.previous = connection
+                    self.previous_keys = {key for key, in connection.execute('SELECT key FROM files')}
+                    row = connection.execute("SELECT value FROM meta WHERE key = 'commit_hashes'").fetchone()
+                    if row is not None:
+                        self.previous_commit_hashes = tuple(row[0].split(' '))
+                else:
+                    connection.close()
+            except sqlite3.Error:
+                self.previous = None
+                self.previous_keys = set()
+
+        self.new_path = path + '.new'
+        if os.path.exists(self.new_path):
+            os.remove(self.new_path)
+        self.connection = sqlite3.connect(self.new_path, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE files (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+        self.connection.execute('BEGIN')
+        self.connection.execute("INSERT INTO meta (key, value) VALUES ('settings', ?)", (self.settings,))
+        if commit_hashes is not None:
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('commit_hashes', ?)", (' '.join(commit_hashes),))
+        self.reused_count = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.previous_keys
+
+    def forget(self, keys=None) -> None:
+        """
+        Stop reusing files of the previous report, so that they are diffed and blamed again.
+
+        :param keys: the keys of the files, None for all the files
+        """
+        if keys is None:
+            self.previous_keys = set()
+        else:
+            self.previous_keys.difference_update(keys)
+
+    def get(self, key: str):
+        """Return the stored file reports of the previous report, None if the file is not in it."""
+        if key not in self.previous_keys:
+            return None
+        row = self.previous.execute('SELECT value FROM files WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.reused_count += 1
+        return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO files (key, value) VALUES (?, ?)', (key, value))
+
+    def close(self, save: bool = True) -> None:
+        """
+        Close the manifests.
+
+        :param save: True to replace the previous manifest with the new one, False to discard the new one.
+        """
+        if self.previous is not None:
+            self.previous.close()
+        if save:
+            self.connection.execute('COMMIT')
+        self.connection.close()
+        if save:
+            os.replace(self.new_path, self.path)
+        else:
+            os.remove(self.new_path)
+
+
+def iter_hunk_lines(file_diff: FileDiff):
+    """Yield the lines of all the hunks of a file diff."""
+    for hunk in file_diff.hunks:
+        yield from hunk.lines
+
+
+def encode_file_reports(file_reports: list, registry: CommitRegistry = None) -> bytes:
+    """
+    Encode the file diffs with their changed words and their blames, with the metadata of the blamed commits.
+
+    :param file_reports: tuples of the file diff, the blame at the first revision and the blame at the second revision,
+                         the blames are None when the lines are not blamed.
+    :param registry: the registry that the blames refer to
+    :return:
+    """
+    commits = []
+    local_indexes = {}
+    reports = []
+    for file_diff, revision_1_blame, revision_2_blame in file_reports:
+        blames = []
+        for file_blame in (revision_1_blame, revision_2_blame):
+            if file_blame is None:
+                blames.append(None)
+                continue
+            commit_indexes = []
+            for commit_index in file_blame.commit_indexes:
+                local_index = local_indexes.get(commit_index)
+                if local_index is None:
+                    commit = registry[commit_index]
+                    local_index = local_indexes[commit_index] = len(commits)
+                    commits.append([commit.commit_hash, commit.author, commit.datetime, commit.subject, commit.short_hash.startswith('^')])
+                commit_indexes.append(local_index)
+            blames.append([file_blame.line_numbers.tolist(), commit_indexes])
+        words = [[index, diff_line.words] for index, diff_line in enumerate(iter_hunk_lines(file_diff)) if diff_line.words]
+        reports.append(['\n'.join(file_diff.diff_lines), blames, words])
+    return zlib.compress(json.dumps([commits, reports]).encode('utf-8'))
+
+
+def decode_file_reports(value: bytes, registry: CommitRegistry = None) -> list:
+    """
+    Decode the file diffs with their changed words and their blames, and register the blamed commits in the registry.
+
+    >>> file_diff = FileDiff.parse(['diff --git a/a.txt b/a.txt', 'index 5f73e72..ba56eaf 100644', '--- a/a.txt', '+++ b/a.txt', '@@ -1 +1 @@', '-a b', '+a c'])
+    >>> file_diff.hunks[0].lines[1].words = ((3, 4),)
+    >>> registry = CommitRegistry()
+    >>> commit = CommitBlame('0e2b5b3c4f59a53b1c5d2e1a2b3c4d5e6f708192')
+    >>> commit.author, commit.summary = 'Kenji Otsuka', 'Initial commit'
+    >>> revision_2_blame = FileBlame('a.txt')
+    >>> revision_2_blame.add(1, registry.register(commit))
+    >>> value = encode_file_reports([(file_diff, FileBlame('a.txt'), revision_2_blame)], registry)
+    >>> [(fd.diff_lines[-1], fd.hunks[0].lines[1].words, registry[b2.commit_index(1)].subject) for fd, b1, b2 in decode_file_reports(value, CommitRegistry())]
+    [('+a c', ((3, 4),), 'Initial commit')]
+
+    :param value:
+    :param registry: the registry of the report being written
+    :return: tuples of the file diff, the blame at the first revision and the blame at the second revision
+    """
+    commits, reports = json.loads(zlib.decompress(value).decode('utf-8'))
+    commit_indexes = []
+    for commit_hash, author, datetime, subject, boundary in commits:
+        commit = CommitBlame(commit_hash)
+        commit.author = author
+        commit.datetime = datetime
+        commit.summary = subject
+        commit.boundary = boundary
+        commit_indexes.append(registry.register(commit))
+    file_reports = []
+    for text, blames, words in reports:
+        file_diff = FileDiff.parse(text.split('\n'))
+        if words:
+            diff_lines = list(iter_hunk_lines(file_diff))
+            for index, spans in words:
+                diff_lines[index].words = tuple(tuple(span) for span in spans)
+        file_blames = []
+        for path, blame in zip((file_diff.before_path, file_diff.after_path), blames):
+            if blame is None:
+                file_blames.append(None)
+                continue
+            file_blame = FileBlame(path)
+            file_blame.line_numbers = array('l', blame[0])
+            file_blame.commit_indexes = array('l', (commit_indexes[i] for i in blame[1]))
+            file_blames.append(file_blame)
+        file_reports.append((file_diff, file_blames[0], file_blames[1]))
+    return file_reports
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
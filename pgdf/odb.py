@@ -0,0 +1,447 @@
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+
+OBJECT_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+"""The object types of the pack entries, 6 and 7 are the deltas."""
+
+OFS_DELTA = 6
+REF_DELTA = 7
+
+CACHE_SIZE = 64 * 1024 * 1024
+"""The total size of the decoded objects kept in the LRU cache of an object store, in bytes."""
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+READ_CHUNK_SIZE = 65536
+
+
+class ObjectStoreError(Exception):
+    """Raised when an object cannot be decoded, the caller falls back to git."""
+
+
+def read_varint(data, position: int) -> tuple[int, int]:
+    """
+    Read a size of a delta, little-endian in groups of 7 bits.
+
+    >>> read_varint(b'\\x91\\x2e', 0)
+    (5905, 2)
+
+    :return: the value and the next position
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """
+    Apply a git delta to the base object.
+
+    >>> apply_delta(b'hello world', b'\\x0b\\x0d\\x91\\x00\\x06\\x07planet!')
+    b'hello planet!'
+
+    :param base:
+    :param delta: the delta data of a pack entry
+    :return:
+    """
+    base_size, position = read_varint(delta, 0)
+    if base_size != len(base):
+        raise ObjectStoreError('The delta does not match the size of its base.')
+    result_size, position = read_varint(delta, position)
+    result = bytearray()
+    length = len(delta)
+    while position < length:
+        command = delta[position]
+        position += 1
+        if command & 0x80:
+            offset = 0
+            size = 0
+            for i in range(4):
+                if command & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if command & (0x10 << i):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            result += base[offset:offset + (size or 0x10000)]
+        elif command:
+            result += delta[position:position + command]
+            position += command
+        else:
+            raise ObjectStoreError('The delta has an unknown command.')
+    if len(result) != result_size:
+        raise ObjectStoreError('The delta does not produce the expected size.')
+    return bytes(result)
+
+
+def inflate(data, position: int, size: int = None, expected_size: int = None) -> bytes:
+    """
+    Inflate the zlib stream that starts at the position.
+
+    :param size: the number of the bytes to inflate, None for the whole stream
+    :param expected_size: the inflated size of the stream if it is known, so that little more than the stream is read at first
+    """
+    decompressor = zlib.decompressobj()
+    result = bytearray()
+    chunk_size = READ_CHUNK_SIZE if expected_size is None else expected_size + 64
+    while not decompressor.eof:
+        chunk = data[position:position + chunk_size]
+        chunk_size = READ_CHUNK_SIZE
+        if not chunk:
+            raise ObjectStoreError('The object is truncated.')
+        position += len(chunk)
+        if size is None:
+            result += decompressor.decompress(chunk)
+        else:
+            result += decompressor.decompress(chunk, size - len(result))
+            if len(result) >= size:
+                break
+    return bytes(result)
+
+
+class PackIndex:
+    """A pack and its version 2 index, mapped into memory."""
+
+    def __init__(self, index_path: str):
+        with open(index_path, 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.index[:8] != b'\xfftOc\x00\x00\x00\x02':
+            self.index.close()
+            raise ObjectStoreError(f'{index_path} is not a version 2 pack index.')
+        with open(index_path[:-4] + '.pack', 'rb') as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.fanout = struct.unpack_from('>256I', self.index, 8)
+        self.count = self.fanout[255]
+        self.hashes_offset = 8 + 256 * 4
+        self.offsets_offset = self.hashes_offset + self.count * (20 + 4)
+        self.large_offsets_offset = self.offsets_offset + self.count * 4
+
+    def find(self, object_id: bytes):
+        """
+        Find the offset of the object in the pack, the hashes of the first byte of the object id are bisected.
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> object_ids = [bytes.fromhex('01' * 20), bytes.fromhex('ab' * 20)]
+        >>> fanout = [sum(1 for object_id in object_ids if object_id[0] <= i) for i in range(256)]
+        >>> with open(os.path.join(directory, 'pack-test.idx'), 'wb') as f:
+        ...     _ = f.write(b'\\xfftOc\\x00\\x00\\x00\\x02' + struct.pack('>256I', *fanout) + b''.join(object_ids) + bytes(8))
+        ...     _ = f.write(struct.pack('>II', 12, 0x80000000) + struct.pack('>Q', 1 << 32))
+        >>> with open(os.path.join(directory, 'pack-test.pack'), 'wb') as f:
+        ...     _ = f.write(b'PACK' + struct.pack('>II', 2, 2) + b'\\xbc\\x12')
+        >>> pack_index = PackIndex(os.path.join(directory, 'pack-test.idx'))
+        >>> [pack_index.find(object_id) for object_id in object_ids + [bytes(20), bytes.fromhex('ff' * 20)]]
+        [12, 4294967296, None, None]
+        >>> pack_index.read_header(12)
+        (3, 300, 14, None)
+        >>> pack_index.close()
+        >>> shutil.rmtree(directory)
+
+        :param object_id: the 20 bytes of the object hash
+        :return: the offset, None if the object is not in the pack
+        """
+        first = object_id[0]
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+        index = self.index
+        while low < high:
+            middle = (low + high) // 2
+            position = self.hashes_offset + middle * 20
+            found = index[position:position + 20]
+            if found < object_id:
+                low = middle + 1
+            elif found > object_id:
+                high = middle
+            else:
+                offset, = struct.unpack_from('>I', index, self.offsets_offset + middle * 4)
+                if offset & 0x80000000:
+                    offset, = struct.unpack_from('>Q', index, self.large_offsets_offset + (offset & 0x7fffffff) * 8)
+                return offset
+        return None
+
+    def read_header(self, offset: int) -> tuple:
+        """
+        Read the header of the pack entry.
+
+        :return: the type number, the size, the position of the data,
+                 and the offset of the base of an OFS_DELTA or the object id of the base of a REF_DELTA
+        """
+        pack = self.pack
+        byte = pack[offset]
+        position = offset + 1
+        type_number = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = pack[position]
+            position += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        base = None
+        if type_number == OFS_DELTA:
+            byte = pack[position]
+            position += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = pack[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = offset - distance
+        elif type_number == REF_DELTA:
+            base = pack[position:position + 20]
+            position += 20
+        return type_number, size, position, base
+
+    def close(self) -> None:
+        self.index.close()
+        self.pack.close()
+
+
+class ObjectStore:
+    """
+    Reads the objects of a SHA-1 repository in process, from the loose objects and the packs.
+
+    Only the object lookups are served here, like git cat-file does.
+    An object that cannot be found or decoded is left to git, so that the caller can fall back to it.
+    """
+
+    def __init__(self, objects_dir: str):
+        """
+
+        :param objects_dir: the objects directory of the repository, as git rev-parse --git-path objects prints
+        """
+        self.objects_dirs = [objects_dir] + self._read_alternates(objects_dir)
+        self.packs = []
+        self.pack_paths = set()
+        self._lock = threading.Lock()
+        self._packs_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._load_packs()
+
+    @staticmethod
+    def _read_alternates(objects_dir: str) -> list[str]:
+        path = os.path.join(objects_dir, 'info', 'alternates')
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            return [os.path.join(objects_dir, line.strip()) for line in f if line.strip() and not line.startswith('#')]
+
+    def _load_packs(self) -> bool:
+        """Map the packs that are not mapped yet, return True if there is a new one."""
+        added = False
+        with self._packs_lock:
+            for objects_dir in self.objects_dirs:
+                for index_path in sorted(glob.glob(os.path.join(objects_dir, 'pack', 'pack-*.idx'))):
+                    if index_path in self.pack_paths or not os.path.exists(index_path[:-4] + '.pack'):
+                        continue
+                    try:
+                        pack = PackIndex(index_path)
+                    except (OSError, ValueError, ObjectStoreError):
+                        continue
+                    self.pack_paths.add(index_path)
+                    self.packs = self.packs + [pack]
+                    added = True
+        return added
+
+    def close(self) -> None:
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
+        self.pack_paths = set()
+
+    def _cache_get(self, key):
+        with self._lock:
+            found = self._cache.get(key)
+            if found is not None:
+                self._cache.move_to_end(key)
+            return found
+
+    def _cache_put(self, key, value) -> None:
+        size = len(value[1])
+        if size > CACHE_SIZE // 16:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_size -= len(previous[1])
+            self._cache[key] = value
+            self._cache_size += size
+            while self._cache_size > CACHE_SIZE:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted[1])
+
+    def read(self, object_hash: str):
+        """
+        Read an object.
+
+        :param object_hash: the full hash of the object
+        :return: the type and the contents, None if the object is not found
+        """
+        found = self._cache_get(object_hash)
+        if found is not None:
+            return found
+        object_id = bytes.fromhex(object_hash)
+        found = self._read_packed(object_id)
+        if found is None:
+            found = self._read_loose(object_hash)
+        if found is None and self._load_packs():
+            # the repository may have been repacked
+            found = self._read_packed(object_id)
+        if found is not None:
+            self._cache_put(object_hash, found)
+        return found
+
+    def _read_loose(self, object_hash: str):
+        for objects_dir in self.objects_dirs:
+            path = os.path.join(objects_dir, object_hash[:2], object_hash[2:])
+            try:
+                with open(path, 'rb') as f:
+                    data = zlib.decompress(f.read())
+            except FileNotFoundError:
+                continue
+            except zlib.error as e:
+                raise ObjectStoreError(f'{path} cannot be inflated: {e}')
+            header, _, contents = data.partition(b'\0')
+            object_type, _, size = header.decode('ascii').partition(' ')
+            if int(size) != len(contents):
+                raise ObjectStoreError(f'{path} is truncated.')
+            return object_type, contents
+        return None
+
+    def _read_packed(self, object_id: bytes):
+        for pack in self.packs:
+            offset = pack.find(object_id)
+            if offset is not None:
+                return self._read_entry(pack, offset)
+        return None
+
+    def _read_entry(self, pack: PackIndex, offset: int):
+        """Read the object at the offset of the pack, resolving its delta chain from the nearest cached base."""
+        deltas = []
+        while True:
+            found = self._cache_get((id(pack), offset))
+            if found is not None:
+                break
+            type_number, size, position, base = pack.read_header(offset)
+            if type_number in OBJECT_TYPES:
+                found = OBJECT_TYPES[type_number], inflate(pack.pack, position, expected_size=size)
+                if deltas:
+                    self._cache_put((id(pack), offset), found)
+                break
+            deltas.append((offset, inflate(pack.pack, position, expected_size=size)))
+            if type_number == OFS_DELTA:
+                offset = base
+                continue
+            if type_number != REF_DELTA:
+                raise ObjectStoreError(f'Unknown type {type_number} of the pack entry at {offset}.')
+            found = self.read(base.hex())
+            if found is None:
+                raise ObjectStoreError(f'The delta base {base.hex()} is not found.')
+            break
+        object_type, contents = found
+        for delta_offset, delta in reversed(deltas):
+            contents = apply_delta(contents, delta)
+            self._cache_put((id(pack), delta_offset), (object_type, contents))
+        return object_type, contents
+
+    def info(self, object_hash: str):
+        """
+        Read the type and the size of an object, without inflating it if it is not a delta.
+
+        :return: the type and the size, None if the object is not found
+        """
+        found = self._cache_get(object_hash)
+        if found is not None:
+            return found[0], len(found[1])
+        object_id = bytes.fromhex(object_hash)
+        for pack in self.packs:
+            offset = pack.find(object_id)
+            if offset is not None:
+                type_number, size, position, base = pack.read_header(offset)
+                if type_number in OBJECT_TYPES:
+                    return OBJECT_TYPES[type_number], size
+                object_type, contents = self._read_entry(pack, offset)
+                return object_type, len(contents)
+        for objects_dir in self.objects_dirs:
+            path = os.path.join(objects_dir, object_hash[:2], object_hash[2:])
+            try:
+                with open(path, 'rb') as f:
+                    header = inflate(f.read(), 0, 64).partition(b'\0')[0]
+            except FileNotFoundError:
+                continue
+            except zlib.error as e:
+                raise ObjectStoreError(f'{path} cannot be inflated: {e}')
+            object_type, _, size = header.decode('ascii').partition(' ')
+            return object_type, int(size)
+        found = self.read(object_hash) if self._load_packs() else None
+        return (found[0], len(found[1])) if found is not None else None
+
+    def resolve_path(self, commit_hash: str, path: str):
+        """
+        Return the hash of the object at the path of the commit, like git rev-parse <commit>:<path>.
+
+        :return: None if the path does not exist or the object is not a commit
+        """
+        found = self.read(commit_hash)
+        if found is None or found[0] != 'commit' or not found[1].startswith(b'tree '):
+            return None
+        object_hash = found[1][5:45].decode('ascii')
+        for name in path.encode('utf-8', 'surrogateescape').split(b'/'):
+            found = self.read(object_hash)
+            if found is None or found[0] != 'tree':
+                return None
+            object_hash = self._find_tree_entry(found[1], name)
+            if object_hash is None:
+                return None
+        return object_hash
+
+    @staticmethod
+    def _find_tree_entry(tree: bytes, name: bytes):
+        position = 0
+        while position < len(tree):
+            name_start = tree.index(b' ', position) + 1
+            name_end = tree.index(b'\0', name_start)
+            if tree[name_start:name_end] == name:
+                return tree[name_end + 1:name_end + 21].hex()
+            position = name_end + 21
+        return None
+
+    def lookup(self, name: str, contents: bool):
+        """
+        Look up an object by its full hash or by '<full commit hash>:<path>', in the result format of git cat-file.
+
+        :param contents: True to read the contents like git cat-file --batch, False to read only the info like --batch-check
+        :return: (object hash, type, size, contents), the contents is None if contents is False.
+                 None if the name is of another form or the object is not found, to be asked to git.
+        """
+        object_hash, _, path = name.partition(':')
+        if not HASH_PATTERN.match(object_hash):
+            return None
+        if path:
+            object_hash = self.resolve_path(object_hash, path)
+            if object_hash is None:
+                return None
+        if contents:
+            found = self.read(object_hash)
+            return None if found is None else (object_hash, found[0], len(found[1]), found[1])
+        found = self.info(object_hash)
+        return None if found is None else (object_hash, found[0], found[1], None)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
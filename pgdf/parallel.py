@@ -0,0 +1,38 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def ordered_map(function, iterable, jobs: int = 1):
+    """
+    Apply the function to the items in a thread pool and yield the results in the order of the items.
+
+    At most twice as many items as the jobs are in flight, so a long iterable is consumed as the results are used.
+
+    >>> list(ordered_map(lambda n: n * n, range(10), jobs=4))
+    [0, 1, 4, 9, 16, 25, 36, 49, 64, 81]
+
+    :param function:
+    :param iterable:
+    :param jobs: the number of threads, the items are processed in the calling thread if it is 1 or less.
+    :return:
+    """
+    if jobs <= 1:
+        yield from map(function, iterable)
+        return
+
+    executor = ThreadPoolExecutor(jobs)
+    try:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,417 @@
+from functools import partial
+from itertools import islice
+
+from pgdf.blame import CommitBlame, CommitRecord, CommitRegistry, FileBlame
+from pgdf.diff import Diff, FileDiff, RawDiffEntry, WordDiff
+from pgdf.git import GitRepository, CommitLogResolver
+from pgdf.parallel import ordered_map
+from pgdf import profiler
+from pgdf.summary import FileSummary, Summary
+from pgdf.writer import ReportWriter
+
+
+PATHSPEC_CHUNK_SIZE = 500
+"""The number of files diffed by one git diff call when only the changed files are diffed."""
+
+WORD_DIFF_CHUNK_SIZE = 100
+"""The number of file diffs read ahead of the blames, whose modified files are diffed word by word in one git diff call."""
+
+
+def get_file_blame(repository: GitRepository, cache, commit_hash: str, file_path: str, line_ranges: list[tuple[int, int]],
+                   boundary: str = None) -> str:
+    if cache is None:
+        return repository.get_file_blame(commit_hash, file_path, line_ranges, boundary)
+    result_text = cache.get_blame(commit_hash, file_path, line_ranges, boundary)
+    if result_text is None:
+        result_text = repository.get_file_blame(commit_hash, file_path, line_ranges, boundary)
+        cache.put_blame(commit_hash, file_path, line_ranges, result_text, boundary)
+    return result_text
+
+
+def blame_side(repository: GitRepository, cache, registry: CommitRegistry, commit_hash: str, path: str,
+               line_ranges: list[tuple[int, int]], boundary_commit: CommitBlame) -> FileBlame:
+    """
+    Blame one side of a file diff.
+
+    When the revision is the boundary itself, all the lines are blamed on the boundary commit without git blame.
+
+    :param commit_hash: the full commit hash of the revision of the side
+    :param boundary_commit: the commit where the blame stops, None to blame the whole history
+    :return:
+    """
+    if not path or not line_ranges:
+        return FileBlame(path)
+    if boundary_commit is None:
+        result_text = get_file_blame(repository, cache, commit_hash, path, line_ranges)
+    elif boundary_commit.commit_hash == commit_hash:
+        line_numbers = (line_number for start, volume in line_ranges for line_number in range(start, start + volume))
+        return FileBlame.boundary_blame(path, boundary_commit, line_numbers, registry)
+    else:
+        result_text = get_file_blame(repository, cache, commit_hash, path, line_ranges, boundary_commit.commit_hash)
+    return FileBlame.parse_porcelain(path, result_text, registry)
+
+
+def blame_file_diff(repository: GitRepository, cache, registry: CommitRegistry, revision_1: str, revision_2: str,
+                    boundary_commit: CommitBlame, file_diff: FileDiff):
+    """
+    Blame the removed and the added lines of a file diff, each side of the file is blamed only once.
+
+    It only reads git and the cache and registers the commits, so that it can run for several files at once.
+
+    :param registry: the registry of the commits of the report
+    :param revision_1: the full commit hash of the first revision
+    :param revision_2: the full commit hash of the second revision
+    :param boundary_commit: the commit where the blame stops, None to blame the whole history
+    :return: the file diff, the blame at revision_1 and the blame at revision_2
+    """
+    with profiler.span('blame', file_diff.file_path, hunks=len(file_diff.hunks), lines=file_diff.insertions + file_diff.deletions):
+        revision_1_blame = blame_side(
+            repository, cache, registry, revision_1, file_diff.before_path, file_diff.before_line_ranges(), boundary_commit
+        )
+        revision_2_blame = blame_side(
+            repository, cache, registry, revision_2, file_diff.after_path, file_diff.after_line_ranges(), boundary_commit
+        )
+    return file_diff, revision_1_blame, revision_2_blame
+
+
+def get_boundary_commit(repository: GitRepository, commit_logs: CommitLogResolver, revision_1: str, revision_2: str):
+    """
+    Return the merge base of the revisions as the boundary commit of the blames, None if they have no common history.
+
+    :param revision_1: the full commit hash of the first revision
+    :param revision_2: the full commit hash of the second revision
+    :return:
+    """
+    merge_base = repository.get_merge_base(revision_1, revision_2)
+    if merge_base is None:
+        return None
+    commit_log = commit_logs.get(merge_base)
+    commit = CommitBlame(merge_base)
+    commit.author = commit_log.author
+    commit.datetime = commit_log.datetime
+    commit.summary = commit_log.subject
+    commit.boundary = True
+    return commit
+
+
+def write_diff(repository: GitRepository, writer: ReportWriter, revision_1: str, revision_2: str, paths: list[str],
+               jobs: int, cache, full_history: bool, blame: bool, manifest_path: str = None, word_diff: bool = False,
+               file_paths: list[list[str]] = None) -> Summary:
+    """
+    Write the diff of the revisions file by file, with the blames of the added and the removed lines if blame is True.
+
+    The blames stop at the merge base of the revisions unless full_history is True,
+    the lines older than it are blamed on it as boundary lines.
+
+    :param cache: the BlameCache of the blames and the commit logs, None not to use a cache
+    :param manifest_path: the manifest of the previous report, whose unchanged files are reused,
+                          and that is replaced with the manifest of this report. None not to use a manifest.
+    :param word_diff: True to set the changed words of the removed and the added lines from git diff --word-diff=porcelain
+    :param file_paths: the paths of the only files to diff at both revisions, None to diff all the files under paths
+    :return: the summary counted from the diff
+    """
+    summary = Summary()
+    registry = CommitRegistry(repository.get_abbrev_length(revision_2)) if blame else None
+    commits = registry.commits if blame else None
+    blame_function, settings = create_blame_function(repository, cache, registry, revision_1, revision_2, full_history)
+    if word_diff:
+        settings += ' words'
+    manifest = None
+    if manifest_path is not None:
+        from pgdf.manifest import Manifest
+        commit_hashes = (repository.resolve_commit(revision_1), repository.resolve_commit(revision_2)) if blame else None
+        manifest = Manifest(manifest_path, settings, commit_hashes)
+    file_blames = iter_file_blames(repository, manifest, registry, blame_function, revision_1, revision_2, paths, jobs, word_diff,
+                                   file_paths)
+
+    try:
+        for file_diff, revision_1_blame, revision_2_blame in file_blames:
+            summary.append(FileSummary.from_file_diff(file_diff))
+            write_file_diff(writer, file_diff, revision_1_blame, revision_2_blame, commits)
+    except BaseException:
+        if manifest is not None:
+            manifest.close(save=False)
+        raise
+    if manifest is not None:
+        profiler.count('reused files', manifest.reused_count)
+        manifest.close()
+    return summary
+
+
+def write_file_diff(writer: ReportWriter, file_diff: FileDiff, revision_1_blame: FileBlame, revision_2_blame: FileBlame,
+                    commits: list[CommitRecord] = None) -> None:
+    """
+    Write a file diff with the commits that its added and removed lines are blamed on.
+
+    :param commits: the commits of the registry that the blames refer to, None when the lines are not blamed
+    """
+    with profiler.span('write', file_diff.file_path, hunks=len(file_diff.hunks), lines=file_diff.insertions + file_diff.deletions) as details:
+        writer.write_file(file_diff)
+        rows = len(file_diff.header_lines)
+        for hunk in file_diff.hunks:
+            writer.write_hunk(hunk)
+            rows += 1 + len(hunk.lines)
+            for diff_line in hunk.lines:
+                kind = diff_line.kind
+                if kind == '+' and commits is not None:
+                    writer.write_line(diff_line, commits[revision_2_blame.commit_index(diff_line.after_line_number)])
+                elif kind == '-' and commits is not None:
+                    writer.write_line(diff_line, commits[revision_1_blame.commit_index(diff_line.before_line_number)])
+                else:
+                    writer.write_line(diff_line)
+        details['rows'] = rows
+    profiler.count('rows', rows)
+
+
+def create_blame_function(repository: GitRepository, cache, registry: CommitRegistry, revision_1: str, revision_2: str,
+                          full_history: bool):
+    """
+    Create the function that blames a file diff of the revisions.
+
+    :param registry: the registry of the commits of the report, None not to blame
+    :return: the function, None if registry is None, and the settings that the blames depend on
+    """
+    if registry is None:
+        return None, 'diff'
+    commit_logs = CommitLogResolver(repository, cache)
+    commit_hash_1 = repository.resolve_commit(revision_1)
+    commit_hash_2 = repository.resolve_commit(revision_2)
+    boundary_commit = None if full_history else get_boundary_commit(repository, commit_logs, commit_hash_1, commit_hash_2)
+    blame_function = partial(blame_file_diff, repository, cache, registry, commit_hash_1, commit_hash_2, boundary_commit)
+    return blame_function, f'blame {boundary_commit.commit_hash if boundary_commit is not None else "full"}'
+
+
+def iter_file_blames(repository: GitRepository, manifest, registry: CommitRegistry, blame_function,
+                     revision_1: str, revision_2: str, paths: list[str], jobs: int, word_diff: bool = False,
+                     file_paths: list[list[str]] = None):
+    """
+    Yield the file diffs of the revisions and their blames in the order of git diff.
+
+    With word_diff, the files that both remove and add lines are diffed again word by word, a chunk of files at a time,
+    and the changed words of each file are set in the threads that blame the files.
+
+    :param manifest: the Manifest whose unchanged files are reused, None to diff and blame all the files
+    :param blame_function: the function that blames a file diff, None not to blame
+    :param word_diff: True to set the changed words of the removed and the added lines
+    :param file_paths: the paths of the only files to diff at both revisions, None to diff all the files under paths
+    :return: tuples of the file diff, the blame at revision_1 and the blame at revision_2, the blames are None when not blamed
+    """
+    if manifest is not None:
+        return iter_manifest_file_blames(repository, manifest, registry, blame_function, revision_1, revision_2, paths, jobs, word_diff,
+                                         file_paths)
+    if file_paths is None:
+        file_diffs = Diff.parse(repository.iter_diff(revision_1, revision_2, paths))
+    else:
+        file_diffs = iter_path_file_diffs(repository, revision_1, revision_2, file_paths)
+    if word_diff:
+        return ordered_map(partial(report_file_diff, blame_function), iter_file_word_diffs(repository, revision_1, revision_2, file_diffs), jobs)
+    if blame_function is not None:
+        return ordered_map(blame_function, file_diffs, jobs)
+    return ((file_diff, None, None) for file_diff in file_diffs)
+
+
+def report_file_diff(blame_function, item: tuple) -> tuple:
+    """
+    Set the changed words of a file diff from its word diff and blame it.
+
+    :param blame_function: the function that blames a file diff, None not to blame
+    :param item: the file diff and its word diff, None when the words are not set
+    :return: the file diff, the blame at revision_1 and the blame at revision_2, the blames are None when not blamed
+    """
+    file_diff, word_diff = item
+    if word_diff is not None:
+        with profiler.span('stage', 'word diff', path=file_diff.file_path):
+            file_diff.set_changed_words(word_diff)
+    if blame_function is None:
+        return file_diff, None, None
+    return blame_function(file_diff)
+
+
+def iter_manifest_file_blames(repository: GitRepository, manifest, registry: CommitRegistry, blame_function,
+                              revision_1: str, revision_2: str, paths: list[str], jobs: int, word_diff: bool = False,
+                              file_paths: list[list[str]] = None):
+    """
+    Yield the file diffs and their blames in the order of git diff, reusing the files of the previous report that are unchanged.
+
+    Only the changed files are diffed and blamed, and all the files are stored in the new manifest.
+    An entry that is not found in the diff of the changed files, like a rename that git pairs differently
+    when it sees only some of the files, is diffed again alone.
+
+    :param blame_function: the function that blames a file diff, None not to blame
+    :param word_diff: True to set the changed words of the changed files, the reused files have the ones stored in the manifest
+    :param file_paths: the paths of the only files to diff at both revisions, None to diff all the files under paths
+    :return: tuples of the file diff, the blame at revision_1 and the blame at revision_2
+    """
+    from pgdf.manifest import decode_file_reports, encode_file_reports
+    entries = RawDiffEntry.parse(repository.get_raw_diff(revision_1, revision_2, paths))
+    if file_paths is not None:
+        kept_paths = {path for paths in file_paths for path in paths}
+        entries = [entry for entry in entries if any(path in kept_paths for path in entry.paths)]
+    if blame_function is not None:
+        forget_rewritten_blames(repository, manifest, entries)
+    changed_entries = [entry for entry in entries if entry.key not in manifest]
+
+    def diff_entry(entry: RawDiffEntry) -> list:
+        profiler.count('files diffed again')
+        return list(iter_entry_file_diffs(repository, revision_1, revision_2, [entry], word_diff))
+
+    changed_file_diffs = match_file_diffs(changed_entries,
+                                          iter_entry_file_diffs(repository, revision_1, revision_2, changed_entries, word_diff),
+                                          diff_entry)
+
+    def get_file_reports(item):
+        key, value, file_diffs = item
+        if value is not None:
+            return key, value, decode_file_reports(value, registry)
+        return key, None, [report_file_diff(blame_function, file_diff_item) for file_diff_item in file_diffs]
+
+    def iter_items():
+        for entry in entries:
+            value = manifest.get(entry.key)
+            yield entry.key, value, None if value is not None else next(changed_file_diffs)
+
+    for key, value, file_reports in ordered_map(get_file_reports, iter_items(), jobs):
+        manifest.put(key, value if value is not None else encode_file_reports(file_reports, registry))
+        yield from file_reports
+
+
+def forget_rewritten_blames(repository: GitRepository, manifest, entries: list[RawDiffEntry]) -> None:
+    """
+    Stop reusing the blames of the previous report that may refer to commits that are not in the history any more.
+
+    When both revisions have only moved forward since the previous report, the blames of a file are the same
+    unless a commit since then changed it, so only the files changed by the new commits are blamed again.
+    When a revision has been rebased or amended, no file is reused.
+
+    :param manifest: the Manifest of the report, with the commit hashes of its revisions
+    :param entries: the entries of the files of the report
+    """
+    if not manifest.previous_keys:
+        return
+    if manifest.previous_commit_hashes is None:
+        manifest.forget()
+        return
+    touched_paths = []
+    for previous_commit_hash, commit_hash in zip(manifest.previous_commit_hashes, manifest.commit_hashes):
+        if previous_commit_hash == commit_hash:
+            touched_paths.append(set())
+        elif repository.is_ancestor(previous_commit_hash, commit_hash):
+            touched_paths.append(repository.get_touched_paths(previous_commit_hash, commit_hash))
+        else:
+            manifest.forget()
+            return
+    manifest.forget([entry.key for entry in entries if entry.before_path in touched_paths[0] or entry.after_path in touched_paths[1]])
+
+
+def iter_entry_file_diffs(repository: GitRepository, revision_1: str, revision_2: str, entries: list[RawDiffEntry],
+                          word_diff: bool = False):
+    """
+    Diff only the files of the entries, a limited number of files per git diff call.
+
+    :param word_diff: True to diff the modified files word by word too
+    :return: pairs of the file diff and its word diff, None when the words are not diffed
+    """
+    file_diffs = iter_path_file_diffs(repository, revision_1, revision_2, [entry.paths for entry in entries])
+    if word_diff:
+        return iter_file_word_diffs(repository, revision_1, revision_2, file_diffs)
+    return ((file_diff, None) for file_diff in file_diffs)
+
+
+def iter_path_file_diffs(repository: GitRepository, revision_1: str, revision_2: str, file_paths: list[list[str]]):
+    """
+    Diff only the files of the paths, a limited number of files per git diff call,
+    so that the command line stays short however many files there are.
+
+    :param file_paths: the paths of each file at both revisions
+    :return: the file diffs
+    """
+    for i in range(0, len(file_paths), PATHSPEC_CHUNK_SIZE):
+        pathspecs = [f':(literal){path}' for paths in file_paths[i:i + PATHSPEC_CHUNK_SIZE] for path in paths]
+        yield from Diff.parse(repository.iter_diff(revision_1, revision_2, pathspecs))
+
+
+def iter_file_word_diffs(repository: GitRepository, revision_1: str, revision_2: str, file_diffs):
+    """
+    Pair the file diffs with their files in git diff --word-diff=porcelain.
+
+    git prints the diff and the word diff in separate runs, so only the files that both remove and add lines,
+    which are the only ones that have changed words to show, are diffed again word by word.
+    The file diffs are read in chunks, and the modified files of a chunk are diffed in one call with their paths,
+    so the word diff costs a diff of the modified files rather than a second diff of the whole report.
+
+    :param file_diffs: the file diffs from Diff.parse
+    :return: pairs of the file diff and its word diff, None when the file is not diffed word by word
+    """
+    file_diffs = iter(file_diffs)
+    while True:
+        chunk = list(islice(file_diffs, WORD_DIFF_CHUNK_SIZE))
+        if not chunk:
+            return
+        paths = [path for file_diff in chunk if file_diff.has_replaced_lines for path in file_diff.paths]
+        word_diffs = {}
+        if paths:
+            pathspecs = [f':(literal){path}' for path in dict.fromkeys(paths)]
+            word_diffs = {word_diff.header: word_diff for word_diff in
+                          WordDiff.parse(repository.iter_word_diff(revision_1, revision_2, pathspecs))}
+        for file_diff in chunk:
+            yield file_diff, word_diffs.get(file_diff.header_lines[0])
+
+
+def match_file_diffs(entries: list[RawDiffEntry], file_diffs, diff_entry=None):
+    """
+    Yield the file diffs of each entry, a type change is diffed as the deletion and the addition of the file.
+
+    The file diffs are expected in the order of the entries,
+    and the ones that come earlier than expected are kept until their entries are reached.
+    When the file diffs do not cover both paths of an entry, the entry is diffed again with diff_entry.
+
+    >>> entries = RawDiffEntry.parse(':100644 100644 0ff3bbb d4de868 R094\\0r.txt\\0s.txt\\0:100644 100644 5f73e72 ba56eaf M\\0t.txt\\0')
+    >>> def parse(header: str, *lines: str):
+    ...     return FileDiff.parse(['diff --git ' + header] + list(lines)), None
+    >>> deleted = parse('a/r.txt b/r.txt', 'deleted file mode 100644', 'index 0ff3bbb..0000000', '--- a/r.txt', '+++ /dev/null')
+    >>> added = parse('a/s.txt b/s.txt', 'new file mode 100644', 'index 0000000..d4de868', '--- /dev/null', '+++ b/s.txt')
+    >>> renamed = parse('a/r.txt b/s.txt', 'similarity index 94%', 'rename from r.txt', 'rename to s.txt')
+    >>> modified = parse('a/t.txt b/t.txt', 'index 5f73e72..ba56eaf 100644', '--- a/t.txt', '+++ b/t.txt')
+    >>> [[(file_diff.status, file_diff.file_path) for file_diff, _ in matched]
+    ...  for matched in match_file_diffs(entries, [deleted, added, modified], lambda entry: [renamed])]
+    [[('R', 's.txt')], [('M', 't.txt')]]
+
+    :param entries: the entries of the files that are diffed
+    :param file_diffs: pairs of the file diff of the entries and its word diff
+    :param diff_entry: the function that diffs an entry alone, None to yield what is found
+    :return: the list of the pairs of each entry
+    """
+    file_diffs = iter(file_diffs)
+    early_file_diffs = {}
+    next_file_diff = None
+    for entry in entries:
+        file_path = entry.file_path
+        matched = early_file_diffs.pop(file_path, [])
+        while True:
+            if next_file_diff is None:
+                next_file_diff = next(file_diffs, None)
+                if next_file_diff is None:
+                    break
+            next_file_path = next_file_diff[0].file_path
+            if next_file_path == file_path:
+                matched.append(next_file_diff)
+            elif matched:
+                break
+            else:
+                early_file_diffs.setdefault(next_file_path, []).append(next_file_diff)
+            next_file_diff = None
+        if diff_entry is not None and not covers(entry, matched):
+            matched = diff_entry(entry)
+        yield matched
+
+
+def covers(entry: RawDiffEntry, file_diffs: list) -> bool:
+    """
+    Check if the file diffs have both paths of the entry, that is, if git diff paired the files in the same way as git diff --raw.
+
+    :param file_diffs: pairs of the file diff and its word diff
+    """
+    before_paths = {file_diff.before_path for file_diff, _ in file_diffs}
+    after_paths = {file_diff.after_path for file_diff, _ in file_diffs}
+    return ((entry.before_path is None or entry.before_path in before_paths)
+            and (entry.after_path is None or entry.after_path in after_paths))
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+SLOWEST_FILE_COUNT = 10
+"""The number of the slowest files shown in the table."""
+
+
+class Profiler:
+    """
+    Records the git commands and the stages of the reports as spans, and counts the subprocesses and the rows.
+
+    The spans of all the threads are recorded, and the spans of other processes can be merged,
+    so that a batch run is profiled as one trace.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        """Tuples of the category, the name, the start and the end in perf_counter seconds, the process id, the thread id and the args."""
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, category: str, name: str, start: float, end: float, args: dict = None) -> None:
+        event = (category, name, start, end, os.getpid(), threading.get_native_id(), args or {})
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, category: str, name: str, **args):
+        """
+        Record the time of the block as a span.
+
+        :param category: 'git' for the git commands, 'stage' for the stages of a report, 'blame' and 'write' for a file
+        :param name: the git command, the stage or the file path
+        :param args: the details of the span, the block can add more to the dict that it gets
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(category, name, start, time.perf_counter(), args)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def take(self) -> tuple:
+        """Return the recorded events and counters and clear them, to be merged in another process."""
+        with self._lock:
+            events, counters = self.events, self.counters
+            self.events, self.counters = [], Counter()
+        return events, counters
+
+    def merge(self, profile: tuple) -> None:
+        events, counters = profile
+        with self._lock:
+            self.events.extend(events)
+            self.counters.update(counters)
+
+    def table(self) -> str:
+        """
+        Format the totals of the stages and the git commands, the counters and the slowest files.
+
+        >>> profiler = Profiler()
+        >>> profiler.add('git', 'blame', 0.0, 1.5, {'bytes': 2048})
+        >>> profiler.add('blame', 'a.txt', 0.0, 1.5, {'hunks': 2, 'lines': 10})
+        >>> profiler.count('rows', 12)
+        >>> print(profiler.table())
+        Stage / git command              calls   seconds       KB read
+        git blame                            1     1.500             2
+        <BLANKLINE>
+        rows                                12
+        <BLANKLINE>
+        Slowest files                  seconds     hunks         lines
+        blame a.txt                      1.500         2            10
+
+        :return:
+        """
+        totals = {}
+        files = []
+        for category, name, start, end, pid, tid, args in self.events:
+            if category in ('blame', 'write'):
+                files.append((end - start, category, name, args))
+                continue
+            key = f'{category} {name}' if category in ('git', 'odb') else name
+            calls, seconds, size = totals.get(key, (0, 0.0, 0))
+            totals[key] = (calls + 1, seconds + end - start, size + args.get('bytes', 0))
+
+        lines = [f'{"Stage / git command":<30} {"calls":>7} {"seconds":>9} {"KB read":>13}']
+        for key, (calls, seconds, size) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{key:<30} {calls:7d} {seconds:9.3f} {(size + 1023) // 1024 if size else "":>13}')
+        if self.counters:
+            lines.append('')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'{name:<30} {value:7d}')
+        if files:
+            lines.append('')
+            lines.append(f'{"Slowest files":<30} {"seconds":>7} {"hunks":>9} {"lines":>13}')
+            for seconds, category, name, args in sorted(files, key=lambda file: -file[0])[:SLOWEST_FILE_COUNT]:
+                lines.append(f'{category + " " + name:<30} {seconds:7.3f} {args.get("hunks", ""):>9} {args.get("lines", ""):>13}')
+        return '\n'.join(lines)
+
+    def write_trace(self, path: str) -> None:
+        """Write the spans in the trace event format of Chrome, which chrome://tracing and Perfetto open."""
+        trace_events = []
+        for category, name, start, end, pid, tid, args in self.events:
+            trace_events.append({
+                'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': round((start - self.origin) * 1000000), 'dur': round((end - start) * 1000000), 'args': args,
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': dict(self.counters)}, f)
+
+
+_profiler = None
+"""The profiler of the process, None when profiling is disabled."""
+
+
+def enable() -> Profiler:
+    """Start profiling the process, the profiler is returned if it is already enabled."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def get_profiler():
+    """Return the profiler of the process, None when profiling is disabled."""
+    return _profiler
+
+
+def span(category: str, name: str, **args):
+    """Record the time of the block if profiling is enabled, see Profiler.span."""
+    if _profiler is None:
+        return nullcontext(args)
+    return _profiler.span(category, name, **args)
+
+
+def count(name: str, value: int = 1) -> None:
+    if _profiler is not None:
+        _profiler.count(name, value)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+
+from pgdf.cache import DEFAULT_MAX_SIZE, DEFAULT_MEMORY_SIZE, BlameCache, Cache, MemoryCache, default_cache_dir
+from pgdf.git import GitError, GitRepository
+from pgdf.main import default_output_file_path, generate_report
+
+
+SOCKET_NAME = 'pgdf.sock'
+"""The name of the socket in the git directory of the repository, where the server listens by default."""
+
+REPORT_OPTIONS = ('format', 'level', 'incremental', 'jobs', 'full_history', 'word_diff', 'include', 'exclude',
+                  'max_file_lines', 'max_blob_size', 'generated', 'max_rows', 'max_workbook_rows', 'max_workbook_files')
+"""The options of the command line that the client sends with a report, the others are the options of the server."""
+
+
+def default_socket_path(path: str = None) -> str:
+    """Return the default socket path of the repository, in its git directory."""
+    with GitRepository(path, object_store=False) as repository:
+        return os.path.abspath(os.path.join(path or '', repository.run(['rev-parse', '--git-path', SOCKET_NAME]).strip()))
+
+
+def send(socket_path: str, message: dict) -> dict:
+    """Send a request to the server and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f'The server at {socket_path} closed the connection.')
+    return json.loads(line)
+
+
+def request_report(socket_path: str, args: argparse.Namespace) -> dict:
+    """
+    Ask the server to generate the report of the command line arguments.
+
+    The paths and the output path are sent with the current directory, so they mean the same as in a local run.
+
+    :return: the response, with 'output_file_paths' or with 'error' and 'returncode'
+    """
+    return send(socket_path, {
+        'command': 'report',
+        'cwd': os.getcwd(),
+        'revision_1': args.revision_1,
+        'revision_2': args.revision_2,
+        'paths': args.path,
+        'output': args.output,
+        'options': {name: getattr(args, name) for name in REPORT_OPTIONS},
+    })
+
+
+class ReportServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Generates the reports of one repository for the clients, one thread per connection.
+
+    The repository with its git cat-file workers and its object store, and the cache, are kept for all the reports,
+    so a report pays neither for starting Python and git nor for reading the same commits and blames again.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, repository: GitRepository, cache: BlameCache, toplevel: str):
+        self.repository = repository
+        self.cache = cache
+        self.toplevel = toplevel
+        super().__init__(socket_path, ReportHandler)
+
+    def generate(self, request: dict) -> dict:
+        cwd = os.path.realpath(request['cwd'])
+        relative_path = os.path.relpath(cwd, self.toplevel)
+        if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+            return {'error': f'The server generates the reports of {self.toplevel}, not of {cwd}.', 'returncode': 1}
+        # the paths are relative to the directory of the client, and the repository of the server is at the top level
+        def resolve(path: str) -> str:
+            return path if path.startswith(':') or relative_path == os.curdir else os.path.normpath(os.path.join(relative_path, path))
+
+        paths = [resolve(path) for path in request['paths']]
+        args = argparse.Namespace(**request['options'])
+        # the include globs are matched against the paths from the top of the repository as they are
+        args.exclude = [resolve(pattern) for pattern in args.exclude or []]
+        output_file_path = os.path.join(cwd, request['output'] or default_output_file_path(request['revision_1'], request['revision_2']))
+        try:
+            output_file_paths = generate_report(
+                self.repository, self.cache, args, request['revision_1'], request['revision_2'], paths, output_file_path
+            )
+        except GitError as e:
+            return {'error': (e.stderr or str(e)).strip(), 'returncode': e.returncode}
+        except OSError as e:
+            return {'error': str(e), 'returncode': 1}
+        return {'output_file_paths': output_file_paths}
+
+
+class ReportHandler(socketserver.StreamRequestHandler):
+    """Reads a JSON request line and writes a JSON response line."""
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            command = request.get('command')
+            if command == 'report':
+                response = self.server.generate(request)
+            elif command == 'ping':
+                response = {'toplevel': self.server.toplevel, 'pid': os.getpid()}
+            elif command == 'stop':
+                response = {'stopped': True}
+            else:
+                response = {'error': f'Unknown command: {command}', 'returncode': 2}
+        except Exception as e:
+            traceback.print_exc()
+            response = {'error': f'{type(e).__name__}: {e}', 'returncode': 1}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        if response.get('stopped'):
+            # the request is handled in its own thread, so serve_forever() can be waited for here
+            self.server.shutdown()
+
+
+def is_listening(socket_path: str) -> bool:
+    try:
+        send(socket_path, {'command': 'ping'})
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='pgdf serve',
+        description='Serve the reports of the repository of the current directory over a Unix domain socket.\n'
+                    'The reports are requested with "pgdf --connect revision_1 revision_2 ...".',
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('--socket', help=f'The path of the socket (default: {SOCKET_NAME} in the git directory)')
+    parser.add_argument('--stop', action='store_true', help='Stop the server listening at the socket')
+    parser.add_argument('--no-cache', action='store_true', help='Keep the blames and the commit logs only in memory')
+    parser.add_argument('--cache-dir', help=f'The directory of the cache (default: {default_cache_dir()})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // 1024 // 1024,
+                        help='The size limit of the cache in megabytes (default: %(default)s)')
+    parser.add_argument('--memory-cache-size', type=int, default=DEFAULT_MEMORY_SIZE // 1024 // 1024,
+                        help='The size limit of the blames and the commit logs kept in memory in megabytes (default: %(default)s)')
+    parser.add_argument('--no-object-store', action='store_true',
+                        help='Read the commits and the blob sizes through git cat-file, instead of reading .git/objects in process')
+    return parser
+
+
+def is_server_command(argv: list[str]) -> bool:
+    """
+    Check if the command line of pgdf starts the server, that is 'serve' followed only by the options of the server.
+
+    'serve' followed by another revision is the diff of a revision named serve.
+
+    >>> is_server_command(['serve', '--socket', '/tmp/pgdf.sock'])
+    True
+    >>> is_server_command(['serve', 'main', '-f', 'csv'])
+    False
+    """
+    if argv[:1] != ['serve']:
+        return False
+    _, remaining = create_parser().parse_known_args(argv[1:])
+    return not remaining
+
+
+def main(argv: list[str] = None) -> None:
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        socket_path = args.socket or default_socket_path()
+    except GitError as e:
+        parser.error((e.stderr or str(e)).strip())
+
+    if args.stop:
+        try:
+            send(socket_path, {'command': 'stop'})
+        except (OSError, ValueError) as e:
+            parser.error(f'No server is listening at {socket_path}: {e}')
+        print(f'The server at {socket_path} was stopped.')
+        return
+
+    if os.path.exists(socket_path):
+        if is_listening(socket_path):
+            parser.error(f'A server is already listening at {socket_path}.')
+        os.remove(socket_path)
+
+    repository = GitRepository(object_store=not args.no_object_store)
+    toplevel = os.path.realpath(repository.run(['rev-parse', '--show-toplevel']).strip())
+    repository.close()
+    repository = GitRepository(toplevel, object_store=not args.no_object_store)
+    disk_cache = None
+    if not args.no_cache:
+        try:
+            disk_cache = Cache(args.cache_dir, args.cache_size * 1024 * 1024)
+        except OSError as e:
+            print(f'The cache is kept only in memory: {e}', file=sys.stderr)
+    cache = MemoryCache(disk_cache, args.memory_cache_size * 1024 * 1024)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = ReportServer(socket_path, repository, cache, toplevel)
+    finally:
+        os.umask(old_umask)
+
+    def stop(signal_number, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f'Serving the reports of {toplevel} at {socket_path}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        repository.close()
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
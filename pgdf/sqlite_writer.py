@@ -0,0 +1,191 @@
+import os
+import sqlite3
+
+from pgdf.writer import ReportWriter
+
+
+BATCH_SIZE = 10000
+"""The number of rows inserted by one executemany."""
+
+SCHEMA = '''
+CREATE TABLE report (title TEXT NOT NULL);
+CREATE TABLE summary (id INTEGER PRIMARY KEY, path TEXT, change TEXT, note TEXT);
+CREATE TABLE commits (
+    id INTEGER PRIMARY KEY, commit_hash TEXT NOT NULL, short_hash TEXT NOT NULL, boundary INTEGER NOT NULL,
+    author TEXT, datetime TEXT, subject TEXT
+);
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY, path TEXT, before_path TEXT, after_path TEXT, status TEXT,
+    old_mode TEXT, new_mode TEXT, before_blob TEXT, after_blob TEXT, binary INTEGER, header TEXT
+);
+CREATE TABLE hunks (
+    id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files (id),
+    before_line_number INTEGER, before_line_volume INTEGER, after_line_number INTEGER, after_line_volume INTEGER,
+    part_name TEXT
+);
+CREATE TABLE lines (
+    id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files (id), hunk_id INTEGER NOT NULL REFERENCES hunks (id),
+    kind TEXT, before_line_number INTEGER, after_line_number INTEGER, commit_id INTEGER REFERENCES commits (id), code TEXT
+);
+CREATE VIEW diff AS
+SELECT files.path, lines.kind, lines.before_line_number, lines.after_line_number,
+       commits.short_hash, commits.author, commits.datetime, commits.subject, lines.code, commits.commit_hash
+FROM lines
+JOIN files ON files.id = lines.file_id
+LEFT JOIN commits ON commits.id = lines.commit_id;
+'''
+
+INDEXES = '''
+CREATE INDEX files_path ON files (path);
+CREATE INDEX hunks_file_id ON hunks (file_id);
+CREATE INDEX lines_file_id ON lines (file_id);
+CREATE INDEX lines_commit_id ON lines (commit_id);
+CREATE UNIQUE INDEX commits_commit_hash ON commits (commit_hash);
+CREATE INDEX commits_author ON commits (author);
+'''
+
+
+class SqliteWriter(ReportWriter):
+    """
+    Write the report into a SQLite database with the files, hunks, lines and commits tables.
+
+    The rows are inserted in batches in one transaction, and the indexes are built after all the rows are inserted.
+    The diff view joins the tables into the rows of the Diff sheet.
+    The commits are numbered in the order that they are first written, not by their indexes in the CommitRegistry,
+    which depend on the order that the threads blame the files, so the database is the same whatever the jobs are.
+
+    >>> import shutil, subprocess, tempfile
+    >>> from pgdf.git import GitRepository
+    >>> from pgdf.main import write_report
+    >>> directory = tempfile.mkdtemp()
+    >>> def commit(message, files):
+    ...     for name, text in files.items():
+    ...         with open(os.path.join(directory, name), 'w') as f:
+    ...             _ = f.write(text)
+    ...     git = ['git', '-c', 'user.name=Kenji Otsuka', '-c', 'user.email=kenji@example.com', '-c', 'commit.gpgsign=false']
+    ...     _ = subprocess.run(git + ['add', '.'], cwd=directory, check=True)
+    ...     _ = subprocess.run(git + ['commit', '-q', '-m', message], cwd=directory, check=True)
+    >>> _ = subprocess.run(['git', 'init', '-q'], cwd=directory, check=True)
+    >>> commit('Add the files', {f'{i}.txt': 'a\\nb\\n' for i in range(8)})
+    >>> for i in range(8):
+    ...     commit(f'Change {i}.txt', {f'{i}.txt': f'a\\n{i}\\n'})
+    >>> def read_tables(jobs):
+    ...     path = os.path.join(directory, f'report-{jobs}.sqlite')
+    ...     with GitRepository(directory) as repository:
+    ...         _ = write_report(repository, SqliteWriter(path, 'Diff'), 'HEAD~8', 'HEAD', [], jobs, full_history=True)
+    ...     connection = sqlite3.connect(path)
+    ...     tables = [connection.execute(f'SELECT * FROM {table} ORDER BY id').fetchall() for table in ('commits', 'lines')]
+    ...     connection.close()
+    ...     return tables
+    >>> read_tables(1) == read_tables(4)
+    True
+    >>> [(commit_id, subject) for commit_id, _, _, _, _, _, subject in read_tables(4)[0][1:4]]
+    [(2, 'Change 0.txt'), (3, 'Change 1.txt'), (4, 'Change 2.txt')]
+    >>> shutil.rmtree(directory)
+    """
+
+    def __init__(self, output_file_path: str, title: str):
+        self.output_file_path = output_file_path
+        if os.path.exists(output_file_path):
+            os.remove(output_file_path)
+        self.connection = sqlite3.connect(output_file_path, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=OFF')
+        self.connection.execute('PRAGMA synchronous=OFF')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute('BEGIN')
+        self.connection.execute('INSERT INTO report (title) VALUES (?)', (title,))
+
+        self.commit_ids = {}
+        """The ids of the written commits by their CommitRecord, in the order that they are first written."""
+        self.file_id = 0
+        self.hunk_id = 0
+        self.summary_rows = []
+        self.commit_rows = []
+        self.file_rows = []
+        self.hunk_rows = []
+        self.line_rows = []
+
+    def write_file_summary(self, path: str, change: int, plus: int, minus: int) -> None:
+        self.summary_rows.append((path, str(change), '+' * plus + '-' * minus))
+
+    def write_binary_summary(self, path: str, before: str, after: str) -> None:
+        self.summary_rows.append((path, 'Bin', f'{before} -> {after} bytes'))
+
+    def write_omitted_summary(self, path: str, change: int) -> None:
+        self.summary_rows.append((path, str(change), f'omitted ({change} lines)'))
+
+    def write_summary_text(self, line: str) -> None:
+        self.summary_rows.append((line, None, None))
+
+    def write_file(self, file_diff) -> None:
+        self.file_id += 1
+        self.file_rows.append((
+            self.file_id, file_diff.file_path, file_diff.before_path, file_diff.after_path, file_diff.status,
+            file_diff.old_mode, file_diff.new_mode, file_diff.before_blob, file_diff.after_blob, int(file_diff.binary),
+            '\n'.join(file_diff.header_lines)
+        ))
+        if len(self.file_rows) >= BATCH_SIZE:
+            self._flush()
+
+    def write_hunk(self, hunk) -> None:
+        self.hunk_id += 1
+        self.hunk_rows.append((
+            self.hunk_id, self.file_id,
+            hunk.before_line_number, hunk.before_line_volume, hunk.after_line_number, hunk.after_line_volume,
+            hunk.part_name
+        ))
+
+    def write_line(self, diff_line, commit=None) -> None:
+        commit_id = None
+        if commit is not None:
+            commit_id = self.commit_ids.get(commit)
+            if commit_id is None:
+                commit_id = self.commit_ids[commit] = len(self.commit_ids) + 1
+                self.commit_rows.append((
+                    commit_id, commit.commit_hash, commit.short_hash, int(commit.short_hash.startswith('^')),
+                    commit.author, commit.datetime, commit.subject
+                ))
+        self.line_rows.append((
+            self.file_id, self.hunk_id, diff_line.kind, diff_line.before_line_number, diff_line.after_line_number,
+            commit_id, diff_line.line
+        ))
+        if len(self.line_rows) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        execute_many = self.connection.executemany
+        if self.summary_rows:
+            execute_many('INSERT INTO summary (path, change, note) VALUES (?, ?, ?)', self.summary_rows)
+        if self.commit_rows:
+            execute_many(
+                'INSERT INTO commits (id, commit_hash, short_hash, boundary, author, datetime, subject) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                self.commit_rows
+            )
+        if self.file_rows:
+            execute_many(
+                'INSERT INTO files (id, path, before_path, after_path, status, old_mode, new_mode, before_blob, after_blob, binary, header)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.file_rows
+            )
+        if self.hunk_rows:
+            execute_many(
+                'INSERT INTO hunks (id, file_id, before_line_number, before_line_volume, after_line_number, after_line_volume, part_name)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)', self.hunk_rows
+            )
+        if self.line_rows:
+            execute_many(
+                'INSERT INTO lines (file_id, hunk_id, kind, before_line_number, after_line_number, commit_id, code)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)', self.line_rows
+            )
+        self.summary_rows = []
+        self.commit_rows = []
+        self.file_rows = []
+        self.hunk_rows = []
+        self.line_rows = []
+
+    def close(self) -> list[str]:
+        self._flush()
+        self.connection.execute('COMMIT')
+        self.connection.executescript(INDEXES)
+        self.connection.execute('ANALYZE')
+        self.connection.close()
+        return [self.output_file_path]
@@ -1,89 +1,271 @@
-import re
+from pgdf.git import GitRepository
+
+
+GRAPH_WIDTH = 50
+"""The width of the +/- graph of the largest change, as git diff --stat draws it."""
+
+
+def format_rename(before_path: str, after_path: str) -> str:
+    """
+    Format a renamed path like git diff --stat, with the common directories outside the braces.
+
+    >>> format_rename('pgdf/old.py', 'pgdf/new.py')
+    'pgdf/{old.py => new.py}'
+    >>> format_rename('src/a/main.py', 'src/b/main.py')
+    'src/{a => b}/main.py'
+    >>> format_rename('old.py', 'new.py')
+    'old.py => new.py'
+
+    :param before_path:
+    :param after_path:
+    :return:
+    """
+    prefix_length = 0
+    for i, (a, b) in enumerate(zip(before_path, after_path)):
+        if a != b:
+            break
+        if a == '/':
+            prefix_length = i + 1
+    suffix_length = 0
+    for i, (a, b) in enumerate(zip(reversed(before_path), reversed(after_path))):
+        if a != b:
+            break
+        if a == '/':
+            suffix_length = i + 1
+    # the prefix and the suffix must not overlap in the shorter path
+    suffix_length = min(suffix_length, max(0, min(len(before_path), len(after_path)) - prefix_length))
+    if prefix_length == 0 and suffix_length == 0:
+        return f'{before_path} => {after_path}'
+    before_middle = before_path[prefix_length:len(before_path) - suffix_length]
+    after_middle = after_path[prefix_length:len(after_path) - suffix_length]
+    return f'{before_path[:prefix_length]}{{{before_middle} => {after_middle}}}{before_path[len(before_path) - suffix_length:]}'
 
 
 class FileSummary:
-    def __init__(self, file_path, change_count, add_count, delete_count):
-        self.file_path = file_path
-        self.change_count = change_count
-        self.add_count = add_count
-        self.delete_count = delete_count
-        print(add_count, delete_count)
+    """The exact numbers of the changed lines of a file, or the sizes of a binary file, counted from the diff."""
 
-    @staticmethod
-    def parse(line):
+    __slots__ = ('file_path', 'insertions', 'deletions', 'binary', 'before_size', 'after_size', 'before_path', 'after_path', 'omitted')
+
+    def __init__(self, file_path: str, insertions: int = 0, deletions: int = 0,
+                 binary: bool = False, before_size: int = 0, after_size: int = 0,
+                 before_path: str = None, after_path: str = None):
         """
-        Parse the line and return FileSummary object.
 
-        >>> fs = FileSummary.parse(' src/pgdf/main.py |  2 +-')
-        >>> (fs.file_path, fs.change_count, fs.add_count, fs.delete_count)
-        ('src/pgdf/main.py', 2, 1, 1)
+        :param file_path: the path shown in the summary, like 'dir/{old => new}' for a renamed file
+        :param before_path: the path in the first revision, None if the file does not exist there
+        :param after_path: the path in the second revision, None if the file does not exist there
+        """
+        self.file_path = file_path
+        self.insertions = insertions
+        self.deletions = deletions
+        self.binary = binary
+        self.before_size = before_size
+        self.after_size = after_size
+        self.before_path = before_path
+        self.after_path = after_path
+        self.omitted = False
+        """True when the file is over the limits of the report, and its diff is not written."""
 
-        >>> fs = FileSummary.parse(' src/pgdf/sub.py |  6 ++++--')
-        >>> (fs.file_path, fs.change_count, fs.add_count, fs.delete_count)
-        ('src/pgdf/sub.py', 6, 4, 2)
+    @property
+    def change_count(self) -> int:
+        return self.insertions + self.deletions
 
-        >>> fs = FileSummary.parse(' src/common/dw_service.ts                                   | 78 +++++++++++++++++++++++++++++++++++++++++++++++++++++-------------------------')
-        >>> (fs.file_path, fs.change_count, fs.add_count, fs.delete_count)
-        ('src/common/dw_service.ts', 78, 53, 25)
+    @property
+    def paths(self) -> list[str]:
+        """The distinct paths of both revisions."""
+        return list(dict.fromkeys(path for path in (self.before_path, self.after_path) if path is not None))
 
-        :param line:
-        :return:
-        """
-        print(line)
-        m = re.match(r'^\s*(?P<file_path>.+?)\s+\|\s+(?P<change_count>\d+)\s(?P<change_note>[-+]*)\s*$', line)
-        if m:
-            file_path = m.group('file_path')
-            change_count = int(m.group('change_count'))
-            change_note = m.group('change_note')
-            add_count = change_note.count('+')
-            delete_count = change_note.count('-')
-            print(add_count, delete_count, change_note)
-            return FileSummary(file_path, change_count, add_count, delete_count)
-        return None
+    @staticmethod
+    def from_file_diff(file_diff) -> 'FileSummary':
+        if file_diff.status in ('R', 'C') and file_diff.before_path != file_diff.after_path:
+            file_path = format_rename(file_diff.before_path, file_diff.after_path)
+        else:
+            file_path = file_diff.file_path
+        return FileSummary(file_path, file_diff.insertions, file_diff.deletions, file_diff.binary,
+                           before_path=file_diff.before_path, after_path=file_diff.after_path)
 
     def __str__(self):
-        return ' {} | {} {}{}'.format(self.file_path, self.change_count, '+' * self.add_count, '-' * self.delete_count)
+        if self.omitted:
+            return f' {self.file_path} | omitted ({self.change_count} lines)'
+        if self.binary:
+            return f' {self.file_path} | Bin {self.before_size} -> {self.after_size} bytes'
+        return ' {} | {} {}{}'.format(self.file_path, self.change_count, '+' * self.insertions, '-' * self.deletions)
 
 
 class Summary:
+    """The file summaries of a diff, in the order of git diff, and their totals."""
+
     def __init__(self):
         self.file_summaries = []
+        self.insertions = 0
+        self.deletions = 0
+        self.max_change_count = 0
 
     def append(self, file_summary: FileSummary):
         self.file_summaries.append(file_summary)
+        self.insertions += file_summary.insertions
+        self.deletions += file_summary.deletions
+        if not file_summary.omitted:
+            self.max_change_count = max(self.max_change_count, file_summary.change_count)
 
-    @staticmethod
-    def parse(text):
+    def omit(self, file_summary: FileSummary) -> None:
         """
-        Parse the text and return Summary object.
+        Mark a file summary as omitted, its lines are still counted in the totals but not in the scale of the graph.
 
-        >>> s = Summary.parse(' 1 file changed, 2 insertions(+), 1 deletion(-)')
-        >>> (s.file_summaries[0].file_path, s.file_summaries[0].change_count, s.file_summaries[0].add_count, s.file_summaries[0].delete_count)
-        ('1 file changed', 2, 2, 1)
+        >>> s = Summary()
+        >>> s.append(FileSummary('package-lock.json', 30000, 20000))
+        >>> s.append(FileSummary('a.py', 2, 1))
+        >>> s.omit(s.file_summaries[0])
+        >>> (s.max_change_count, s.graph(s.file_summaries[1]), str(s.file_summaries[0]))
+        (3, (2, 1), ' package-lock.json | omitted (50000 lines)')
+        """
+        file_summary.omitted = True
+        self.max_change_count = max((fs.change_count for fs in self.file_summaries if not fs.omitted), default=0)
 
-        >>> s = Summary.parse(' 2 files changed, 6 insertions(+), 2 deletions(-)')
-        >>> (s.file_summaries[0].file_path, s.file_summaries[0].change_count, s.file_summaries[0].add_count, s.file_summaries[0].delete_count)
-        ('2 files changed', 8, 6, 2)
+    def remove(self, file_summaries: list[FileSummary]) -> None:
+        """
+        Remove the file summaries with their lines from the totals.
+
+        >>> s = Summary()
+        >>> s.append(FileSummary('a.py', 2, 1))
+        >>> s.append(FileSummary('b.js', 30, 20))
+        >>> s.remove([s.file_summaries[1]])
+        >>> ([fs.file_path for fs in s.file_summaries], s.insertions, s.deletions, s.max_change_count)
+        (['a.py'], 2, 1, 3)
+        """
+        removed = set(map(id, file_summaries))
+        kept = [file_summary for file_summary in self.file_summaries if id(file_summary) not in removed]
+        self.file_summaries = []
+        self.insertions = self.deletions = self.max_change_count = 0
+        for file_summary in kept:
+            self.append(file_summary)
+
+    @staticmethod
+    def parse_numstat(text: str) -> 'Summary':
+        """
+        Parse the output of git diff --numstat -z.
+
+        >>> s = Summary.parse_numstat('3\\t1\\tpgdf/main.py\\x00-\\t-\\timage.png\\x002\\t0\\t\\x00pgdf/old.py\\x00pgdf/new.py\\x00')
+        >>> [(fs.file_path, fs.insertions, fs.deletions, fs.binary, fs.before_path, fs.after_path) for fs in s.file_summaries]  # doctest: +NORMALIZE_WHITESPACE
+        [('pgdf/main.py', 3, 1, False, 'pgdf/main.py', 'pgdf/main.py'),
+         ('image.png', 0, 0, True, 'image.png', 'image.png'),
+         ('pgdf/{old.py => new.py}', 2, 0, False, 'pgdf/old.py', 'pgdf/new.py')]
+        >>> Summary.parse_numstat('').file_summaries
+        []
 
         :param text:
         :return:
         """
-        s = Summary()
-        lines = text.splitlines()
-        line_count = len(lines)
-        added_line_count = 0
-        for line in lines:
-            fs = FileSummary.parse(line)
-            if fs:
-                s.file_summaries.append(fs)
-                added_line_count += 1
-        assert line_count == added_line_count + 1, 'Something went wrong - line count: {}, added line count: {}'.format(line_count, added_line_count)
-        return s
+        summary = Summary()
+        fields = text.split('\0')
+        i = 0
+        while i < len(fields) and fields[i]:
+            insertions, deletions, path = fields[i].split('\t', 2)
+            i += 1
+            if path:
+                before_path = after_path = file_path = path
+            else:
+                before_path, after_path = fields[i], fields[i + 1]
+                file_path = format_rename(before_path, after_path)
+                i += 2
+            binary = insertions == '-'
+            summary.append(FileSummary(
+                file_path, 0 if binary else int(insertions), 0 if binary else int(deletions), binary,
+                before_path=before_path, after_path=after_path
+            ))
+        return summary
+
+    def graph(self, file_summary: FileSummary, width: int = GRAPH_WIDTH) -> tuple[int, int]:
+        """
+        Scale the numbers of the inserted and the deleted lines to the lengths of the +/- graph, as git diff --stat does.
+
+        >>> s = Summary()
+        >>> s.append(FileSummary('a.py', 300, 100))
+        >>> s.append(FileSummary('b.py', 2, 1))
+        >>> [s.graph(fs) for fs in s.file_summaries]
+        [(37, 13), (1, 1)]
+
+        :param file_summary:
+        :param width:
+        :return: the number of '+' and the number of '-'
+        """
+        if self.max_change_count <= width:
+            return file_summary.insertions, file_summary.deletions
+
+        def scale(count):
+            return 0 if count == 0 else 1 + count * (width - 1) // self.max_change_count
+
+        insertions, deletions = file_summary.insertions, file_summary.deletions
+        total = scale(insertions + deletions)
+        if insertions < deletions:
+            plus = scale(insertions)
+            minus = total - plus
+        else:
+            minus = scale(deletions)
+            plus = total - minus
+        # unlike git, keep a mark for each side that has any change
+        return max(plus, 1 if insertions else 0), max(minus, 1 if deletions else 0)
+
+    def totals_line(self) -> str:
+        """
+        Return the last line of git diff --stat.
+
+        >>> s = Summary()
+        >>> s.append(FileSummary('a.py', 2, 1))
+        >>> s.totals_line()
+        ' 1 file changed, 2 insertions(+), 1 deletion(-)'
+        >>> s.append(FileSummary('b.png', binary=True, before_size=10, after_size=20))
+        >>> s.totals_line()
+        ' 2 files changed, 2 insertions(+), 1 deletion(-)'
+
+        :return:
+        """
+        file_count = len(self.file_summaries)
+        parts = [f' {file_count} file{"" if file_count == 1 else "s"} changed']
+        if self.insertions or not self.deletions:
+            parts.append(f'{self.insertions} insertion{"" if self.insertions == 1 else "s"}(+)')
+        if self.deletions or not self.insertions:
+            parts.append(f'{self.deletions} deletion{"" if self.deletions == 1 else "s"}(-)')
+        return ', '.join(parts)
 
     def __str__(self):
-        result = ''
-        max_length_of_file_path = max([len(fs.file_path) for fs in self.file_summaries])
-        max_length_of_change = max([len(str(fs.change_count)) for fs in self.file_summaries])
-        for fs in self.file_summaries:
-            result += f' {{:<{max_length_of_file_path}}} | {{:<{max_length_of_change}}} {{}} {{}}'.format(fs.file_path, str(fs.change_count), '+' * fs.add_count, '-' * fs.delete_count) + '\n'
-        return result
+        return '\n'.join([str(fs) for fs in self.file_summaries] + [self.totals_line()])
+
+
+def set_binary_sizes(repository: GitRepository, revision_1: str, revision_2: str, file_summaries: list[FileSummary]) -> None:
+    """Set the sizes of the binary files at both revisions."""
+    set_blob_sizes(repository, revision_1, revision_2, [file_summary for file_summary in file_summaries if file_summary.binary])
+
+
+def set_blob_sizes(repository: GitRepository, revision_1: str, revision_2: str, file_summaries: list[FileSummary]) -> None:
+    """
+    Set the sizes of the files at both revisions, all the blobs are checked in one git cat-file --batch-check call.
+
+    A file that does not exist at a revision has the size 0 there.
+    """
+    names = []
+    if not file_summaries:
+        return
+    # '<commit hash>:<path>' can be read from the object store in process
+    revision_1 = repository.resolve_commit(revision_1)
+    revision_2 = repository.resolve_commit(revision_2)
+    for file_summary in file_summaries:
+        if file_summary.before_path is not None:
+            names.append(f'{revision_1}:{file_summary.before_path}')
+        if file_summary.after_path is not None:
+            names.append(f'{revision_2}:{file_summary.after_path}')
+    if not names:
+        return
+    sizes = iter(repository.check_objects(names))
+    for file_summary in file_summaries:
+        if file_summary.before_path is not None:
+            found = next(sizes)
+            file_summary.before_size = found[2] if found else 0
+        if file_summary.after_path is not None:
+            found = next(sizes)
+            file_summary.after_size = found[2] if found else 0
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
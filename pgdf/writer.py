@@ -0,0 +1,91 @@
+from enum import Enum
+
+
+class OutputFormat(Enum):
+    EXCEL = 'excel'
+    CSV = 'csv'
+    TSV = 'tsv'
+    SQLITE = 'sqlite'
+
+
+class ReportLevel(Enum):
+    """How much of the report is written, each level skips the stages of the levels above it."""
+    SUMMARY = 'summary'
+    """Only the Summary, from git diff --numstat."""
+    DIFF = 'diff'
+    """The Summary and the Diff without the blames."""
+    BLAME = 'blame'
+    """The Summary and the Diff with the blames of the added and the removed lines."""
+
+
+class ReportWriter:
+    """
+    Base class of the report writers.
+
+    The Diff is written file by file, in the order of git diff, and then the Summary.
+    """
+
+    def write_file_summary(self, path: str, change: int, plus: int, minus: int) -> None:
+        raise NotImplementedError()
+
+    def write_binary_summary(self, path: str, before: str, after: str) -> None:
+        raise NotImplementedError()
+
+    def write_omitted_summary(self, path: str, change: int) -> None:
+        """Write the summary of a file that is over the limits of the report, whose diff is not written."""
+        raise NotImplementedError()
+
+    def write_summary_text(self, line: str) -> None:
+        raise NotImplementedError()
+
+    def write_file(self, file_diff) -> None:
+        """Write the header lines of a file diff."""
+        raise NotImplementedError()
+
+    def write_hunk(self, hunk) -> None:
+        """Write the header of a hunk."""
+        raise NotImplementedError()
+
+    def write_line(self, diff_line, commit=None) -> None:
+        """
+        Write a line of a hunk.
+
+        :param diff_line:
+        :param commit: the CommitRecord that an added or a removed line is blamed on, None for the other lines.
+        """
+        raise NotImplementedError()
+
+    def close(self) -> list[str]:
+        """
+        Finish the report.
+
+        :return: the paths of the written files
+        """
+        raise NotImplementedError()
+
+
+def create_writer(output_format: OutputFormat, output_file_path: str, title: str, **options) -> ReportWriter:
+    """
+    Create the writer of the output format.
+
+    The writer modules are imported here, so that the formats that are not used cost nothing.
+
+    :param output_format:
+    :param output_file_path: the output file path without the extension
+    :param title: the title of the report
+    :param options: the options of the writer
+    :return:
+    """
+    if output_format == OutputFormat.EXCEL:
+        from pgdf.excel import ExcelWriter
+        return ExcelWriter(output_file_path + '.xlsx', title, **options)
+    if output_format == OutputFormat.CSV:
+        from pgdf.csv_writer import CsvWriter
+        return CsvWriter(output_file_path + '.csv', output_file_path + '.summary.csv', ',')
+    if output_format == OutputFormat.TSV:
+        from pgdf.csv_writer import CsvWriter
+        return CsvWriter(output_file_path + '.tsv', output_file_path + '.summary.tsv', '\t')
+    if output_format == OutputFormat.SQLITE:
+        from pgdf.sqlite_writer import SqliteWriter
+        return SqliteWriter(output_file_path + '.sqlite', title)
+    raise ValueError(f'Unknown output format: {output_format}')
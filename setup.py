@@ -25,7 +25,7 @@ setup(
         'xlsxwriter',
     ],
     entry_points={
-        'console_scripts': ['pgdf=pgdf.main:main'],
+        'console_scripts': ['pgdf=pgdf.main:main', 'pgdf-serve=pgdf.server:main'],
     },
     license='MIT',
     author='Kenji Otsuka',